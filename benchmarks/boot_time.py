@@ -0,0 +1,206 @@
+# --------------------------------------------------
+# boot time of door_management: import time of the modules
+# loaded before the first motor command and of the ones
+# loaded after it (python -X importtime), then the time
+# from the start of door_management.py to its first motor
+# command, without and with the cached ephemeris file.
+# Without gpiozero the door is the headless simulator, on
+# a Raspberry Pi the motor runs like at each start
+#
+# python -m benchmarks.boot_time [-n 15] [-c chicken.json]
+# --------------------------------------------------
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from elements.gpio_trace import MOTOR_COMMAND
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# modules imported by door_management after the first motor command
+DEFERRED_MODULES = ('elements.email_sender', 'elements.notifier', 'elements.temperature', 'elements.http_server',
+                    'elements.async_http_server', 'elements.watchdog')
+# written between the two parts of the profile
+MARKER = '-- first motor command'
+# position and motor of the door started, like chicken.json
+DEFAULT_CONFIGURATION = {'motor_forward_gpio': 9, 'motor_backward_gpio': 25,
+                         'longitude': "2.294270", 'latitude': "48.858823"}
+COMMAND_TIMEOUT = 120
+POLL_PERIOD = 0.001
+
+
+def _environment() -> dict:
+    # the headless simulator, when gpiozero is not installed
+    return dict(os.environ, DOOR_SIMULATOR=os.environ.get('DOOR_SIMULATOR', 'headless'))
+
+
+def _parse_importtime(lines) -> list:
+    modules = []
+    for line in lines:
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules.append({'module': name.strip(), 'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+                        'self': int(own) / 1e6, 'cumulative': int(cumulative) / 1e6})
+    return modules
+
+
+def import_profile() -> dict:
+    """import time of door_management, and of the modules it imports after the first motor command
+
+    Returns:
+        dict: 'boot' and 'deferred': total seconds and modules (module, depth, self and cumulative seconds),
+              'failed': deferred modules which can't be imported here
+    """
+    code = '\n'.join(['import sys', 'import door_management', f'sys.stderr.write({MARKER!r} + "\\n")',
+                      'failed = []',
+                      f'for name in {DEFERRED_MODULES!r}:',
+                      '    try:',
+                      '        __import__(name)',
+                      '    except ImportError as e:',
+                      '        failed.append(f"{name}: {e}")',
+                      'print("\\n".join(failed))'])
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                            cwd=ROOT, env=_environment(), timeout=COMMAND_TIMEOUT)
+    if MARKER not in result.stderr:
+        raise RuntimeError(f"can't import door_management: {result.stderr.strip().splitlines()[-1:]}")
+    boot, deferred = result.stderr.split(MARKER, 1)
+    profile = {'failed': [line for line in result.stdout.splitlines() if line]}
+    for name, lines in (('boot', boot), ('deferred', deferred)):
+        modules = _parse_importtime(lines.splitlines())
+        profile[name] = {'seconds': sum(module['cumulative'] for module in modules if module['depth'] == 0),
+                         'modules': modules}
+    return profile
+
+
+def _has_command(path) -> bool:
+    # the trace file is written one line at a time
+    try:
+        with open(path, 'r') as trace:
+            return any(f'"{MOTOR_COMMAND}"' in line and not line.startswith('{') for line in trace)
+    except OSError:
+        return False
+
+
+def _boot_time_logged(path):
+    try:
+        with open(path, 'r') as log:
+            for line in log:
+                if 'door managed' in line:
+                    return float(line.rsplit('door managed', 1)[1].split()[0])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _wait_boot(trace_file, log_file, process, start) -> tuple:
+    # door_management logs its boot time once the first command is executed,
+    # after the motor command is in the trace (if the motor was started)
+    first_command = None
+    logged = None
+    deadline = time.monotonic() + COMMAND_TIMEOUT
+    while logged is None and process.poll() is None and time.monotonic() < deadline:
+        if first_command is None and _has_command(trace_file):
+            first_command = time.monotonic() - start
+        logged = _boot_time_logged(log_file)
+        if logged is None:
+            time.sleep(POLL_PERIOD)
+    if first_command is None and _has_command(trace_file):
+        first_command = time.monotonic() - start
+    return first_command, logged
+
+
+def boot(configuration, directory) -> dict:
+    """start door_management until its first motor command
+
+    Args:
+        configuration (dict): configuration of the door, its files are replaced by files of directory
+        directory (str): current directory of door_management, the cached ephemeris file is kept there
+
+    Returns:
+        dict: seconds from the start to the first motor command, seen from outside (None if there was none)
+              and logged by door_management (interpreter start included)
+    """
+    configuration = dict(configuration, log_level='info', log_async=False,
+                         log_file=os.path.join(directory, 'door.log'),
+                         gpio_trace_file=os.path.join(directory, 'trace.jsonl'),
+                         ephemeris_file=os.path.join(directory, 'ephemeris.bin'),
+                         journal_file=os.path.join(directory, 'journal.bin'),
+                         flight_recorder_file=os.path.join(directory, 'flight_recorder.txt'))
+    configuration_file = os.path.join(directory, 'chicken.json')
+    with open(configuration_file, 'w') as file:
+        json.dump(configuration, file)
+    for name in ('trace.jsonl', 'door.log'):
+        if os.path.exists(os.path.join(directory, name)):
+            os.remove(os.path.join(directory, name))
+
+    start = time.monotonic()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'door_management.py'), '-c', configuration_file],
+                               cwd=directory, env=_environment(),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        first_command, logged = _wait_boot(configuration['gpio_trace_file'], configuration['log_file'], process,
+                                           start)
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(COMMAND_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    return {'first_command': first_command, 'logged': logged}
+
+
+def run(configuration=None) -> dict:
+    """import profile, and boot time without then with the cached ephemeris file
+
+    Returns:
+        dict: 'imports' (see import_profile), 'cold' and 'cached' (see boot)
+    """
+    configuration = configuration or DEFAULT_CONFIGURATION
+    with tempfile.TemporaryDirectory() as directory:
+        return {'imports': import_profile(),
+                # the first start computes the ephemeris file, the second one reads it
+                'cold': boot(configuration, directory),
+                'cached': boot(configuration, directory)}
+
+
+def _print_modules(title, part, count):
+    print(f"{title}: {part['seconds'] * 1e3:.1f} ms (own time, with its imports)")
+    for module in sorted(part['modules'], key=lambda found: found['self'], reverse=True)[:count]:
+        print(f"    {module['self'] * 1e3:7.2f} ms  {module['cumulative'] * 1e3:7.2f} ms  {module['module']}")
+
+
+def _format_seconds(seconds) -> str:
+    return 'none' if seconds is None else f'{seconds:.2f} s'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--modules', type=int, default=15, help=u'slowest modules shown, by own time')
+    parser.add_argument('-c', '--config', help=u'configuration file, default is a motor without sensor',
+                        required=False)
+    parser.add_argument('-o', '--output', help=u'JSON file of the results', required=False)
+    parameters = parser.parse_args()
+
+    door_configuration = None
+    if parameters.config:
+        with open(parameters.config, 'r') as f:
+            door_configuration = json.loads(f.read())
+    result = run(door_configuration)
+    if parameters.output:
+        with open(parameters.output, 'w') as output:
+            json.dump(result, output, indent=2)
+
+    _print_modules("imports before the first motor command", result['imports']['boot'], parameters.modules)
+    _print_modules("imports after it", result['imports']['deferred'], parameters.modules)
+    for failure in result['imports']['failed']:
+        print(f"    not imported, {failure}")
+    for name in ('cold', 'cached'):
+        print(f"first motor command, {'computed' if name == 'cold' else 'cached'} ephemeris: "
+              f"{_format_seconds(result[name]['first_command'])} "
+              f"(logged by door_management, interpreter start included: {_format_seconds(result[name]['logged'])})")
@@ -0,0 +1,80 @@
+# --------------------------------------------------
+# compare the per call ephem computation, used before by
+# AutomaticControl, with the precomputed EphemerisCache
+#
+# python -m benchmarks.ephemeris [-n 1000]
+# --------------------------------------------------
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import ephem
+
+from elements.ephemeris_cache import EphemerisCache
+
+LATITUDE = "48.858823"
+LONGITUDE = "2.294270"
+
+
+def per_call(now):
+    observer = ephem.Observer()
+    observer.lat, observer.lon = LATITUDE, LONGITUDE
+    observer.date = ephem.Date(datetime.fromtimestamp(now, timezone.utc))
+    setting = observer.next_setting(ephem.Sun())
+    rising = observer.next_rising(ephem.Sun())
+    return rising, setting
+
+
+def measure(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations
+
+
+def run(iterations=1000):
+    """run the benchmark
+
+    Args:
+        iterations (int, optional): number of lookups measured. Defaults to 1000.
+
+    Returns:
+        dict: duration in seconds of each measure
+    """
+    now = time.time()
+    results = {'per_call': measure(lambda: per_call(now), iterations)}
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ephemeris.bin')
+
+        # boot without file: one bulk pass then save
+        start = time.perf_counter()
+        cache = EphemerisCache(LATITUDE, LONGITUDE, path)
+        cache.next_rising(now)
+        results['cold_start'] = time.perf_counter() - start
+
+        # boot with file
+        start = time.perf_counter()
+        cache = EphemerisCache(LATITUDE, LONGITUDE, path)
+        cache.next_rising(now)
+        results['warm_start'] = time.perf_counter() - start
+        results['file_size'] = os.path.getsize(path)
+
+        results['lookup'] = measure(lambda: (cache.next_rising(now), cache.next_setting(now)), iterations)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--iterations', type=int, default=1000, help=u'number of lookups')
+    parameters = parser.parse_args()
+
+    result = run(parameters.iterations)
+    print(f"per call ephem   : {result['per_call'] * 1e6:10.1f} us")
+    print(f"cache lookup     : {result['lookup'] * 1e6:10.1f} us")
+    print(f"cold start       : {result['cold_start'] * 1e3:10.1f} ms")
+    print(f"warm start       : {result['warm_start'] * 1e3:10.1f} ms")
+    print(f"file size        : {result['file_size']:10d} bytes")
@@ -0,0 +1,407 @@
+# --------------------------------------------------
+# load and soak test of the http command API: clients
+# send a mix of requests (commands, bad token, malformed
+# body) during a time, with or without keep-alive, like a
+# home automation integration which floods the door.
+# The server runs in its own process with simulated motors
+# (headless), so its RSS, threads and file descriptors read
+# in /proc are only its own: they must come back after the
+# load, else something leaks. A running door_management can
+# be the target too, with --port, --token and --pid
+#
+# python -m benchmarks.http_load [-c 8] [-d 60] [-m up=4,down=4,bad_token=1,malformed=1]
+#                                [--no-keep-alive] [--async] [-i 5] [-o report.json]
+# --------------------------------------------------
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import random
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+# the headless simulator, when gpiozero is not installed. Set before elements are imported
+os.environ.setdefault('DOOR_SIMULATOR', 'headless')
+
+from simulator.headless import door, DEFAULT_TRAVEL_TIME
+from elements.advanced_elements import AdvancedMotor, MotorCommandQueue
+from elements.http_server import ApiHttpServer
+from elements.async_http_server import AsyncApiHttpServer
+
+DEFAULT_PORT = 54500
+DEFAULT_CONCURRENCY = 8
+DEFAULT_DURATION = 30
+# seconds between two samples of the server
+DEFAULT_INTERVAL = 5
+# time given to the server to end its requests before the last sample, in seconds
+SETTLE_TIME = 1
+CONNECTION_TIMEOUT = 10
+# GPIO numbers of the simulated elements, like chicken.json
+FORWARD_GPIO = 9
+BACKWARD_GPIO = 25
+CLOSE_SENSOR_GPIO = 7
+OPEN_SENSOR_GPIO = 5
+
+# requests of the mix: (body, good token, expected status)
+REQUESTS = {'up': (b'action=up', True, 200),
+            'down': (b'action=down', True, 200),
+            'force_up': (b'action=force_up', True, 200),
+            'force_down': (b'action=force_down', True, 200),
+            'bad_token': (b'action=up', False, 401),
+            'malformed': (None, True, 400)}
+# bodies of malformed requests, in turn
+MALFORMED_BODIES = (b'', b'action', b'action=unknown', b'{"action": "up"}', b'\xff\xfe=\x00', b'x' * 4096)
+DEFAULT_MIX = {'up': 4, 'down': 4, 'force_up': 1, 'force_down': 1, 'bad_token': 1, 'malformed': 1}
+
+# latency buckets: 2 % wide, from 10 µs to more than 100 s
+LATENCY_MINIMUM = 1e-5
+LATENCY_STEP = math.log(1.02)
+LATENCY_BUCKETS = 820
+
+
+# -------------------------------------------------
+# Latencies of a client, in buckets of fixed size, so
+# a soak of hours doesn't keep millions of values.
+# Percentiles are 2 % precise
+# -------------------------------------------------
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * LATENCY_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        index = int(math.log(max(seconds, LATENCY_MINIMUM) / LATENCY_MINIMUM) / LATENCY_STEP)
+        self.counts[min(index, LATENCY_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, ratio) -> float:
+        """upper bound of the bucket of the percentile, 0 without latency
+        """
+        if not self.count:
+            return 0.0
+        rank = ratio * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(LATENCY_MINIMUM * math.exp((index + 1) * LATENCY_STEP), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(0.50), 'p90': self.percentile(0.90), 'p99': self.percentile(0.99),
+                'p999': self.percentile(0.999), 'max': self.max}
+
+
+def parse_mix(text) -> dict:
+    """weight of each request, from up=4,down=4,bad_token=1
+
+    Raises:
+        ValueError: unknown request or weight which is not a number
+    """
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in REQUESTS:
+            raise ValueError(f"unknown request {name}, one of {', '.join(REQUESTS)}")
+        mix[name] = float(weight) if weight else 1.0
+    if not any(mix.values()):
+        raise ValueError("all weights are 0")
+    return mix
+
+
+def process_stats(pid) -> dict:
+    """RSS in kB, threads and open file descriptors of a process, read in /proc. None if unknown
+    """
+    stats = {'rss_kb': None, 'threads': None, 'fds': None}
+    try:
+        with open(f'/proc/{pid}/status', 'r') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    stats['rss_kb'] = int(line.split()[1])
+                elif line.startswith('Threads:'):
+                    stats['threads'] = int(line.split()[1])
+        stats['fds'] = len(os.listdir(f'/proc/{pid}/fd'))
+    except (OSError, ValueError, IndexError):
+        pass
+    return stats
+
+
+# -------------------------------------------------
+# Client which sends requests of the mix until the end,
+# on one connection when keep-alive is on (it's opened
+# again when the server closes it), or one connection
+# per request. Its counters are only written by itself
+# -------------------------------------------------
+class LoadClient(threading.Thread):
+    def __init__(self, host, port, token, mix, keep_alive, end, seed):
+        super().__init__(name=f'load_client_{seed}', daemon=True)
+        self.host = host
+        self.port = port
+        self.token = token
+        self.keep_alive = keep_alive
+        self.end = end
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.generator = random.Random(seed)
+        self.latencies = LatencyHistogram()
+        self.requests = 0
+        self.statuses = Counter()
+        self.unexpected = Counter()
+        self.errors = Counter()
+        self.connections = 0
+        self._malformed = 0
+
+    def _request(self, name):
+        body, good_token, expected = REQUESTS[name]
+        if body is None:
+            body = MALFORMED_BODIES[self._malformed % len(MALFORMED_BODIES)]
+            self._malformed += 1
+        headers = {'Authorization': self.token if good_token else 'bad-' + self.token,
+                   'Content-Type': 'application/x-www-form-urlencoded'}
+        if not self.keep_alive:
+            headers['Connection'] = 'close'
+        return body, headers, expected
+
+    def run(self):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=CONNECTION_TIMEOUT)
+        while time.monotonic() < self.end:
+            name = self.generator.choices(self.names, self.weights)[0]
+            body, headers, expected = self._request(name)
+            if connection.sock is None:
+                # http.client opens it again after a close
+                self.connections += 1
+            start = time.perf_counter()
+            try:
+                connection.request('POST', '/', body, headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as e:
+                self.errors[type(e).__name__] += 1
+                connection.close()
+                # server down: don't loop as fast as possible
+                time.sleep(0.01)
+                continue
+            self.latencies.add(time.perf_counter() - start)
+            self.requests += 1
+            self.statuses[response.status] += 1
+            if response.status != expected:
+                self.unexpected[f'{name} {response.status}'] += 1
+        connection.close()
+
+
+def serve(port, token, asynchronous=False, travel_time=DEFAULT_TRAVEL_TIME):
+    """start an http server with simulated motors, like door_management
+
+    Returns:
+        tuple: (server, MotorCommandQueue), to stop them
+    """
+    door.reset(travel_time=travel_time)
+    motor = AdvancedMotor(FORWARD_GPIO, BACKWARD_GPIO)
+    motor.set_close_sensor(CLOSE_SENSOR_GPIO)
+    motor.set_open_sensor(OPEN_SENSOR_GPIO)
+    commands = MotorCommandQueue(motor)
+    server_class = AsyncApiHttpServer if asynchronous else ApiHttpServer
+    server = server_class(port, token, commands.open_door, commands.close_door,
+                          lambda: commands.open_door(True), lambda: commands.close_door(True))
+    server.start()
+    return server, commands
+
+
+def _start_server(port, token, asynchronous, travel_time, verbose):
+    arguments = [sys.executable, '-m', 'benchmarks.http_load', '--serve', '-p', str(port), '--token', token,
+                 '--travel-time', str(travel_time)]
+    if asynchronous:
+        arguments.append('--async')
+    # the access log of each request is not kept, unless verbose
+    process = subprocess.Popen(arguments, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+                               stderr=None if verbose else subprocess.DEVNULL,
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if process.stdout.readline().strip() != 'ready':
+        process.wait()
+        raise RuntimeError(f"http server not started, exit code {process.returncode}")
+    return process
+
+
+def _sample(start, clients, pid, previous) -> dict:
+    requests = sum(client.requests for client in clients)
+    moment = time.monotonic()
+    sample = {'time': round(moment - start, 3), 'requests': requests,
+              'throughput': (requests - previous['requests']) / max(moment - start - previous['time'], 1e-9),
+              'errors': sum(sum(client.errors.values()) for client in clients)}
+    if pid:
+        sample.update(process_stats(pid))
+    return sample
+
+
+def run(duration=DEFAULT_DURATION, concurrency=DEFAULT_CONCURRENCY, mix=None, keep_alive=True, asynchronous=False,
+        interval=DEFAULT_INTERVAL, host='localhost', port=DEFAULT_PORT, token=None, pid=None,
+        travel_time=DEFAULT_TRAVEL_TIME, progress=None, verbose=False) -> dict:
+    """load the http server during duration
+
+    Args:
+        duration (float, optional): seconds of load. Defaults to DEFAULT_DURATION.
+        concurrency (int, optional): number of clients. Defaults to DEFAULT_CONCURRENCY.
+        mix (dict, optional): weight of each request of REQUESTS. Defaults to DEFAULT_MIX.
+        keep_alive (bool, optional): keep connections between requests. Defaults to True.
+        asynchronous (bool, optional): AsyncApiHttpServer instead of ApiHttpServer. Defaults to False.
+        interval (float, optional): seconds between samples of the server. Defaults to DEFAULT_INTERVAL.
+        host (str, optional): address of the server. Defaults to 'localhost'.
+        port (int, optional): port of the server. Defaults to DEFAULT_PORT.
+        token (str, optional): token of a running server, None to start one. Defaults to None.
+        pid (int, optional): process of a running server, to sample it. Defaults to None.
+        travel_time (float, optional): time of the simulated door between sensors. Defaults to DEFAULT_TRAVEL_TIME.
+        progress (optional): called with each sample. Defaults to None.
+        verbose (bool, optional): keep the log of the started server. Defaults to False.
+
+    Returns:
+        dict: parameters, throughput, latencies, status codes, errors, samples of the server (before the
+              load, during it, after it) and growth of RSS, threads and file descriptors
+    """
+    mix = mix or DEFAULT_MIX
+    process = None
+    if token is None:
+        token = secrets.token_hex(8)
+        process = _start_server(port, token, asynchronous, travel_time, verbose)
+        pid = process.pid
+    try:
+        before = process_stats(pid) if pid else {}
+        start = time.monotonic()
+        clients = [LoadClient(host, port, token, mix, keep_alive, start + duration, seed)
+                   for seed in range(concurrency)]
+        for client in clients:
+            client.start()
+        samples = []
+        previous = {'time': 0.0, 'requests': 0}
+        while any(client.is_alive() for client in clients):
+            next_sample = start + (len(samples) + 1) * interval
+            for client in clients:
+                client.join(max(0.0, next_sample - time.monotonic()))
+            if time.monotonic() >= next_sample:
+                previous = _sample(start, clients, pid, previous)
+                samples.append(previous)
+                if progress:
+                    progress(previous)
+                if process and process.poll() is not None:
+                    break
+        elapsed = time.monotonic() - start
+        time.sleep(SETTLE_TIME)
+        after = process_stats(pid) if pid else {}
+        exit_code = process.poll() if process else None
+    finally:
+        if process:
+            # end of stdin stops the server
+            process.stdin.close()
+            process.wait(CONNECTION_TIMEOUT)
+
+    latencies = LatencyHistogram()
+    statuses = Counter()
+    unexpected = Counter()
+    errors = Counter()
+    for client in clients:
+        latencies.merge(client.latencies)
+        statuses.update(client.statuses)
+        unexpected.update(client.unexpected)
+        errors.update(client.errors)
+    requests = latencies.count
+    return {'parameters': {'duration': duration, 'concurrency': concurrency, 'mix': mix, 'keep_alive': keep_alive,
+                           'server': 'asyncio' if asynchronous else 'thread', 'started': process is not None},
+            'requests': requests,
+            'seconds': elapsed,
+            'throughput': requests / elapsed,
+            'connections': sum(client.connections for client in clients),
+            'latency': latencies.summary(),
+            'status': {str(status): count for status, count in sorted(statuses.items())},
+            'unexpected': dict(unexpected),
+            'errors': dict(errors),
+            # exit code of the started server, when it stopped during the load
+            'server_exit': exit_code,
+            'server': {'before': before, 'after': after,
+                       'growth': {key: after[key] - before[key] for key in before
+                                  if before[key] is not None and after.get(key) is not None}},
+            'samples': samples}
+
+
+def _print_sample(sample):
+    server = ''
+    if 'threads' in sample:
+        server = f"   rss {sample['rss_kb']} kB   threads {sample['threads']}   fds {sample['fds']}"
+    print(f"{sample['time']:8.0f} s {sample['requests']:10} requests {sample['throughput']:8.0f} req/s"
+          f"   errors {sample['errors']}{server}", flush=True)
+
+
+def _wait_end_of_input():
+    # stopped by the end of stdin, or by a signal
+    try:
+        sys.stdin.read()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--concurrency', type=int, default=DEFAULT_CONCURRENCY, help=u'number of clients')
+    parser.add_argument('-d', '--duration', type=float, default=DEFAULT_DURATION, help=u'seconds of load')
+    parser.add_argument('-m', '--mix', type=parse_mix, default=None,
+                        help=u'weight of requests, default is up=4,down=4,force_up=1,force_down=1,bad_token=1,'
+                             u'malformed=1')
+    parser.add_argument('--no-keep-alive', action='store_true', help=u'one connection per request')
+    parser.add_argument('--async', dest='asynchronous', action='store_true', help=u'asyncio server')
+    parser.add_argument('-i', '--interval', type=float, default=DEFAULT_INTERVAL,
+                        help=u'seconds between samples of the server')
+    parser.add_argument('-t', '--travel-time', type=float, default=DEFAULT_TRAVEL_TIME,
+                        help=u'time of the simulated door between sensors, in seconds')
+    parser.add_argument('--host', default='localhost', help=u'address of a running server')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT, help=u'port of the server')
+    parser.add_argument('--token', help=u'token of a running server, default is to start one', required=False)
+    parser.add_argument('--pid', type=int, help=u'process of a running server, to sample it', required=False)
+    parser.add_argument('-o', '--output', help=u'JSON file of the report', required=False)
+    parser.add_argument('-v', '--verbose', action='store_true', help=u'log of the started server')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parameters = parser.parse_args()
+
+    if parameters.serve:
+        logging.basicConfig(level=logging.ERROR)
+        http_server, motor_commands = serve(parameters.port, parameters.token, parameters.asynchronous,
+                                            parameters.travel_time)
+        print('ready', flush=True)
+        _wait_end_of_input()
+        http_server.stop()
+        motor_commands.stop_queue()
+        sys.exit(0)
+
+    report = run(parameters.duration, parameters.concurrency, parameters.mix, not parameters.no_keep_alive,
+                 parameters.asynchronous, parameters.interval, parameters.host, parameters.port, parameters.token,
+                 parameters.pid, parameters.travel_time, _print_sample, parameters.verbose)
+    if parameters.output:
+        with open(parameters.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    latency = report['latency']
+    print(f"{report['requests']} requests in {report['seconds']:.1f} s: {report['throughput']:.0f} req/s, "
+          f"{report['connections']} connections")
+    print(f"latency  p50 {latency['p50'] * 1e3:.2f} ms   p90 {latency['p90'] * 1e3:.2f} ms   "
+          f"p99 {latency['p99'] * 1e3:.2f} ms   p99.9 {latency['p999'] * 1e3:.2f} ms   max {latency['max'] * 1e3:.2f} ms")
+    print(f"status   {report['status']}   unexpected {report['unexpected']}   errors {report['errors']}")
+    if report['server']['growth']:
+        print(f"server   before {report['server']['before']}   after {report['server']['after']}")
+    if report['server_exit'] is not None:
+        print(f"server stopped during the load, exit code {report['server_exit']}")
+    sys.exit(1 if report['unexpected'] or report['errors'] or report['server_exit'] is not None else 0)
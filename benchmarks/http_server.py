@@ -0,0 +1,94 @@
+# --------------------------------------------------
+# compare ApiHttpServer (one request at a time) with
+# AsyncApiHttpServer (concurrent clients, keep-alive) on localhost
+#
+# python -m benchmarks.http_server [-r 2000] [-c 8]
+# --------------------------------------------------
+import argparse
+import http.client
+import threading
+import time
+
+from elements.http_server import ApiHttpServer
+from elements.async_http_server import AsyncApiHttpServer
+
+TOKEN = 'benchmark-token'
+BODY = 'action=up'
+HEADERS = {'Authorization': TOKEN, 'Content-Type': 'application/x-www-form-urlencoded'}
+
+
+def nothing():
+    pass
+
+
+def percentile(values, ratio):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(ratio * len(values)))]
+
+
+def client(port, requests, latencies, errors):
+    connection = http.client.HTTPConnection('localhost', port, timeout=10)
+    for _ in range(requests):
+        start = time.perf_counter()
+        try:
+            connection.request('POST', '/', BODY, HEADERS)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            connection.close()
+            connection = http.client.HTTPConnection('localhost', port, timeout=10)
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+
+
+def measure(server_class, port, requests, concurrency):
+    server = server_class(port, TOKEN, nothing, nothing, nothing, nothing)
+    server.start()
+    latencies = []
+    errors = []
+    threads = [threading.Thread(target=client, args=(port, requests // concurrency, latencies, errors))
+               for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+    server.stop()
+    return {'requests': len(latencies),
+            'errors': len(errors),
+            'throughput': len(latencies) / duration,
+            'p50': percentile(latencies, 0.50),
+            'p99': percentile(latencies, 0.99)}
+
+
+def run(requests=2000, concurrency=8, port=54400):
+    """run the benchmark
+
+    Args:
+        requests (int, optional): number of requests for each server. Defaults to 2000.
+        concurrency (int, optional): number of concurrent clients. Defaults to 8.
+        port (int, optional): first port used. Defaults to 54400.
+
+    Returns:
+        dict: results for each server
+    """
+    return {'thread': measure(ApiHttpServer, port, requests, concurrency),
+            'asyncio': measure(AsyncApiHttpServer, port + 1, requests, concurrency)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--requests', type=int, default=2000, help=u'number of requests')
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help=u'number of clients')
+    parameters = parser.parse_args()
+
+    for name, result in run(parameters.requests, parameters.concurrency).items():
+        print(f"{name:8}: {result['throughput']:8.0f} req/s   p50 {result['p50'] * 1e3:7.2f} ms"
+              f"   p99 {result['p99'] * 1e3:7.2f} ms   errors {result['errors']}")
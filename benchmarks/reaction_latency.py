@@ -0,0 +1,82 @@
+# --------------------------------------------------
+# self-test of the reaction latency: drives the headless
+# simulator (simulator.headless) like a user would, the door
+# model presses the sensors, and reports the traced paths
+#   button released -> motor started
+#   sensor pressed  -> motor stopped
+#
+# python -m benchmarks.reaction_latency [-n 200]
+# --------------------------------------------------
+import argparse
+import os
+import time
+
+# the headless simulator, when gpiozero is not installed. Set before elements are imported
+os.environ.setdefault('DOOR_SIMULATOR', 'headless')
+
+from simulator.headless import door
+from elements.advanced_elements import AdvancedButton, AdvancedMotor, MotorCommandQueue
+from elements import tracing
+
+# GPIO numbers of the simulated elements
+BUTTON_GPIO = 22
+FORWARD_GPIO = 17
+BACKWARD_GPIO = 18
+CLOSE_SENSOR_GPIO = 23
+OPEN_SENSOR_GPIO = 24
+# a press longer than short press (100 ms) and shorter than long press
+PRESS_TIME = 0.15
+# time for the simulated door to reach the other sensor
+TRAVEL_TIME = 0.01
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def run(reactions=200, travel_time=TRAVEL_TIME):
+    """run the self-test
+
+    Args:
+        reactions (int, optional): number of button and sensor reactions. Defaults to 200.
+        travel_time (float, optional): time of the simulated door between sensors. Defaults to TRAVEL_TIME.
+
+    Returns:
+        dict: report of each traced path, see tracing.report
+    """
+    door.reset(travel_time=travel_time)
+    motor = AdvancedMotor(FORWARD_GPIO, BACKWARD_GPIO, open_timeout=10, close_timeout=10)
+    motor.set_close_sensor(CLOSE_SENSOR_GPIO)
+    motor.set_open_sensor(OPEN_SENSOR_GPIO)
+    commands = MotorCommandQueue(motor)
+    button = AdvancedButton(BUTTON_GPIO, commands.toggle_door, commands.stop)
+
+    try:
+        for _ in range(reactions):
+            # button toggles the door: it opens or closes
+            button.button.press()
+            time.sleep(PRESS_TIME)
+            button.button.release()
+            if not wait_for(motor.is_active):
+                raise RuntimeError("motor not started by button")
+            # the door reaches its sensor
+            if not wait_for(lambda: not motor.is_active(), 2 + travel_time):
+                raise RuntimeError("motor not stopped by sensor")
+    finally:
+        commands.stop_queue()
+    return tracing.report()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--reactions', type=int, default=200, help=u'number of button and sensor reactions')
+    parser.add_argument('-t', '--travel-time', type=float, default=TRAVEL_TIME,
+                        help=u'time of the simulated door between sensors, in seconds')
+    parameters = parser.parse_args()
+
+    print(tracing.format_report(run(parameters.reactions, parameters.travel_time)))
@@ -0,0 +1,75 @@
+# --------------------------------------------------
+# compare the vectorized solar schedule with one ephem.Observer
+# per site and per day, and check they give the same instants
+#
+# python -m benchmarks.solar_schedule [-s 10000] [-d 366]
+# --------------------------------------------------
+import argparse
+import time
+from datetime import date
+
+import ephem
+import numpy as np
+
+from elements.solar_schedule import compute_schedule, cross_check
+
+# the per object path is too long for all sites, measure only some of them
+EPHEM_SITES = 5
+
+
+def random_sites(number, seed=0):
+    generator = np.random.default_rng(seed)
+    latitudes = generator.uniform(-60.0, 60.0, number)
+    longitudes = generator.uniform(-180.0, 180.0, number)
+    return [(float(latitude), float(longitude), 1800) for latitude, longitude in zip(latitudes, longitudes)]
+
+
+def per_object(sites, start, days):
+    epoch = ephem.Date('1970/1/1')
+    first = ephem.Date(start.strftime('%Y/%m/%d'))
+    for latitude, longitude, security in sites:
+        for day in range(days):
+            observer = ephem.Observer()
+            observer.lat, observer.lon = str(latitude), str(longitude)
+            observer.date = first + day
+            (observer.next_rising(ephem.Sun()) - epoch) * 86400.0
+            (observer.next_setting(ephem.Sun()) - epoch) * 86400.0 + security
+
+
+def run(number=10000, days=366, start=date(2026, 1, 1)):
+    """run the benchmark
+
+    Args:
+        number (int, optional): number of sites. Defaults to 10000.
+        days (int, optional): number of days. Defaults to 366.
+        start (date, optional): first day. Defaults to date(2026, 1, 1).
+
+    Returns:
+        dict: durations in seconds, estimated for the per object path, and difference with ephem
+    """
+    sites = random_sites(number)
+    results = {}
+
+    begin = time.perf_counter()
+    compute_schedule(sites, start, days)
+    results['vectorized'] = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    per_object(sites[:EPHEM_SITES], start, days)
+    results['per_object_estimated'] = (time.perf_counter() - begin) * number / EPHEM_SITES
+
+    results['valid'], results['maximum_difference'] = cross_check(sites, start, days)
+    results['valid'] = bool(results['valid'])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--sites', type=int, default=10000, help=u'number of sites')
+    parser.add_argument('-d', '--days', type=int, default=366, help=u'number of days')
+    parameters = parser.parse_args()
+
+    result = run(parameters.sites, parameters.days)
+    print(f"vectorized           : {result['vectorized']:10.2f} s")
+    print(f"per object estimated : {result['per_object_estimated']:10.2f} s")
+    print(f"difference with ephem: {result['maximum_difference']:10.1f} s, valid: {result['valid']}")
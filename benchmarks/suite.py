@@ -0,0 +1,317 @@
+# --------------------------------------------------
+# benchmark suite of the daemon hot paths, offline and
+# reproducible (fixed seeds and dates):
+#   format_data   log report on 1 MB to 100 MB synthetic logs
+#   schedule      AutomaticControl.automatic_control
+#   http          ApiHttpServer (and asyncio one) throughput, p50, p99
+#   button        button release to callback, AdvancedButton and MasterButton
+#   logger        Logger write throughput with rotation
+# Results are saved in JSON, and compared with a baseline:
+# exit code is 1 when a metric is worse than threshold
+#
+# python -m benchmarks.suite [-c http -c button] [--quick] [-o results.json] [-b baseline.json] [-t 0.2]
+# --------------------------------------------------
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+# the headless simulator, when gpiozero is not installed. Set before elements are imported
+os.environ.setdefault('DOOR_SIMULATOR', 'headless')
+
+from benchmarks import http_server
+from elements.advanced_elements import AdvancedButton, MasterButton
+from elements.automatic_door import AutomaticControl
+from elements.clock import Clock, VirtualClock
+from elements.format_email_body import format_data
+from elements.logger import Logger
+
+VERSION = 1
+# leaf metrics compared with a baseline, the others are only reported
+LOWER_IS_BETTER = ('seconds', 'first_call', 'call', 'p50', 'p99', 'mean', 'max')
+HIGHER_IS_BETTER = ('throughput', 'mb_per_s')
+DEFAULT_THRESHOLD = 0.2
+
+LATITUDE = "48.858823"
+LONGITUDE = "2.294270"
+SCHEDULE_START = datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp()
+BUTTON_GPIO = 22
+
+# loggers and messages of the synthetic log, door events are a part of them
+LOG_LINES = (('advanced_elements', 'INFO', 'open door'),
+             ('advanced_elements', 'INFO', 'close door'),
+             ('advanced_elements', 'INFO', 'stop door: open door is reached'),
+             ('advanced_elements', 'WARNING', 'stop door: max time reached'),
+             ('automatic_door', 'INFO', 'next open UTC: 2026-05-02 04:31:12+00:00'),
+             ('http_server', 'INFO', 'POST / 200'),
+             ('watch_dog', 'DEBUG', 'next watchdog in 300 seconds, 4 timers pending'),
+             ('mail_spool', 'DEBUG', 'email sent: 1777600000.000000-1234-0.eml'))
+
+# each case runs repeat times, the best value of each metric is kept, to be less sensitive to other processes
+DEFAULT_PARAMETERS = {'repeat': 3, 'log_sizes': (1, 10, 100), 'schedule_calls': 2000, 'http_requests': 2000,
+                      'http_concurrency': 8, 'button_releases': 200, 'logger_messages': 50000}
+QUICK_PARAMETERS = {'repeat': 1, 'log_sizes': (1, ), 'schedule_calls': 200, 'http_requests': 400,
+                    'http_concurrency': 4, 'button_releases': 40, 'logger_messages': 5000}
+
+
+def percentile(values, ratio):
+    return http_server.percentile(values, ratio)
+
+
+def _write_log(path, size_mb, seed=0):
+    generator = random.Random(seed)
+    size = size_mb * 1024 * 1024
+    moment = datetime(2026, 5, 1).timestamp()
+    written = 0
+    with open(path, 'w') as file:
+        while written < size:
+            lines = []
+            for _ in range(1000):
+                moment += generator.random() * 30
+                name, level, message = LOG_LINES[generator.randrange(len(LOG_LINES))]
+                stamp = datetime.fromtimestamp(moment).strftime('%Y-%m-%d %H:%M:%S')
+                lines.append(f'{stamp},{generator.randrange(1000):03} - {name} - {level} - {message}\n')
+            chunk = ''.join(lines)
+            file.write(chunk)
+            written += len(chunk)
+
+
+def bench_format_data(parameters, directory) -> dict:
+    results = {}
+    for size_mb in parameters['log_sizes']:
+        path = os.path.join(directory, f'door_{size_mb}.log')
+        # same file for each repeat
+        if not os.path.exists(path):
+            _write_log(path, size_mb)
+        with open(path, 'r') as log:
+            start = time.perf_counter()
+            report = format_data(log)
+            seconds = time.perf_counter() - start
+        results[f'{size_mb}MB'] = {'seconds': seconds, 'mb_per_s': size_mb / seconds,
+                                   'events': len(report.splitlines())}
+    return results
+
+
+# motor of AutomaticControl, without action
+class _Motor:
+    open_timeout = 20
+    close_timeout = 20
+
+    def open_door(self, force=False):
+        return True
+
+    def close_door(self, force=False):
+        return True
+
+
+def bench_schedule(parameters, directory) -> dict:
+    clock = VirtualClock(SCHEDULE_START)
+    configuration = {'latitude': LATITUDE, 'longitude': LONGITUDE, 'ephemeris_file': None}
+    control = AutomaticControl(configuration, _Motor(), clock=clock)
+    # the first call computes the ephemeris table
+    start = time.perf_counter()
+    control.automatic_control()
+    first_call = time.perf_counter() - start
+    durations = []
+    for _ in range(parameters['schedule_calls']):
+        control.timer.cancel()
+        clock.advance(3600)
+        start = time.perf_counter()
+        control.automatic_control(first=False)
+        durations.append(time.perf_counter() - start)
+    control.timer.cancel()
+    return {'first_call': first_call, 'mean': sum(durations) / len(durations),
+            'p50': percentile(durations, 0.5), 'p99': percentile(durations, 0.99)}
+
+
+def bench_http(parameters, directory) -> dict:
+    # without the access log of each request
+    with contextlib.redirect_stderr(io.StringIO()):
+        return http_server.run(parameters['http_requests'], parameters['http_concurrency'])
+
+
+# real clock, but a press lasts without waiting: time moves forward by shift
+class _ShiftedClock(Clock):
+    def __init__(self):
+        self.shift = 0.0
+
+    def time(self) -> float:
+        return time.time() + self.shift
+
+
+def _button_latency(button_class, press_time, releases) -> dict:
+    clock = _ShiftedClock()
+    called = threading.Event()
+    stamps = []
+
+    def callback():
+        stamps.append(time.perf_counter())
+        called.set()
+
+    button = button_class(BUTTON_GPIO, callback, None, clock=clock)
+    latencies = []
+    for _ in range(releases):
+        called.clear()
+        button.button.press()
+        clock.shift += press_time
+        start = time.perf_counter()
+        button.button.release()
+        if not called.wait(1):
+            raise RuntimeError(f"{button_class.__name__} callback not called")
+        latencies.append(stamps[-1] - start)
+    return {'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99), 'max': max(latencies)}
+
+
+def bench_button(parameters, directory) -> dict:
+    # short press of each button
+    return {'advanced': _button_latency(AdvancedButton, 0.15, parameters['button_releases']),
+            'master': _button_latency(MasterButton, 0.3, parameters['button_releases'])}
+
+
+def _logger_throughput(directory, asynchronous, messages) -> dict:
+    path = os.path.join(directory, f'door_{"async" if asynchronous else "sync"}.log')
+    level = logging.getLogger().level
+    logger = Logger({'log_file': path, 'log_level': 'info', 'log_async': asynchronous})
+    writer = logging.getLogger('advanced_elements')
+    start = time.perf_counter()
+    for index in range(messages):
+        writer.info(f"stop door: open door is reached {index}")
+    call = (time.perf_counter() - start) / messages
+    logger.stop()
+    seconds = time.perf_counter() - start
+    # next benchmarks don't write in this log
+    logger.logger.removeHandler(logger.handler)
+    logger.handler.close()
+    logger.logger.setLevel(level)
+    return {'call': call, 'seconds': seconds, 'throughput': messages / seconds}
+
+
+def bench_logger(parameters, directory) -> dict:
+    return {'async': _logger_throughput(directory, True, parameters['logger_messages']),
+            'sync': _logger_throughput(directory, False, parameters['logger_messages'])}
+
+
+CASES = {'format_data': bench_format_data,
+         'schedule': bench_schedule,
+         'http': bench_http,
+         'button': bench_button,
+         'logger': bench_logger}
+
+
+def _best(results, name=''):
+    """best value of each metric of repeated results
+    """
+    first = results[0]
+    if isinstance(first, dict):
+        return {key: _best([result[key] for result in results], key) for key in first}
+    if name in LOWER_IS_BETTER:
+        return min(results)
+    if name in HIGHER_IS_BETTER:
+        return max(results)
+    return first
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(cases=None, quick=False) -> dict:
+    """run the benchmarks
+
+    Args:
+        cases (list, optional): names of CASES, None for all. Defaults to None.
+        quick (bool, optional): smaller sizes and no repeat, to check the suite. Defaults to False.
+
+    Returns:
+        dict: meta (date, machine, commit) and results of each case
+    """
+    parameters = QUICK_PARAMETERS if quick else DEFAULT_PARAMETERS
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in cases or CASES:
+            results[name] = _best([CASES[name](parameters, directory) for _ in range(parameters['repeat'])])
+    return {'version': VERSION,
+            'meta': {'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                     'python': platform.python_version(), 'machine': platform.machine(),
+                     'platform': platform.platform(), 'cpus': os.cpu_count(), 'commit': _git_commit(),
+                     'quick': quick},
+            'results': results}
+
+
+def flatten(results, prefix='') -> dict:
+    """{'http.thread.p99': value...} of nested results
+    """
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        else:
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD) -> list:
+    """compare results with a baseline
+
+    Returns:
+        list: (metric, baseline value, current value, relative change, worse than threshold) of compared metrics,
+              relative change is positive when the metric is worse
+    """
+    current = flatten(current['results'])
+    baseline = flatten(baseline['results'])
+    comparison = []
+    for name, value in current.items():
+        leaf = name.rsplit('.', 1)[-1]
+        before = baseline.get(name)
+        if not before or leaf not in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            continue
+        change = (value - before) / before
+        if leaf in HIGHER_IS_BETTER:
+            change = -change
+        comparison.append((name, before, value, change, change > threshold))
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--case', action='append', choices=list(CASES), help=u'case to run, default is all')
+    parser.add_argument('--quick', action='store_true', help=u'small sizes, to check the suite quickly')
+    parser.add_argument('-o', '--output', help=u'JSON file of results', required=False)
+    parser.add_argument('-b', '--baseline', help=u'JSON file of previous results to compare with', required=False)
+    parser.add_argument('-t', '--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=u'relative change reported as regression, default is 0.2')
+    parameters = parser.parse_args()
+
+    result = run(parameters.case, parameters.quick)
+    if parameters.output:
+        with open(parameters.output, 'w') as output:
+            json.dump(result, output, indent=2)
+
+    if parameters.baseline:
+        with open(parameters.baseline, 'r') as f:
+            previous = json.load(f)
+        if previous['meta'].get('quick') != result['meta']['quick']:
+            print("warning: quick and full results are compared, sizes are not the same")
+        regressions = 0
+        for metric, before, after, change, worse in compare(result, previous, parameters.threshold):
+            regressions += worse
+            print(f"{metric:32} {before:14.6g} {after:14.6g} {change * 100:+7.1f} %{'  REGRESSION' if worse else ''}")
+        print(f"{regressions} regressions, threshold {parameters.threshold * 100:.0f} %")
+        sys.exit(1 if regressions else 0)
+    for metric, value in flatten(result['results']).items():
+        print(f"{metric:32} {value:14.6g}")
@@ -19,6 +19,14 @@
 #
 # read a configuration file which contains the GPIO to use, the position (lon, lat)
 # the script to used to stop/start Wifi, a security time to close door after sunset + this time
+#
+# fast boot: after a power cut, only the GPIO, motor and automatic control are
+# loaded before the first motor command (target state from the cached ephemeris
+# file). Email, http server and watchdog are imported afterwards. The journal,
+# flight recorder, metrics, tracing, gpio trace, event bus and door status are
+# loaded and opened before: the motor records its first run in them, and they
+# cost about 3 ms of the 75 ms of imports on a PC. To see the import times and
+# the boot time: python -m benchmarks.boot_time
 # --------------------------------------------------
 from elements.logger import Logger
 import json
@@ -26,6 +34,7 @@ import argparse
 from signal import pause
 from datetime import datetime
 import threading
+import time
 import os
 import os.path
 import subprocess
@@ -33,60 +42,63 @@ from elements.advanced_elements import AdvancedButton
 from elements.advanced_elements import MasterButton
 from elements.advanced_elements import AdvancedLed
 from elements.advanced_elements import AdvancedMotor
+from elements.advanced_elements import MotorCommandQueue
 from elements.automatic_door import AutomaticControl
-from elements.email_sender import EmailSender
-from elements.http_server import ApiHttpServer
-from elements.http_server import CommandRequestHandler
-from elements.watchdog import WatchDog
+from elements.journal import journal
+from elements.journal import DEFAULT_FILE as DEFAULT_JOURNAL_FILE
+from elements.journal import DEFAULT_MAX_SIZE as DEFAULT_JOURNAL_MAX_SIZE
+from elements.gpio_trace import gpio_trace
+from elements.flight_recorder import flight_recorder
+from elements.flight_recorder import DEFAULT_FILE as DEFAULT_FLIGHT_RECORDER_FILE
 
 RASPBERRY = True
 try:
     import gpiozero
 except ModuleNotFoundError:
-    from simulator.sgpiozero import GpioUi
+    from simulator import headless
+    if headless.is_selected():
+        from simulator.headless import GpioUi
+    else:
+        from simulator.sgpiozero import GpioUi
     RASPBERRY = False
 
 
-# return True if motor is activate
-# False if no motor or can't activate it
+# all commands go through the motor command queue, executed one at a time
+# each function returns a Future with the motor result, or False if no motor
 def toggle_door():
-    if motor:
-        # reverse door only if motor is running
-        if not motor.reverse_door():
-            if not motor.open_door():
-                return motor.close_door()
-        return True
+    if commands:
+        return commands.toggle_door()
     return False
 
 
 def open_door():
-    if motor:
-        return motor.open_door()
+    if commands:
+        return commands.open_door()
     return False
 
 
 def close_door():
-    if motor:
-        return motor.close_door()
+    if commands:
+        return commands.close_door()
     return False
 
 
 def force_open_door():
-    if motor:
-        return motor.open_door(True)
+    if commands:
+        return commands.open_door(True)
     return False
 
 
 def force_close_door():
-    if motor:
-        return motor.close_door(True)
+    if commands:
+        return commands.close_door(True)
     return False
 
 
-# return True if motor was active and stopped
+# result is True if motor was active and stopped
 def stop_door():
-    if motor:
-        return motor.stop()
+    if commands:
+        return commands.stop()
     return False
 
 
@@ -96,21 +108,52 @@ def other_action():
 
 def start_http_server():
     global http_server
+    # imported after the first motor command
+    from elements.http_server import ApiHttpServer
+    from elements.async_http_server import AsyncApiHttpServer
 
     if not http_server:
-        # activate Http server if Wifi stay activated
-        http_server = ApiHttpServer(server_address, CommandRequestHandler, (open_door, close_door, force_open_door(),
-                                                                            force_close_door()))
+        try:
+            token = str(configuration['http_token'])
+        except KeyError:
+            logger.error('No http_token, so no http server !')
+            return
+        # asyncio server serves clients concurrently, with keep-alive
+        try:
+            asynchronous = configuration['http_async']
+        except KeyError:
+            asynchronous = False
+        server_class = AsyncApiHttpServer if asynchronous else ApiHttpServer
+        http_server = server_class(server_address[1], token, open_door, close_door, force_open_door, force_close_door)
+        http_server.start()
 
 
 def stop_http_server():
     global http_server
 
     if http_server:
-        http_server.stop_server()
+        http_server.stop()
         http_server = None
 
 
+def process_age():
+    """seconds since the start of this process (interpreter start included), None if unknown
+    """
+    try:
+        with open('/proc/self/stat', 'r') as stat:
+            # the name of the process can have spaces, the fields after it don't
+            start_ticks = int(stat.read().rsplit(')', 1)[1].split()[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def log_boot_time(command):
+    boot_time = process_age()
+    if boot_time is not None:
+        logger.info(f"door managed {boot_time:.2f} s after start")
+
+
 def read_config_file(file):
     with open(file, 'r') as f:
         line = f.read()
@@ -150,6 +193,28 @@ if __name__ == "__main__":
     # rotate log configuration
     logger = Logger(configuration)
 
+    # last debug events kept in memory, written on crash, SIGUSR1, safety timeout and exit
+    try:
+        flight_recorder_file = configuration['flight_recorder_file']
+    except KeyError:
+        flight_recorder_file = DEFAULT_FLIGHT_RECORDER_FILE
+    try:
+        flight_recorder_size = configuration['flight_recorder_size']
+    except KeyError:
+        flight_recorder_size = None
+    flight_recorder.install(flight_recorder_file, flight_recorder_size)
+
+    # binary journal of motor and sensor events, used for reports
+    try:
+        journal_file = configuration['journal_file']
+    except KeyError:
+        journal_file = DEFAULT_JOURNAL_FILE
+    try:
+        journal_max_size = configuration['journal_max_size']
+    except KeyError:
+        journal_max_size = DEFAULT_JOURNAL_MAX_SIZE
+    journal.open(journal_file, journal_max_size)
+
     if RASPBERRY:
         logger.info("start door management on Raspberry")
     else:
@@ -171,6 +236,7 @@ if __name__ == "__main__":
     wifi_led = None
     motor_button = None
     motor = None
+    commands = None
     door_closed = None
     door_opened = None
 
@@ -199,6 +265,7 @@ if __name__ == "__main__":
     except KeyError:
         logger.error("Need at least motor GPIO")
         exit(1)
+    commands = MotorCommandQueue(motor)
 
     # the close door sensor
     try:
@@ -216,6 +283,15 @@ if __name__ == "__main__":
     except KeyError:
         pass
 
+    # trace of GPIO edges, http actions and motor commands, to replay an incident with simulator.replay
+    try:
+        if configuration['gpio_trace_file']:
+            gpio_trace.open(configuration['gpio_trace_file'], configuration,
+                            {'open': bool(motor.open_sensor and motor.open_sensor.is_pressed),
+                             'close': bool(motor.close_sensor and motor.close_sensor.is_pressed)})
+    except KeyError:
+        pass
+
     # fake ephemeris, simulate ephemeris each milliseconds if set in configuration file
     try:
         if configuration['fake_ephemeris']:
@@ -223,29 +299,45 @@ if __name__ == "__main__":
     except KeyError:
         fake_ephemeris = None
 
+    # first motor command, the target state comes from the cached ephemeris file
+    control = AutomaticControl(configuration, commands, fake_ephemeris)
+    first_command = control.automatic_control()
+    # time taken when the command is executed by the motor command thread, not when it is queued
+    if first_command is not None:
+        first_command.add_done_callback(log_boot_time)
+
+    # the other parts are loaded now, the door doesn't wait for them
+    from elements.email_sender import EmailSender
+    from elements.notifier import AlertNotifier
+    from elements.notifier import DEFAULT_WINDOW as DEFAULT_ALERT_WINDOW
+    from elements.temperature import TemperatureSampler, RASPBERRY_TEMP
+    from elements.temperature import DEFAULT_PERIOD as DEFAULT_TEMPERATURE_PERIOD
+    from elements.watchdog import WatchDog
+
     # prepare email sender if configuration is done. It will be used each time wifi is activated
     # if there is log to send
     email = EmailSender(configuration, logger)
 
-    control = AutomaticControl(configuration, motor, fake_ephemeris)
-    control.automatic_control()
-
-    '''
-    def run(server_class=HTTPServer, handler_class=RequestHandler, port=8080, token='votre_token_secret'):
-        server_address = ('', port)
-        httpd = server_class(server_address, handler_class, token=token)
-    '''
-    try:
-        http_server = ApiHttpServer(server_address, CommandRequestHandler, (configuration['http_token'], open_door, close_door,
-                                                                           force_open_door(), force_close_door()))
-    except KeyError:
-        logger.error('No http_token, so no http server !')
+    start_http_server()
 
     try:
         watch_time = configuration['watch_dog']
     except KeyError:
         watch_time = 300
-    watchdog = WatchDog(watch_time, email)
+    try:
+        alert_window = configuration['alert_window']
+    except KeyError:
+        alert_window = DEFAULT_ALERT_WINDOW
+    try:
+        temperature_period = configuration['temperature_period']
+    except KeyError:
+        temperature_period = DEFAULT_TEMPERATURE_PERIOD
+    try:
+        temperature_file = configuration['temperature_file']
+    except KeyError:
+        temperature_file = RASPBERRY_TEMP
+    watchdog = WatchDog(watch_time, email, AlertNotifier(email, alert_window),
+                        TemperatureSampler(temperature_file, temperature_period))
 
     try:
         if RASPBERRY:
@@ -258,3 +350,9 @@ if __name__ == "__main__":
             logger.debug(thread.name)
 
         control.timer.cancel()
+        stop_http_server()
+        commands.stop_queue()
+        journal.close()
+        gpio_trace.close()
+        email.stop()
+        logger.stop()
@@ -11,14 +11,17 @@ INTERFACE="wlan0"
 TIMEOUT=10
 INTERVAL=3
 
-for i in $(seq 1 $TIMEOUT); do
-    ip -br a show "$INTERFACE" | grep -q "UP" && break
-    echo "$(date '+%Y/%m/%d %H:%M:%S') :  wait $INTERFACE is UP"
-    sleep "$INTERVAL"
-done
-
 echo none |sudo tee /sys/class/leds/ACT/trigger >/dev/null
 echo 0 |sudo tee /sys/class/leds/ACT/brightness >/dev/null
 
-python $HOME_SHELL/email_start.py $*
+# the start email waits for the network in background, the door doesn't wait for it
+(
+    for i in $(seq 1 $TIMEOUT); do
+        ip -br a show "$INTERFACE" | grep -q "UP" && break
+        echo "$(date '+%Y/%m/%d %H:%M:%S') :  wait $INTERFACE is UP"
+        sleep "$INTERVAL"
+    done
+    python $HOME_SHELL/email_start.py $*
+) &
+
 python $HOME_SHELL/door_management.py $*
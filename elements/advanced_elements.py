@@ -1,10 +1,24 @@
 # --------------------------------------------------
 # software develop for Raspberry Pi
 # It use gpiozero and if not present, use sgpiozero which simulate this library
+# or simulator.headless when DOOR_SIMULATOR=headless (no tkinter)
 # --------------------------------------------------
 import time
 import threading
+import heapq
+import itertools
 import logging
+from concurrent.futures import Future
+from .clock import clock as default_clock
+from .door_status import door_status
+from .event_bus import event_bus, MOTOR_START, MOTOR_STOP, MOTOR_REVERSE, SENSOR_PRESS, SENSOR_RELEASE, BUTTON
+from .journal import journal, MOTOR, OPEN_SENSOR, CLOSE_SENSOR, REFUSED
+from .metrics import counter, histogram
+from .gpio_trace import gpio_trace, BUTTON_PRESS, BUTTON_RELEASE, MOTOR_COMMAND
+from .gpio_trace import COMMAND_FORWARD, COMMAND_BACKWARD, COMMAND_REVERSE, COMMAND_STOP
+from .flight_recorder import flight_recorder, EVENT_ACTION, EVENT_TOO_MANY_ACTIONS, EVENT_SENSOR, EVENT_MOTOR
+from .flight_recorder import EVENT_REFUSED, EVENT_COMMAND, EVENT_BUTTON
+from .tracing import sensor_trace, button_trace, SENSOR_LOCKED, BUTTON_SCHEDULED, BUTTON_QUEUED, BUTTON_EXECUTED
 
 RASPBERRY = True
 
@@ -14,19 +28,39 @@ try:
     from gpiozero import Motor
 except ModuleNotFoundError:
     RASPBERRY = False
-    from simulator.sgpiozero import Button
-    from simulator.sgpiozero import LED
-    from simulator.sgpiozero import Motor
-    from simulator.sgpiozero import CheckButton
+    from simulator import headless
+    if headless.is_selected():
+        from simulator.headless import Button
+        from simulator.headless import LED
+        from simulator.headless import Motor
+        from simulator.headless import CheckButton
+    else:
+        from simulator.sgpiozero import Button
+        from simulator.sgpiozero import LED
+        from simulator.sgpiozero import Motor
+        from simulator.sgpiozero import CheckButton
 
 logger = logging.getLogger('advanced_elements')
 
+motor_run_seconds = histogram('door_motor_run_seconds', 'Duration of motor runs', ('direction', ),
+                              (1, 2, 5, 10, 15, 20, 30, 45, 60))
+motor_timeouts = counter('door_motor_timeouts_total', 'Motor stops by safety timeout', ('direction', ))
+motor_reversals = counter('door_motor_reversals_total', 'Motor reversals', ('cause', ))
+# children are kept, so recording does not look for them
+RUN_SECONDS = {direction: motor_run_seconds.labels(direction) for direction in ('open', 'close')}
+TIMEOUTS = {direction: motor_timeouts.labels(direction) for direction in ('open', 'close')}
+REVERSALS_TOO_MANY_ACTIONS = motor_reversals.labels('too_many_actions')
+REVERSALS_COMMAND = motor_reversals.labels('command')
+
 
 # class which implement Button which manage short and long press.
 #   default value for short press = 100ms
 #   default value for long press = 2000ms
 class AdvancedButton:
-    def __init__(self, gpio, short_callback, long_callback, short_press_time=100, long_press_time=2000):
+    def __init__(self, gpio, short_callback, long_callback, short_press_time=100, long_press_time=2000, clock=None):
+        self.gpio = gpio
+        # time of presses and delayed callbacks, a VirtualClock in simulation
+        self.clock = clock if clock else default_clock
         self.button = Button(gpio)
         self.press_time = 0
         self.long_press = long_press_time
@@ -37,19 +71,37 @@ class AdvancedButton:
         self.button.when_released = self.released
 
     def pressed(self):
-        self.press_time = int(round(time.time() * 1000))
+        gpio_trace.record(BUTTON_PRESS, self.gpio)
+        flight_recorder.record(EVENT_BUTTON, self.gpio)
+        self.press_time = int(round(self.clock.time() * 1000))
 
     def released(self):
-        time_pressed = int(round(time.time() * 1000)) - self.press_time
+        button_trace.begin()
+        gpio_trace.record(BUTTON_RELEASE, self.gpio)
+        time_pressed = int(round(self.clock.time() * 1000)) - self.press_time
+        flight_recorder.record(EVENT_BUTTON, self.gpio, time_pressed)
         if time_pressed > self.long_press:
             logger.debug("long press")
+            event_bus.publish(BUTTON, gpio=self.gpio, gesture='long', duration=time_pressed)
             if self.long_callback:
-                callback = threading.Timer(0.005, self.long_callback)
-                callback.start()
+                self.clock.call_later(0.005, self._call, self.long_callback, button_trace.detach())
         elif time_pressed > self.short_press and self.short_callback:
             logger.debug("short press")
-            callback = threading.Timer(0.005, self.short_callback)
-            callback.start()
+            event_bus.publish(BUTTON, gpio=self.gpio, gesture='short', duration=time_pressed)
+            self.clock.call_later(0.005, self._call, self.short_callback, button_trace.detach())
+        # no reaction left in the GPIO thread
+        button_trace.cancel()
+
+    # callbacks are called from the scheduler, the reaction of the release goes with the command
+    @staticmethod
+    def _call(callback, reaction=None):
+        button_trace.attach(reaction)
+        button_trace.mark(BUTTON_SCHEDULED)
+        try:
+            callback()
+        finally:
+            # given to the motor command queue, or ended by the motor, else not a motor start
+            button_trace.cancel()
 
 
 # class which implement Button which manage short, long and multiple press.
@@ -60,35 +112,40 @@ class AdvancedButton:
 # and the multiple press is not exceeded 2 seconds
 class MasterButton(AdvancedButton):
     def __init__(self, gpio, short_callback, long_callback, short_press_time=160, long_press_time=2000,
-                 multiple_callback=None, multiple_press_time=40, multiple_number=3):
-        super().__init__(gpio, short_callback, long_callback, short_press_time, long_press_time)
+                 multiple_callback=None, multiple_press_time=40, multiple_number=3, clock=None):
+        super().__init__(gpio, short_callback, long_callback, short_press_time, long_press_time, clock)
         self.multiple_callback = multiple_callback
         self.multiple_press = multiple_press_time
         self.multiple_number = multiple_number
         self.current_count = 0
-        self.last_release = time.time()
+        self.last_release = self.clock.time()
 
     def released(self):
-        current_release = time.time()
+        button_trace.begin()
+        gpio_trace.record(BUTTON_RELEASE, self.gpio)
+        current_release = self.clock.time()
         delta_release = current_release - self.last_release
         time_pressed = int(round(current_release * 1000)) - self.press_time
+        flight_recorder.record(EVENT_BUTTON, self.gpio, time_pressed)
         self.last_release = current_release
 
         if self.multiple_callback and self.short_press > time_pressed > self.multiple_press:
             self.current_count += 1
             if self.current_count >= self.multiple_number and delta_release < 2:
                 self.current_count = 0
-                callback = threading.Timer(0.005, self.multiple_callback)
-                callback.start()
+                event_bus.publish(BUTTON, gpio=self.gpio, gesture='multiple', duration=time_pressed)
+                self.clock.call_later(0.005, self._call, self.multiple_callback, button_trace.detach())
         else:
             self.current_count = 0
             if time_pressed > self.long_press:
+                event_bus.publish(BUTTON, gpio=self.gpio, gesture='long', duration=time_pressed)
                 if self.long_callback:
-                    callback = threading.Timer(0.005, self.long_callback)
-                    callback.start()
+                    self.clock.call_later(0.005, self._call, self.long_callback, button_trace.detach())
             elif time_pressed > self.short_press and self.short_callback:
-                callback = threading.Timer(0.005, self.short_callback)
-                callback.start()
+                event_bus.publish(BUTTON, gpio=self.gpio, gesture='short', duration=time_pressed)
+                self.clock.call_later(0.005, self._call, self.short_callback, button_trace.detach())
+        # no reaction left in the GPIO thread
+        button_trace.cancel()
 
 
 # class which implement Led and add blink method
@@ -128,23 +185,56 @@ class AdvancedLed:
         return self.led.is_lit
 
 
+# end of a motor run
+OPEN_REACHED = 'open_sensor_reached'
+CLOSE_REACHED = 'close_sensor_reached'
+TIMEOUT = 'timeout'
+STOPPED = 'stopped'
+REVERSED = 'reversed'
+INTERRUPTED = 'interrupted'
+
+
+# one run of the motor, from start to stop
+# finished is a Future, its result is the reason of the stop: OPEN_REACHED, TIMEOUT...
+class MotorRun:
+    def __init__(self, direction, clock=default_clock):
+        self.direction = direction
+        self.clock = clock
+        self.start = clock.monotonic()
+        self.duration = None
+        self.finished = Future()
+
+    def finish(self, reason):
+        if not self.finished.done():
+            self.duration = self.clock.monotonic() - self.start
+            self.finished.set_result(reason)
+
+
 # class which manage motor to open/close dore, with auto stop on high/low sensor
 # consider forward to open door (so, can't run if open_sensor is pressed)
 #          and backward to close door (so, can't run if close_sensor is pressed)
 # max_time is the time before the motor will be stop. It is a security
 class AdvancedMotor:
-    def __init__(self, forward, backward, open_timeout=20, close_timeout=20):
+    def __init__(self, forward, backward, open_timeout=20, close_timeout=20, clock=None):
         self.motor = Motor(forward=forward, backward=backward)
+        # time of runs and safety timeouts, a VirtualClock in simulation
+        self.clock = clock if clock else default_clock
         self.close_sensor = None
         self.open_sensor = None
         self.open_timeout = open_timeout
         self.close_timeout = close_timeout
         self.timer = None
+        # commands come from buttons, sensors, timers and http server threads
+        self.lock = threading.RLock()
         # each time open is not possible, increase value
         # each time close is not possible, decrease value
         # if (4 < value < -4) reverse motor, probably sensor problem
         self._open_door = False
         self.count_action = 0
+        # 'open' or 'close', the last direction sent to motor
+        self.direction = None
+        # current or last MotorRun
+        self.run = None
 
     def _increase_action(self, action=None, reverse=False):
         """increase current action
@@ -164,15 +254,36 @@ class AdvancedMotor:
         else:
             self.count_action -= 1
         logger.debug("count: " + str(self.count_action))
+        flight_recorder.record(EVENT_ACTION, self._open_door, self.count_action)
+
+    def _start_run(self, reason):
+        self._finish_run(reason)
+        self.run = MotorRun(self.direction, self.clock)
+
+    def _finish_run(self, reason):
+        run = self.run
+        if run is None or run.finished.done():
+            return
+        run.finish(reason)
+        if run.direction in RUN_SECONDS:
+            RUN_SECONDS[run.direction].observe(run.duration)
+            if reason == TIMEOUT:
+                TIMEOUTS[run.direction].inc()
+
+    def _update_status(self):
+        door_status.update(motor_active=self.motor.is_active, direction=self.direction,
+                           count_action=self.count_action)
 
     def _is_too_many_action(self):
         if self._open_door:
             if self.count_action >= 2:
                 logger.debug("too many open action")
+                flight_recorder.record(EVENT_TOO_MANY_ACTIONS, self.count_action)
                 return True
         else:
             if self.count_action <= -2:
                 logger.debug("too many close action")
+                flight_recorder.record(EVENT_TOO_MANY_ACTIONS, self.count_action)
                 return True
 
     def open_door(self, force=False) -> bool:
@@ -184,21 +295,32 @@ class AdvancedMotor:
         Returns:
             bool: True if ok
         """
-        if not self._is_open_sensor_pressed() or force:
-            if self.timer:
-                self.timer.cancel()
-            logger.info("open door")
-            self._increase_action(action=True)
-            if self._is_too_many_action():
-                # because too many same action, reverse
-                self.count_action = 0
-                return self.close_door(True)
-            self.motor.forward()
-            self.timer = threading.Timer(self.open_timeout, self.stop, args=("max time reached",))
-            self.timer.start()
-            return True
-        logger.info("can't open, already opened")
-        return False
+        with self.lock:
+            if not self._is_open_sensor_pressed() or force:
+                if self.timer:
+                    self.timer.cancel()
+                logger.info("open door")
+                self._increase_action(action=True)
+                if self._is_too_many_action():
+                    # because too many same action, reverse
+                    self.count_action = 0
+                    REVERSALS_TOO_MANY_ACTIONS.inc()
+                    return self.close_door(True)
+                self.motor.forward()
+                button_trace.end()
+                gpio_trace.record(MOTOR_COMMAND, 'motor', COMMAND_FORWARD)
+                flight_recorder.record(EVENT_MOTOR, COMMAND_FORWARD, force)
+                self.direction = 'open'
+                self._start_run(INTERRUPTED)
+                self._update_status()
+                event_bus.publish(MOTOR_START, direction=self.direction, force=force)
+                journal.write(MOTOR_START, MOTOR, self.direction, 'forced' if force else None)
+                self.timer = self.clock.call_later(self.open_timeout, self.stop, "max time reached", reason=TIMEOUT)
+                return True
+            logger.info("can't open, already opened")
+            flight_recorder.record(EVENT_REFUSED, 'open', self.count_action)
+            journal.write(REFUSED, MOTOR, 'open')
+            return False
 
     def close_door(self, force=False) -> bool:
         """close door if sensor is not pressed
@@ -209,50 +331,83 @@ class AdvancedMotor:
         Returns:
             bool: True if ok
         """
-        if not self._is_close_sensor_pressed() or force:
-            if self.timer:
-                self.timer.cancel()
-            logger.info("close door")
-            self._increase_action(action=False)
-            if self._is_too_many_action():
-                # because too many same action, reverse
-                self.count_action = 0
-                return self.open_door(True)
-            self.motor.backward()
-            self.timer = threading.Timer(self.close_timeout, self.stop, args=("max time reached",))
-            self.timer.start()
-            return True
-        logger.info("can't close, already closed")
-        return False
+        with self.lock:
+            if not self._is_close_sensor_pressed() or force:
+                if self.timer:
+                    self.timer.cancel()
+                logger.info("close door")
+                self._increase_action(action=False)
+                if self._is_too_many_action():
+                    # because too many same action, reverse
+                    self.count_action = 0
+                    REVERSALS_TOO_MANY_ACTIONS.inc()
+                    return self.open_door(True)
+                self.motor.backward()
+                button_trace.end()
+                gpio_trace.record(MOTOR_COMMAND, 'motor', COMMAND_BACKWARD)
+                flight_recorder.record(EVENT_MOTOR, COMMAND_BACKWARD, force)
+                self.direction = 'close'
+                self._start_run(INTERRUPTED)
+                self._update_status()
+                event_bus.publish(MOTOR_START, direction=self.direction, force=force)
+                journal.write(MOTOR_START, MOTOR, self.direction, 'forced' if force else None)
+                self.timer = self.clock.call_later(self.close_timeout, self.stop, "max time reached", reason=TIMEOUT)
+                return True
+            logger.info("can't close, already closed")
+            flight_recorder.record(EVENT_REFUSED, 'close', self.count_action)
+            journal.write(REFUSED, MOTOR, 'close')
+            return False
 
     # reverse if motor is active. Return True if ok
     def reverse_door(self):
-        if self.motor.is_active:
-            if self.timer:
-                self.timer.cancel()
-            logger.info("reverse door")
-            self._increase_action(reverse=True)
-            self.motor.reverse()
-            self.timer = threading.Timer(self.open_timeout, self.stop, args=("max time reached",))
-            self.timer.start()
-            return True
-        return False
+        with self.lock:
+            if self.motor.is_active:
+                if self.timer:
+                    self.timer.cancel()
+                logger.info("reverse door")
+                REVERSALS_COMMAND.inc()
+                self._increase_action(reverse=True)
+                self.motor.reverse()
+                button_trace.end()
+                gpio_trace.record(MOTOR_COMMAND, 'motor', COMMAND_REVERSE)
+                flight_recorder.record(EVENT_MOTOR, COMMAND_REVERSE)
+                self.direction = 'open' if self._open_door else 'close'
+                self._start_run(REVERSED)
+                self._update_status()
+                event_bus.publish(MOTOR_REVERSE, direction=self.direction)
+                journal.write(MOTOR_REVERSE, MOTOR, self.direction)
+                self.timer = self.clock.call_later(self.open_timeout, self.stop, "max time reached", reason=TIMEOUT)
+                return True
+            return False
 
     # stop if motor is active. Return True if ok
-    def stop(self, warning=None, message=None):
-        if self.motor.is_active:
-            if self.timer:
-                self.timer.cancel()
-            if warning:
-                logger.warning("stop door: " + warning)
-            else:
-                if message:
-                    logger.info("stop door: " + message)
+    # reason is given to the current MotorRun
+    def stop(self, warning=None, message=None, reason=STOPPED):
+        with self.lock:
+            sensor_trace.mark(SENSOR_LOCKED)
+            if self.motor.is_active:
+                if self.timer:
+                    self.timer.cancel()
+                if warning:
+                    logger.warning("stop door: " + warning)
                 else:
-                    logger.info("stop door")
-            self.motor.stop()
-            return True
-        return False
+                    if message:
+                        logger.info("stop door: " + message)
+                    else:
+                        logger.info("stop door")
+                self.motor.stop()
+                sensor_trace.end()
+                gpio_trace.record(MOTOR_COMMAND, 'motor', COMMAND_STOP)
+                flight_recorder.record(EVENT_MOTOR, COMMAND_STOP, reason)
+                self._finish_run(reason)
+                self._update_status()
+                event_bus.publish(MOTOR_STOP, direction=self.direction, reason=reason)
+                journal.write(MOTOR_STOP, MOTOR, self.direction, reason, self.run.duration if self.run else None)
+                if reason == TIMEOUT:
+                    # sensor not reached, keep what happened before
+                    flight_recorder.dump(f'safety timeout, {self.direction} door', background=True)
+                return True
+            return False
 
     def is_active(self):
         return self.motor.is_active
@@ -276,18 +431,44 @@ class AdvancedMotor:
         return True
 
     def close_sensor_pressed(self):
+        sensor_trace.begin()
+        gpio_trace.record(SENSOR_PRESS, 'close')
+        flight_recorder.record(EVENT_SENSOR, 'close', True)
         logger.debug("close door is reached")
-        self.stop(message="close door is reached")
+        self.stop(message="close door is reached", reason=CLOSE_REACHED)
+        # motor was not running
+        sensor_trace.cancel()
+        door_status.update(close_sensor=True)
+        event_bus.publish(SENSOR_PRESS, sensor='close')
+        journal.write(SENSOR_PRESS, CLOSE_SENSOR)
 
     def open_sensor_pressed(self):
+        sensor_trace.begin()
+        gpio_trace.record(SENSOR_PRESS, 'open')
+        flight_recorder.record(EVENT_SENSOR, 'open', True)
         logger.debug("open door is reached")
-        self.stop(message="open door is reached")
+        self.stop(message="open door is reached", reason=OPEN_REACHED)
+        # motor was not running
+        sensor_trace.cancel()
+        door_status.update(open_sensor=True)
+        event_bus.publish(SENSOR_PRESS, sensor='open')
+        journal.write(SENSOR_PRESS, OPEN_SENSOR)
 
     def close_sensor_released(self):
+        gpio_trace.record(SENSOR_RELEASE, 'close')
+        flight_recorder.record(EVENT_SENSOR, 'close', False)
         logger.debug("close door is released")
+        door_status.update(close_sensor=False)
+        event_bus.publish(SENSOR_RELEASE, sensor='close')
+        journal.write(SENSOR_RELEASE, CLOSE_SENSOR)
 
     def open_sensor_released(self):
+        gpio_trace.record(SENSOR_RELEASE, 'open')
+        flight_recorder.record(EVENT_SENSOR, 'open', False)
         logger.debug("open door is released")
+        door_status.update(open_sensor=False)
+        event_bus.publish(SENSOR_RELEASE, sensor='open')
+        journal.write(SENSOR_RELEASE, OPEN_SENSOR)
 
     def set_close_sensor(self, gpio):
         if RASPBERRY:
@@ -298,6 +479,8 @@ class AdvancedMotor:
         else:
             self.close_sensor = CheckButton(gpio, "close")
             self.close_sensor.when_pressed = self.close_sensor_pressed
+            self.close_sensor.when_released = self.close_sensor_released
+        door_status.update(close_sensor=bool(self.close_sensor.is_pressed))
 
     def set_open_sensor(self, gpio):
         if RASPBERRY:
@@ -308,6 +491,218 @@ class AdvancedMotor:
         else:
             self.open_sensor = CheckButton(gpio, "open")
             self.open_sensor.when_pressed = self.open_sensor_pressed
+            self.open_sensor.when_released = self.open_sensor_released
+        door_status.update(open_sensor=bool(self.open_sensor.is_pressed))
+
+
+# commands of MotorCommandQueue
+OPEN = 'open'
+CLOSE = 'close'
+FORCE_OPEN = 'force_open'
+FORCE_CLOSE = 'force_close'
+REVERSE = 'reverse'
+TOGGLE = 'toggle'
+STOP = 'stop'
+# priorities, the lowest first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+HIGH_PRIORITY_COMMANDS = (STOP, FORCE_OPEN, FORCE_CLOSE)
+# a toggle or a reverse twice is not the same as once, so they are never merged
+COALESCED_COMMANDS = (OPEN, CLOSE, FORCE_OPEN, FORCE_CLOSE, STOP)
+
+
+# result of a command of MotorCommandQueue
+#   accepted is the result of the motor method, the object is True when accepted
+#   run is the MotorRun started by the command, None if no run was started
+class CommandResult:
+    def __init__(self, command, accepted, run=None):
+        self.command = command
+        self.accepted = accepted
+        self.run = run
+
+    def __bool__(self):
+        return self.accepted
+
+
+# class which sends commands to an AdvancedMotor one at a time, from one thread
+#   stop and force commands are executed before the others, and stop cancels waiting commands
+#   an open/close/stop already waiting is not added again: the caller gets the same future
+#   an open/close while the motor already runs in this direction does nothing: its result is the current run
+# each command returns a Future, its result is a CommandResult
+# it has the same command methods as AdvancedMotor, so it can be used instead of it
+class MotorCommandQueue:
+    def __init__(self, motor: AdvancedMotor):
+        self.motor = motor
+        self._condition = threading.Condition()
+        self._queue = []
+        self._pending = {}
+        self._sequence = itertools.count()
+        self._thread = None
+        self.running = False
+        self.coalesced = 0
+
+    @property
+    def open_timeout(self):
+        return self.motor.open_timeout
+
+    @property
+    def close_timeout(self):
+        return self.motor.close_timeout
+
+    def open_door(self, force=False) -> Future:
+        return self.submit(FORCE_OPEN if force else OPEN)
+
+    def close_door(self, force=False) -> Future:
+        return self.submit(FORCE_CLOSE if force else CLOSE)
+
+    def reverse_door(self) -> Future:
+        return self.submit(REVERSE)
+
+    def toggle_door(self) -> Future:
+        return self.submit(TOGGLE)
+
+    def stop(self) -> Future:
+        return self.submit(STOP)
+
+    def is_active(self):
+        return self.motor.is_active()
+
+    def submit(self, command) -> Future:
+        """add a command to the queue
+
+        Args:
+            command (str): OPEN, CLOSE, FORCE_OPEN, FORCE_CLOSE, REVERSE, TOGGLE or STOP
+
+        Returns:
+            Future: CommandResult of the command, cancelled if a stop comes before its execution
+        """
+        with self._condition:
+            future = self._pending.get(command)
+            if future is not None:
+                # same command is already waiting, its reaction is the one measured
+                button_trace.cancel()
+                self.coalesced += 1
+                flight_recorder.record(EVENT_COMMAND, command, 'coalesced')
+                return future
+            if command == STOP:
+                self._cancel_pending()
+            future = Future()
+            priority = PRIORITY_HIGH if command in HIGH_PRIORITY_COMMANDS else PRIORITY_NORMAL
+            # a button reaction goes with its command to the worker thread
+            button_trace.mark(BUTTON_QUEUED)
+            reaction = button_trace.detach()
+            heapq.heappush(self._queue, (priority, next(self._sequence), command, future, reaction))
+            if command in COALESCED_COMMANDS:
+                self._pending[command] = future
+            if not self.running:
+                self._start()
+            self._condition.notify()
+        flight_recorder.record(EVENT_COMMAND, command, 'queued')
+        return future
+
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._queue)
+
+    def stop_queue(self):
+        """stop worker thread, waiting commands are cancelled
+        """
+        with self._condition:
+            self.running = False
+            self._cancel_pending(all_commands=True)
+            self._condition.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _cancel_pending(self, all_commands=False):
+        kept = []
+        for entry in self._queue:
+            priority, _, command, future, _ = entry
+            if all_commands or priority == PRIORITY_NORMAL:
+                logger.debug("command cancelled: " + command)
+                future.cancel()
+                self._pending.pop(command, None)
+            else:
+                kept.append(entry)
+        heapq.heapify(kept)
+        self._queue = kept
+
+    def _start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name='motor_commands')
+        # stop thread when main program is stopped
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _next(self):
+        with self._condition:
+            while self.running:
+                if self._queue:
+                    _, _, command, future, reaction = heapq.heappop(self._queue)
+                    self._pending.pop(command, None)
+                    return command, future, reaction
+                self._condition.wait()
+        return None
+
+    def _run(self):
+        while True:
+            entry = self._next()
+            if entry is None:
+                return
+            command, future, reaction = entry
+            if not future.set_running_or_notify_cancel():
+                continue
+            button_trace.attach(reaction)
+            button_trace.mark(BUTTON_EXECUTED)
+            flight_recorder.record(EVENT_COMMAND, command, 'executed')
+            try:
+                with self.motor.lock:
+                    accepted = bool(self._execute(command))
+                    run = self.motor.run if accepted and command != STOP else None
+                # command did not start the motor
+                button_trace.cancel()
+                future.set_result(CommandResult(command, accepted, run))
+            except Exception as e:
+                logger.exception("motor command " + command + " failed")
+                flight_recorder.dump(f'motor command {command} failed: {e}', background=True)
+                future.set_exception(e)
+
+    def _already_running(self, command) -> bool:
+        if command in (OPEN, FORCE_OPEN):
+            direction = 'open'
+        elif command in (CLOSE, FORCE_CLOSE):
+            direction = 'close'
+        else:
+            return False
+        return bool(self.motor.is_active()) and self.motor.direction == direction
+
+    def _execute(self, command):
+        if self._already_running(command):
+            # a burst of the same command, the door is already moving: not a new action
+            logger.debug("motor already runs for command: " + command)
+            self.coalesced += 1
+            flight_recorder.record(EVENT_COMMAND, command, 'running')
+            return True
+        if command == OPEN:
+            return self.motor.open_door()
+        if command == CLOSE:
+            return self.motor.close_door()
+        if command == FORCE_OPEN:
+            return self.motor.open_door(True)
+        if command == FORCE_CLOSE:
+            return self.motor.close_door(True)
+        if command == REVERSE:
+            return self.motor.reverse_door()
+        if command == STOP:
+            return self.motor.stop()
+        if command == TOGGLE:
+            # reverse door only if motor is running
+            if not self.motor.reverse_door():
+                if not self.motor.open_door():
+                    return self.motor.close_door()
+            return True
+        raise ValueError("unknown motor command: " + command)
 
 
 # blink led during tempo, with max_time in seconds
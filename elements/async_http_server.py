@@ -0,0 +1,323 @@
+import asyncio
+import threading
+import time
+import logging
+import concurrent.futures
+from http import HTTPStatus
+from urllib.parse import urlparse
+from .http_server import execute_command, update_function, get_wait, read_status, STATUS_PATH
+from .http_server import EVENTS_PATH, PING_PERIOD, events_headers, format_dropped
+from .http_server import JOBS_PATH, BATCH_PATH, command_answer, read_job, execute_batch
+from .http_server import METRICS_PATH, read_metrics, observe_request
+from .event_bus import event_bus, format_event
+from .http_server import UP, DOWN, FORCE_UP, FORCE_DOWN
+from .door_status import door_status
+
+http_logger = logging.getLogger('http_server')
+
+# close a connection without request during this time, in seconds
+KEEP_ALIVE_TIMEOUT = 15
+# time given to current requests to finish when server stops, in seconds
+SHUTDOWN_TIMEOUT = 5
+# biggest accepted body, commands are only a few bytes
+MAX_BODY_SIZE = 65536
+
+
+# status returned by _handle when the answer is an event stream
+STREAM = 0
+
+
+class BadRequest(Exception):
+    pass
+
+
+# -------------------------------------------------
+# asyncio version of ApiHttpServer, with the same commands.
+# All clients are served concurrently in one thread and
+# HTTP/1.1 connections are kept alive between requests
+# -------------------------------------------------
+class AsyncApiHttpServer:
+    def __init__(self, port: str, token: str, up=None, down=None, force_up=None, force_down=None,
+                 host: str = 'localhost'):
+        """asyncio http server
+
+        Args:
+            port (str): port to use
+            token (str): authentication token
+            up (optional): function to launch for this keyword. Defaults to None.
+            down (optional): function to launch for this keyword. Defaults to None.
+            force_up (optional): function to launch for this keyword. Defaults to None.
+            force_down (optional): function to launch for this keyword. Defaults to None.
+            host (str, optional): address to listen. Defaults to 'localhost'.
+        """
+        self.port = port
+        self.token = token
+        self.host = host
+        self.thread = None
+        self.loop = None
+        self.server = None
+        self.connections = {}
+        self._stopping = None
+        self._status_changed = None
+        self._started = threading.Event()
+        update_function(UP, up)
+        update_function(DOWN, down)
+        update_function(FORCE_UP, force_up)
+        update_function(FORCE_DOWN, force_down)
+        self.is_running = False
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self._run_server, name='http_server')
+        # stop thread when main program is stopped
+        self.thread.daemon = True
+        self.thread.start()
+        self._started.wait()
+        http_logger.info(f'Async server starts on port {self.port}')
+
+    def stop(self):
+        loop = self.loop
+        if loop is None or self._stopping is None or not loop.is_running():
+            # not started, start failed (like port in use) or already stopped: nothing to stop
+            self.is_running = False
+            return
+        try:
+            loop.call_soon_threadsafe(self._stopping.set)
+        except RuntimeError:
+            # loop closed since
+            pass
+        if self.thread:
+            self.thread.join()
+        self.is_running = False
+        http_logger.info('Server is stopped')
+
+    def _run_server(self):
+        try:
+            asyncio.run(self._serve())
+        except OSError as e:
+            http_logger.error(f"can't start server: {e}")
+            self.is_running = False
+            self._started.set()
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._status_changed = self.loop.create_future()
+        self.server = await asyncio.start_server(self._client, self.host, self.port)
+        door_status.add_listener(self._door_status_updated)
+        self._started.set()
+        await self._stopping.wait()
+        door_status.remove_listener(self._door_status_updated)
+        # long polling clients answer now
+        self._wake_up_status()
+
+        # graceful shutdown: no new connection, close idle ones and let current requests finish
+        self.server.close()
+        for task, busy in list(self.connections.items()):
+            if not busy:
+                task.cancel()
+        if self.connections:
+            _, pending = await asyncio.wait(list(self.connections), timeout=SHUTDOWN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+        await self.server.wait_closed()
+
+    async def _client(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections[task] = False
+        try:
+            keep_alive = True
+            while keep_alive and not self._stopping.is_set():
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                self.connections[task] = True
+                try:
+                    status, keep_alive, headers, body = await self._handle(request_line, reader)
+                except BadRequest:
+                    status, keep_alive, headers, body = 400, False, None, b''
+                if status == STREAM:
+                    # an event stream is idle: stop it at once when server stops
+                    self.connections[task] = False
+                    await self._stream_events(writer)
+                    break
+                if self._stopping.is_set():
+                    keep_alive = False
+                writer.write(self._response(status, keep_alive, headers, body))
+                await writer.drain()
+                self.connections[task] = False
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass
+        finally:
+            del self.connections[task]
+            writer.close()
+
+    async def _handle(self, request_line, reader):
+        """read one request and execute it
+
+        Returns:
+            tuple: (http status, True if connection is kept alive, headers, body)
+        """
+        try:
+            method, path, version = request_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        except ValueError:
+            raise BadRequest()
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, separator, value = line.decode('latin-1').partition(':')
+            if not separator:
+                raise BadRequest()
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            keep_alive = connection != 'close'
+        else:
+            keep_alive = connection == 'keep-alive'
+
+        try:
+            content_length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise BadRequest()
+        if content_length < 0 or content_length > MAX_BODY_SIZE:
+            return 413, False, None, b''
+        body = await reader.readexactly(content_length)
+
+        start = time.monotonic()
+        if method == 'POST':
+            status, answer_headers, answer = await self._post(path, headers, body)
+            observe_request(method, path, body, start)
+            return status, keep_alive, answer_headers, answer
+        if method == 'GET':
+            status, answer_headers, answer = await self._get(path, headers)
+            if status != STREAM:
+                observe_request(method, path, body, start)
+            return status, keep_alive, answer_headers, answer
+        return 501, keep_alive, None, b''
+
+    async def _post(self, path, headers, body):
+        url = urlparse(path)
+        if url.path == BATCH_PATH:
+            # a batch waits for the door, run it in its own thread
+            return await self._in_thread(execute_batch, self.token, headers.get('authorization'), body)
+        try:
+            wait = get_wait(url.query)
+        except ValueError:
+            return 400, None, b''
+        status, job = execute_command(self.token, headers.get('authorization'), body)
+        # wait for the final result of the command, like door opened
+        if job and wait:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.done)), wait)
+            except asyncio.TimeoutError:
+                pass
+        return command_answer(status, job, wait)
+
+    async def _get(self, path, headers):
+        url = urlparse(path)
+        if url.path not in (STATUS_PATH, EVENTS_PATH, METRICS_PATH) and not url.path.startswith(JOBS_PATH):
+            return 404, None, b''
+
+        authorization = headers.get('authorization')
+        if not authorization or authorization != self.token:
+            return 401, None, b''
+
+        if url.path == EVENTS_PATH:
+            return STREAM, None, b''
+
+        if url.path.startswith(JOBS_PATH):
+            return read_job(url.path)
+
+        if url.path == METRICS_PATH:
+            return read_metrics()
+
+        try:
+            wait = get_wait(url.query)
+        except ValueError:
+            return 400, None, b''
+
+        # long polling: client already knows current state, wait for the next one
+        if_none_match = headers.get('if-none-match')
+        deadline = self.loop.time() + wait
+        while wait and if_none_match == door_status.etag() and not self._stopping.is_set():
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(asyncio.shield(self._status_changed), remaining)
+            except asyncio.TimeoutError:
+                break
+        return read_status(if_none_match)
+
+    async def _stream_events(self, writer):
+        """Server-Sent Events stream, until client closes connection or server stops
+        """
+        lines = ['HTTP/1.1 200 OK', 'Connection: close'] + [f'{name}: {value}' for name, value in events_headers().items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        ready = asyncio.Event()
+        subscription = event_bus.subscribe(notify=lambda: self._call_from_thread(ready.set))
+        dropped = 0
+        try:
+            # stopping is checked too: wait_for may ignore a cancellation when the event is ready at the same time
+            while not self._stopping.is_set():
+                await writer.drain()
+                try:
+                    await asyncio.wait_for(ready.wait(), PING_PERIOD)
+                except asyncio.TimeoutError:
+                    writer.write(b': ping\n\n')
+                    continue
+                ready.clear()
+                data = format_dropped(subscription, dropped)
+                dropped = subscription.dropped
+                writer.write(data + b''.join(format_event(event) for event in subscription.get_all()))
+        finally:
+            subscription.close()
+
+    @staticmethod
+    async def _in_thread(function, *args):
+        """run function in a daemon thread: unlike the loop executor, it doesn't delay the server stop
+        """
+        future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(function(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name='http_batch', daemon=True).start()
+        return await asyncio.wrap_future(future)
+
+    def _call_from_thread(self, callback):
+        try:
+            self.loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            # loop already closed
+            pass
+
+    def _door_status_updated(self):
+        # called by the thread which updates door status
+        self._call_from_thread(self._wake_up_status)
+
+    def _wake_up_status(self):
+        self._status_changed.set_result(None)
+        self._status_changed = self.loop.create_future()
+
+    @staticmethod
+    def _response(status, keep_alive, headers=None, body=b''):
+        connection = 'keep-alive' if keep_alive else 'close'
+        lines = [f'HTTP/1.1 {status} {HTTPStatus(status).phrase}',
+                 f'Content-Length: {len(body)}',
+                 f'Connection: {connection}']
+        if headers:
+            lines += [f'{name}: {value}' for name, value in headers.items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
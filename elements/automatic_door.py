@@ -1,22 +1,35 @@
-import ephem
 from datetime import datetime, timezone
-import threading
-import time
 import logging
+from .clock import clock as default_clock
+from .door_status import door_status
+from .event_bus import event_bus, SCHEDULE
+from .journal import journal, AUTOMATIC
+from .ephemeris_cache import EphemerisCache, DEFAULT_FILE
 
 logger = logging.getLogger('automatic_door')
 
+# without sun rise or set in the ephemeris table (polar day or night), the schedule is checked again after this time
+NO_EVENT_DELAY = 86400
+
 
 class AutomaticControl:
     # fake_time set time to next event instead of ephemeris value. in milliseconds
-    def __init__(self, configuration, motor, fake_time=None):
+    # clock gives time and timers, a VirtualClock to replay seasons in simulation
+    def __init__(self, configuration, motor, fake_time=None, clock=None):
         try:
             self.delta = configuration['security_time']
         except KeyError:
             self.delta = 1800
         self.longitude = configuration['longitude']
         self.latitude = configuration['latitude']
+        try:
+            ephemeris_file = configuration['ephemeris_file']
+        except KeyError:
+            ephemeris_file = DEFAULT_FILE
+        # sun rise/set precomputed for one year, recomputed if location changes
+        self.ephemeris = EphemerisCache(self.latitude, self.longitude, ephemeris_file)
         self.motor = motor
+        self.clock = clock if clock else default_clock
         self.timer = None
         # to simulate ephemeris
         self.fake_time = fake_time
@@ -26,57 +39,64 @@ class AutomaticControl:
             self.fake_start = datetime.now()
 
     # first is set to False when call after automatic open/close door, to not open/close door a new time
+    # return the result of the motor command when first, like a Future of MotorCommandQueue, else None
     def automatic_control(self, first=True):
-        observer = ephem.Observer()
-        observer.lat, observer.lon = self.latitude, self.longitude
-        observer.date = ephem.Date(datetime.now(timezone.utc))
-
-        next_goodbye_sun = observer.next_setting(ephem.Sun()).datetime()
-        security_time = next_goodbye_sun.timestamp() + self.delta
-        next_goodbye_sun = datetime.fromtimestamp(security_time)
-
-        next_hello_sun = observer.next_rising(ephem.Sun()).datetime()
-        today = datetime.now(timezone.utc)
+        result = None
+        now = self.clock.time()
+        today = datetime.fromtimestamp(now, timezone.utc)
 
         if self.fake_time:
-            ts = (today - datetime(1970, 1, 1)).total_seconds() + self.fake_time
+            ts = now + self.fake_time
             if self.fake_order:
                 self.fake_order = False
-                next_hello_sun = datetime.fromtimestamp(ts)
-                next_goodbye_sun = datetime.fromtimestamp(ts + 1)
+                next_hello_sun = datetime.fromtimestamp(ts, timezone.utc)
+                next_goodbye_sun = datetime.fromtimestamp(ts + 1, timezone.utc)
             else:
                 self.fake_order = True
-                next_goodbye_sun = datetime.fromtimestamp(ts)
-                next_hello_sun = datetime.fromtimestamp(ts + 1)
+                next_goodbye_sun = datetime.fromtimestamp(ts, timezone.utc)
+                next_hello_sun = datetime.fromtimestamp(ts + 1, timezone.utc)
+        else:
+            setting = self.ephemeris.next_setting(now)
+            rising = self.ephemeris.next_rising(now)
+            if setting is None or rising is None:
+                # polar day or night: the door stays as it is
+                logger.warning(f"no sun rise or sun set found, next check in {NO_EVENT_DELAY} seconds")
+                self.timer = self.clock.call_later(NO_EVENT_DELAY, self.automatic_control, first=first)
+                return result
+            next_goodbye_sun = datetime.fromtimestamp(setting + self.delta, timezone.utc)
+            next_hello_sun = datetime.fromtimestamp(rising, timezone.utc)
 
         if next_hello_sun < next_goodbye_sun:
             if first:
                 # in this case, door must be closed
-                self.motor.close_door()
+                result = self.motor.close_door()
             logger.info("next open UTC: " + str(next_hello_sun))
+            door_status.update(next_event='open', next_event_time=next_hello_sun.isoformat())
+            event_bus.publish(SCHEDULE, next_event='open', next_event_time=next_hello_sun.isoformat())
             next_time = (next_hello_sun - today).total_seconds()
-            self.timer = threading.Timer(next_time, self.open_door)
-            self.timer.start()
+            journal.write(SCHEDULE, AUTOMATIC, 'open', duration=next_time)
+            self.timer = self.clock.call_later(next_time, self.open_door)
         else:
             if first:
                 # in this case, door must be opened
-                self.motor.open_door()
+                result = self.motor.open_door()
             logger.info("next close UTC: " + str(next_goodbye_sun))
+            door_status.update(next_event='close', next_event_time=next_goodbye_sun.isoformat())
+            event_bus.publish(SCHEDULE, next_event='close', next_event_time=next_goodbye_sun.isoformat())
             next_time = (next_goodbye_sun - today).total_seconds()
-            self.timer = threading.Timer(next_time, self.close_door)
-            self.timer.start()
+            journal.write(SCHEDULE, AUTOMATIC, 'close', duration=next_time)
+            self.timer = self.clock.call_later(next_time, self.close_door)
+        return result
 
     def open_door(self):
         logger.debug("automatic open door")
         self.motor.open_door()
         # wait at least max_time + delta, if not, next automatic_control
         # should send command to motor if sensor is not reached
-        time.sleep(self.motor.open_timeout + 10)
-        self.automatic_control(first=False)
+        self.timer = self.clock.call_later(self.motor.open_timeout + 10, self.automatic_control, first=False)
 
     def close_door(self):
         logger.debug("automatic close door")
         self.motor.close_door()
-        time.sleep(self.motor.open_timeout + 10)
-        self.automatic_control(first=False)
+        self.timer = self.clock.call_later(self.motor.open_timeout + 10, self.automatic_control, first=False)
 
@@ -0,0 +1,130 @@
+import time
+import logging
+from .door_status import door_status
+
+batch_logger = logging.getLogger('batch')
+
+# conditions of a step, checked after its action
+UNTIL_DONE = 'done'
+UNTIL_OPEN_SENSOR = 'open_sensor'
+UNTIL_CLOSE_SENSOR = 'close_sensor'
+UNTIL_STOPPED = 'stopped'
+UNTIL_ACCEPTED = 'accepted'
+CONDITIONS = {UNTIL_OPEN_SENSOR: lambda: door_status.get('open_sensor') is True,
+              UNTIL_CLOSE_SENSOR: lambda: door_status.get('close_sensor') is True,
+              UNTIL_STOPPED: lambda: not door_status.get('motor_active')}
+
+# default and maximum time of one step, in seconds
+DEFAULT_STEP_TIMEOUT = 60
+MAX_STEP_TIMEOUT = 300
+# maximum number of steps and time of a batch
+MAX_STEPS = 20
+MAX_BATCH_TIME = 600
+
+
+def _wait_condition(condition, timeout) -> bool:
+    """wait until condition is True, each time door status changes
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        etag = door_status.etag()
+        if condition():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        door_status.wait_change(etag, remaining)
+
+
+def _is_number(value) -> bool:
+    # bool is an int, but not a number of seconds
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _check_steps(steps, actions):
+    # the whole batch is refused before its first motor command
+    if not isinstance(steps, list) or not 0 < len(steps) <= MAX_STEPS:
+        raise ValueError(f'steps must be a list of 1 to {MAX_STEPS} steps')
+    for step in steps:
+        if not isinstance(step, dict):
+            raise ValueError('a step must be an object')
+        if 'action' not in step and 'wait' not in step:
+            raise ValueError('a step needs an action or a wait')
+        if 'action' in step and (not isinstance(step['action'], str) or step['action'] not in actions):
+            raise ValueError(f"unknown action: {step['action']!r}")
+        until = step.get('until', UNTIL_DONE)
+        if until not in CONDITIONS and until not in (UNTIL_DONE, UNTIL_ACCEPTED):
+            raise ValueError(f'unknown condition: {until}')
+        for name in ('wait', 'timeout'):
+            if name in step and (not _is_number(step[name]) or step[name] < 0):
+                raise ValueError(f'{name} must be a positive number')
+
+
+def run_batch(request: dict, execute, actions) -> dict:
+    """run the steps of a batch, one after the other
+
+    request looks like:
+        {"steps": [{"action": "force_down", "until": "close_sensor", "timeout": 30},
+                   {"wait": 2},
+                   {"action": "up"}],
+         "stop_on_failure": true}
+    a step waits "wait" seconds, then sends its action and waits for its condition:
+        done (default): the end of the motor run, like open sensor reached
+        open_sensor, close_sensor: the sensor is pressed
+        stopped: the motor is stopped
+        accepted: don't wait
+    a step fails if its action is refused or not active, or if its condition is not reached before timeout
+
+    Args:
+        request (dict): the batch
+        execute: function called with an action name, returns a Job or None if action is not active
+        actions: names of the actions, a batch with another action is malformed
+
+    Raises:
+        ValueError: if request is malformed
+
+    Returns:
+        dict: report of all steps, and success if all steps succeed
+    """
+    if not isinstance(request, dict):
+        raise ValueError('batch must be an object')
+    steps = request.get('steps')
+    _check_steps(steps, actions)
+    stop_on_failure = request.get('stop_on_failure', True)
+
+    start = time.monotonic()
+    deadline = start + MAX_BATCH_TIME
+    report = []
+    success = True
+    for step in steps:
+        step_start = time.monotonic()
+        result = {'action': step.get('action'), 'until': step.get('until', UNTIL_DONE), 'success': True}
+        if 'wait' in step:
+            time.sleep(max(0, min(step['wait'], deadline - time.monotonic())))
+
+        if 'action' in step:
+            timeout = min(step.get('timeout', DEFAULT_STEP_TIMEOUT), MAX_STEP_TIMEOUT,
+                          max(0, deadline - time.monotonic()))
+            job = execute(step['action'])
+            if job is None:
+                result['success'] = False
+                result['error'] = 'action not active'
+            else:
+                until = result['until']
+                if until == UNTIL_DONE:
+                    result['success'] = job.wait(timeout) and bool(job.accepted)
+                elif until != UNTIL_ACCEPTED:
+                    result['success'] = _wait_condition(CONDITIONS[until], timeout)
+                if until != UNTIL_DONE and job.finished() and not job.accepted:
+                    result['success'] = False
+                result['job'] = job.to_dict()
+
+        result['elapsed'] = time.monotonic() - step_start
+        report.append(result)
+        if not result['success']:
+            batch_logger.info(f"batch step failed: {result}")
+            success = False
+            if stop_on_failure:
+                break
+
+    return {'success': success, 'duration': time.monotonic() - start, 'steps': report}
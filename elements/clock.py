@@ -0,0 +1,131 @@
+import heapq
+import itertools
+import threading
+import time
+from .scheduler import scheduler, TimerHandle
+
+
+# -------------------------------------------------
+# Object which gives time and delayed calls to the
+# elements: AutomaticControl, AdvancedMotor,
+# AdvancedButton and WatchDog. This one is the real
+# time, calls are run by the shared scheduler thread
+# -------------------------------------------------
+class Clock:
+    @staticmethod
+    def time() -> float:
+        return time.time()
+
+    @staticmethod
+    def monotonic() -> float:
+        return time.monotonic()
+
+    @staticmethod
+    def call_later(delay, function, *args, **kwargs) -> TimerHandle:
+        return scheduler.call_later(delay, function, *args, **kwargs)
+
+    @staticmethod
+    def call_at(when, function, *args, **kwargs) -> TimerHandle:
+        return scheduler.call_at(when, function, *args, **kwargs)
+
+    @staticmethod
+    def pending() -> int:
+        return scheduler.pending()
+
+
+# -------------------------------------------------
+# Object which simulates time, with the Clock interface.
+# Time only moves forward by advance or run_until:
+# they run the delayed calls in the caller thread, in
+# time order, each one at its own instant. So months
+# of door control are replayed in seconds, and two
+# replays give the same result
+# -------------------------------------------------
+class VirtualClock:
+    def __init__(self, start=None):
+        """virtual clock
+
+        Args:
+            start (float, optional): UTC timestamp of the beginning. Defaults to now.
+        """
+        self._start = time.time() if start is None else start
+        # seconds since start, it is also the monotonic time
+        self._now = 0.0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._active = 0
+        # number of calls done
+        self.calls = 0
+
+    def time(self) -> float:
+        return self._start + self._now
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def call_at(self, when, function, *args, **kwargs) -> TimerHandle:
+        handle = TimerHandle(self, when, function, args, kwargs)
+        with self._lock:
+            heapq.heappush(self._queue, (when, next(self._sequence), handle))
+            self._active += 1
+        return handle
+
+    def call_later(self, delay, function, *args, **kwargs) -> TimerHandle:
+        return self.call_at(self._now + delay, function, *args, **kwargs)
+
+    def pending(self) -> int:
+        return self._active
+
+    def _cancel(self, handle):
+        with self._lock:
+            if handle._cancelled:
+                return
+            handle._cancelled = True
+            if handle.function is not None:
+                self._active -= 1
+
+    def next_call(self):
+        """monotonic time of the next call, None if there is none
+        """
+        with self._lock:
+            while self._queue and self._queue[0][2]._cancelled:
+                heapq.heappop(self._queue)
+            return self._queue[0][0] if self._queue else None
+
+    def run_until(self, when) -> int:
+        """run all calls until monotonic time when, then set time to when
+
+        Returns:
+            int: number of calls done
+        """
+        done = 0
+        while True:
+            with self._lock:
+                if not self._queue or self._queue[0][0] > when:
+                    break
+                call_time, _, handle = heapq.heappop(self._queue)
+                if handle._cancelled:
+                    continue
+                self._active -= 1
+                function, args, kwargs = handle.function, handle.args, handle.kwargs
+                handle.function = handle.args = handle.kwargs = None
+            # a call never goes back in time, like a late timer
+            self._now = max(self._now, call_time)
+            function(*args, **kwargs)
+            done += 1
+        self._now = max(self._now, when)
+        self.calls += done
+        return done
+
+    def advance(self, seconds) -> int:
+        """move time forward, running the calls on the way
+
+        Returns:
+            int: number of calls done
+        """
+        return self.run_until(self._now + seconds)
+
+
+# clock of the elements, when no other one is given
+clock = Clock()
@@ -0,0 +1,101 @@
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+
+# -------------------------------------------------
+# Object which keeps the last known state of the door.
+# It is updated by the elements when something happens
+# (motor, sensors, automatic control, watchdog), so
+# reading it never reads hardware.
+# Each change gives a new ETag, and the JSON snapshot
+# is built once per change
+# -------------------------------------------------
+class DoorStatus:
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._state = {'motor_active': False,
+                       'direction': None,
+                       'open_sensor': None,
+                       'close_sensor': None,
+                       'count_action': 0,
+                       'next_event': None,
+                       'next_event_time': None,
+                       'cpu_temperature': None,
+                       'updated': None}
+        # ETag must change after a restart, even if version starts again from 0
+        self._boot = int(time.time())
+        self._version = 0
+        self._etag = None
+        self._body = None
+        self._listeners = []
+
+    def update(self, **values):
+        """update some fields, and notify waiting clients if one of them changes
+        """
+        with self._condition:
+            changed = False
+            for name, value in values.items():
+                if self._state.get(name) != value:
+                    self._state[name] = value
+                    changed = True
+            if not changed:
+                return
+            self._state['updated'] = datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+            self._version += 1
+            self._etag = None
+            self._body = None
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def get(self, name):
+        with self._condition:
+            return self._state.get(name)
+
+    def etag(self) -> str:
+        with self._condition:
+            if self._etag is None:
+                self._etag = f'"{self._boot}-{self._version}"'
+            return self._etag
+
+    def snapshot(self):
+        """current state
+
+        Returns:
+            tuple: (etag, JSON body as bytes)
+        """
+        with self._condition:
+            if self._body is None:
+                self._body = json.dumps(self._state).encode()
+            return self.etag(), self._body
+
+    def wait_change(self, etag, timeout) -> bool:
+        """wait until state is no more etag
+
+        Args:
+            etag (str): ETag known by the client
+            timeout (float): maximum time to wait, in seconds
+
+        Returns:
+            bool: True if state changed
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self.etag() != etag, timeout)
+
+    def add_listener(self, listener):
+        """listener is called without argument after each change, it must be short
+        """
+        with self._condition:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._condition:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+
+# status shared by all elements
+door_status = DoorStatus()
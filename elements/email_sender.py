@@ -1,17 +1,18 @@
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
-import threading
 import logging
 from elements.format_email_body import *
+from elements.journal import journal, read_new_entries, report_events
+from elements.mail_spool import MailSpool, DEFAULT_DIRECTORY
 
 mail_logger = logging.getLogger('email_sender')
 
 
 # object ready to send an email
 # if password_mail is not included in configuration, used default configured in this file
-# logger used to get current log and rotate
+# messages are saved in a MailSpool, and sent by its thread when network is up
+# door events since last report come from the journal, or from the log if journal is not open
 class EmailSender:
     def __init__(self, configuration, logger):
         self.logger = logger
@@ -38,6 +39,36 @@ class EmailSender:
             # used text report by default
             pass
 
+        self.spool = None
+        if not self.no_active:
+            self.spool = self.__make_spool()
+            self.spool.start()
+
+    def __make_spool(self):
+        try:
+            password = self.configuration["password_mail"]
+            if len(password) == 0:
+                raise KeyError
+        except KeyError:
+            password = "gmail_appli_passwd"
+        try:
+            host = self.configuration['smtp_host']
+        except KeyError:
+            host = "smtp.gmail.com"
+        try:
+            port = self.configuration['smtp_port']
+        except KeyError:
+            port = 587
+        try:
+            starttls = self.configuration['smtp_starttls']
+        except KeyError:
+            starttls = True
+        try:
+            directory = self.configuration['mail_spool']
+        except KeyError:
+            directory = DEFAULT_DIRECTORY
+        return MailSpool(directory, host, port, self.configuration["user_mail"], password, starttls)
+
     def send_message(self, message, subject=None):
         if self.no_active:
             return
@@ -49,40 +80,48 @@ class EmailSender:
         if self.no_active:
             return
 
-        # send message after 10 seconds, to be sure DNS is up
+        # spool sends it as soon as network is up
         body = self.__make_log()
-        timer = threading.Timer(10, self.__send__, args=(body))
-        timer.start()
+        self.__send__(body)
+
+    def flush(self):
+        """send waiting messages now, like when network is back
+        """
+        if self.spool:
+            self.spool.flush()
+
+    def stop(self, timeout=None):
+        """stop sending, waiting messages are sent at next start
+
+        Args:
+            timeout (float, optional): time to send waiting messages. Defaults to None (don't wait).
+        """
+        if self.spool:
+            self.spool.stop(timeout)
 
     def __send__(self, body=None, subject='report'):
         msg = MIMEMultipart()
         msg["From"] = self.configuration["user_mail"]
         msg["To"] = self.configuration["destination_mail"]
 
-        try:
-            password = self.configuration["password_mail"]
-            if len(password) == 0:
-                raise KeyError
-        except KeyError:
-            password = "gmail_appli_passwd"
-        mail_logger.debug("ready to send with passwd : " + password)
-
         timestamp = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
         msg["Subject"] = f'{subject} at {timestamp}'
 
         if body:
             msg.attach(MIMEText(body, "plain"))
-
-            text = msg.as_string()
-            server = smtplib.SMTP("smtp.gmail.com", 587)
-            server.starttls()
-            server.login(msg["From"], password)
-
-            server.sendmail(msg["From"], msg["To"], text)
-            server.quit()
+            try:
+                self.spool.put(msg)
+            except OSError as e:
+                mail_logger.error(f"can't save email in spool: {e}")
 
     def __make_log(self):
-        body = self.logger.get_current_log()
-        if body:
-            body = format_data(body, self.csv_report)
-        return body
+        if journal.path:
+            # door events written since the previous report, whatever the log level
+            checkpoint = LogCheckpoint(journal.path + '.checkpoint')
+            events = list(report_events(read_new_entries(journal.path, checkpoint)))
+            checkpoint.save()
+        else:
+            events = self.logger.get_new_events()
+        if events:
+            return format_events(events, self.csv_report)
+        return None
@@ -0,0 +1,195 @@
+import os
+import struct
+import time
+import logging
+from array import array
+from bisect import bisect_right
+
+logger = logging.getLogger('ephemeris_cache')
+
+# file layout: header (with the location and the first computed instant)
+# then rising instants then setting instants,
+# all instants are UTC timestamps stored as little endian doubles
+MAGIC = b'EPH1'
+HEADER = struct.Struct('<4sdddII')
+DEFAULT_FILE = 'ephemeris.bin'
+# compute one year in a single pass
+DEFAULT_DAYS = 366
+# recompute when the table does not cover at least these seconds
+MINIMUM_COVERAGE = 2 * 86400
+# start slightly before now, so a lookup just after startup is still inside the table
+PAST_MARGIN = 86400
+# a table which doesn't cover the next days (polar day or night) is not computed again before this time
+RECOMPUTE_DELAY = 86400
+
+
+# -------------------------------------------------
+# Object which precomputes sun rise and sun set for
+# one location during one year, and persists them on disk.
+# A lookup is a bisection in a sorted array, so ephem
+# is only needed when the table must be (re)computed:
+# missing file, other location or table too old
+# -------------------------------------------------
+class EphemerisCache:
+    def __init__(self, latitude, longitude, path=DEFAULT_FILE, days=DEFAULT_DAYS):
+        """ephemeris cache
+
+        Args:
+            latitude: latitude, like in configuration file (degrees as string)
+            longitude: longitude, like in configuration file (degrees as string)
+            path (str, optional): file used to persist the table, None to keep it in memory. Defaults to DEFAULT_FILE.
+            days (int, optional): number of days computed in one pass. Defaults to DEFAULT_DAYS.
+        """
+        self.latitude = latitude
+        self.longitude = longitude
+        self.path = path
+        self.days = days
+        self.risings = array('d')
+        self.settings = array('d')
+        self.start = None
+        self.loaded = False
+
+    def _key(self):
+        return float(self.latitude), float(self.longitude)
+
+    def load(self) -> bool:
+        """load table from file
+
+        Returns:
+            bool: True if file exists and was computed for the same location
+        """
+        if not self.path:
+            return False
+        try:
+            with open(self.path, 'rb') as file:
+                header = HEADER.unpack(file.read(HEADER.size))
+                magic, latitude, longitude, start, nb_risings, nb_settings = header
+                if magic != MAGIC or (latitude, longitude) != self._key():
+                    logger.info("ephemeris file for another location, recompute it")
+                    return False
+                risings = array('d')
+                settings = array('d')
+                risings.fromfile(file, nb_risings)
+                settings.fromfile(file, nb_settings)
+        except FileNotFoundError:
+            return False
+        except (OSError, EOFError, struct.error, ValueError) as e:
+            logger.warning(f"can't read ephemeris file {self.path}: {e}")
+            return False
+        self.start = start
+        self.risings = risings
+        self.settings = settings
+        return True
+
+    def save(self):
+        """write table to file, through a temporary file to never leave a partial table
+        """
+        if not self.path:
+            return
+        latitude, longitude = self._key()
+        temporary = self.path + '.tmp'
+        try:
+            with open(temporary, 'wb') as file:
+                file.write(HEADER.pack(MAGIC, latitude, longitude, self.start, len(self.risings), len(self.settings)))
+                self.risings.tofile(file)
+                self.settings.tofile(file)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logger.warning(f"can't write ephemeris file {self.path}: {e}")
+
+    def compute(self, start=None):
+        """compute all rising and setting instants from start during days
+
+        Args:
+            start (float, optional): UTC timestamp. Defaults to now minus PAST_MARGIN.
+        """
+        # ephem is only needed here, not to read the table
+        import ephem
+
+        if start is None:
+            start = time.time() - PAST_MARGIN
+        observer = ephem.Observer()
+        observer.lat, observer.lon = self.latitude, self.longitude
+        sun = ephem.Sun()
+        first = ephem.Date(ephem.Date('1970/1/1') + start / 86400.0)
+        last = first + self.days
+
+        self.start = start
+        self.risings = array('d', self._events(observer.next_rising, sun, first, last))
+        self.settings = array('d', self._events(observer.next_setting, sun, first, last))
+        logger.info(f"ephemeris computed: {len(self.risings)} sun rises, {len(self.settings)} sun sets")
+
+    @staticmethod
+    def _events(next_event, sun, first, last):
+        import ephem
+
+        epoch = ephem.Date('1970/1/1')
+        date = first
+        while date < last:
+            try:
+                event = next_event(sun, start=date)
+            except (ephem.AlwaysUpError, ephem.NeverUpError):
+                # polar day or night, try again the next day
+                date = ephem.Date(date + 1)
+                continue
+            yield (event - epoch) * 86400.0
+            # next event is at least a few hours later
+            date = ephem.Date(event + ephem.hour)
+
+    def _ensure(self, now):
+        if not self.loaded:
+            self.loaded = True
+            if self.load() and self._covers(now):
+                return
+        elif self._covers(now) or self._recent(now):
+            return
+        self.compute(now - PAST_MARGIN)
+        self.save()
+
+    def _recent(self, now):
+        # computed from now - PAST_MARGIN, a new one would find the same events
+        return self.start is not None and 0 <= now - (self.start + PAST_MARGIN) < RECOMPUTE_DELAY
+
+    @staticmethod
+    def _next(events, now):
+        index = bisect_right(events, now)
+        if index < len(events):
+            return events[index]
+        return None
+
+    def _covers(self, now):
+        # clock may be behind the table on a Raspberry without RTC, before NTP synchronization
+        if self.start is None or self.start > now or not self.risings or not self.settings:
+            return False
+        limit = now + MINIMUM_COVERAGE
+        return self.risings[-1] > limit and self.settings[-1] > limit
+
+    def next_rising(self, now=None) -> float:
+        """get next sun rise
+
+        Args:
+            now (float, optional): UTC timestamp. Defaults to current time.
+
+        Returns:
+            float: UTC timestamp of the first sun rise after now, None if there is none in the table (polar night
+                   or day until its end)
+        """
+        if now is None:
+            now = time.time()
+        self._ensure(now)
+        return self._next(self.risings, now)
+
+    def next_setting(self, now=None) -> float:
+        """get next sun set
+
+        Args:
+            now (float, optional): UTC timestamp. Defaults to current time.
+
+        Returns:
+            float: UTC timestamp of the first sun set after now, None if there is none in the table (polar night
+                   or day until its end)
+        """
+        if now is None:
+            now = time.time()
+        self._ensure(now)
+        return self._next(self.settings, now)
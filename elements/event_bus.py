@@ -0,0 +1,110 @@
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+# events kept for a subscriber which doesn't read them, older ones are dropped
+DEFAULT_QUEUE_SIZE = 100
+
+MOTOR_START = 'motor_start'
+MOTOR_STOP = 'motor_stop'
+MOTOR_REVERSE = 'motor_reverse'
+SENSOR_PRESS = 'sensor_press'
+SENSOR_RELEASE = 'sensor_release'
+BUTTON = 'button'
+TEMPERATURE_ALERT = 'temperature_alert'
+SCHEDULE = 'schedule'
+
+
+# events of one subscriber, in a bounded queue
+# notify is called after each new event, without argument. It must be short
+class Subscription:
+    def __init__(self, bus, size=DEFAULT_QUEUE_SIZE, notify=None):
+        self.bus = bus
+        self.queue = deque(maxlen=size)
+        self.dropped = 0
+        self.notify = notify
+        self.ready = threading.Event()
+
+    def put(self, event):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        # deque with maxlen drops the oldest event, never blocks
+        self.queue.append(event)
+        if self.notify:
+            self.notify()
+        else:
+            self.ready.set()
+
+    def get_all(self) -> list:
+        """get and remove all waiting events
+        """
+        self.ready.clear()
+        events = []
+        while True:
+            try:
+                events.append(self.queue.popleft())
+            except IndexError:
+                return events
+
+    def wait(self, timeout=None) -> bool:
+        """wait for an event, only when notify is not set
+
+        Returns:
+            bool: True if an event is ready
+        """
+        return bool(self.queue) or self.ready.wait(timeout)
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+# -------------------------------------------------
+# Object which dispatches door events (motor, sensors,
+# buttons, temperature, schedule) to subscribers, like
+# the /events http stream. publish is called from GPIO
+# callbacks: it never waits for a subscriber
+# -------------------------------------------------
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = ()
+        self._sequence = itertools.count(1)
+
+    def subscribe(self, size=DEFAULT_QUEUE_SIZE, notify=None) -> Subscription:
+        subscription = Subscription(self, size, notify)
+        with self._lock:
+            self._subscribers = self._subscribers + (subscription, )
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers = tuple(current for current in self._subscribers if current is not subscription)
+
+    def publish(self, kind, **data):
+        """send an event to all subscribers
+
+        Args:
+            kind (str): type of event, like MOTOR_START
+            data: content of the event
+        """
+        # tuple is replaced, never modified, so no lock to read it
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+        event = (next(self._sequence), kind, time.time(), data)
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+def format_event(event) -> bytes:
+    """format an event for a Server-Sent Events stream
+    """
+    identifier, kind, timestamp, data = event
+    content = dict(data, time=timestamp)
+    return f'id: {identifier}\nevent: {kind}\ndata: {json.dumps(content)}\n\n'.encode()
+
+
+# bus shared by all elements
+event_bus = EventBus()
@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import atexit
+import signal
+import itertools
+import threading
+import logging
+from datetime import datetime
+from operator import itemgetter
+
+logger = logging.getLogger('flight_recorder')
+
+DEFAULT_FILE = 'flight_recorder.txt'
+# events kept, rounded up to a power of two
+DEFAULT_SIZE = 4096
+# failure dumps kept: file, file.1, file.2
+KEEP = 3
+# dump at exit or on demand (SIGUSR1), one file which never replaces a failure dump
+LAST_SUFFIX = '.last'
+
+# events, with the meaning of their two values
+EVENT_ACTION = 'action'               # open (True) or close, count of actions
+EVENT_TOO_MANY_ACTIONS = 'too_many'   # count of actions
+EVENT_SENSOR = 'sensor'               # 'open' or 'close', pressed (True) or released
+EVENT_MOTOR = 'motor'                 # 'forward', 'backward', 'reverse' or 'stop', reason of stop
+EVENT_REFUSED = 'refused'             # 'open' or 'close', count of actions
+EVENT_COMMAND = 'command'             # command of MotorCommandQueue, 'queued', 'coalesced', 'running' or 'executed'
+EVENT_BUTTON = 'button'               # gpio, press duration in ms (None when pressed)
+
+
+# -------------------------------------------------
+# Object which keeps the last debug events in memory,
+# whatever the log level, and writes them to a file when
+# something goes wrong: unhandled exception, safety
+# timeout. At exit (without failure before) and on
+# SIGUSR1, they go to file.last. The buffer is allocated once,
+# an event is a tuple put in the next slot, without lock
+# (the counter is atomic), so record costs a few hundred
+# nanoseconds and can be called from GPIO callbacks
+# -------------------------------------------------
+class FlightRecorder:
+    def __init__(self, size=DEFAULT_SIZE):
+        self._allocate(size)
+        self.path = None
+        self.dumps = 0
+        # a failure was dumped by this process, the exit dump is not needed
+        self.failure_dumped = False
+        self._lock = threading.Lock()
+        self._previous_excepthook = None
+        self._previous_threading_excepthook = None
+
+    def _allocate(self, size):
+        size = 1 << max(0, size - 1).bit_length()
+        self._events = [None] * size
+        self._mask = size - 1
+        self._counter = itertools.count()
+
+    @property
+    def size(self) -> int:
+        return len(self._events)
+
+    def record(self, event, first=None, second=None):
+        """keep an event
+
+        Args:
+            event (str): EVENT_ACTION, EVENT_SENSOR, EVENT_MOTOR...
+            first (optional): first value, a number or a short string
+            second (optional): second value, a number or a short string
+        """
+        self._events[next(self._counter) & self._mask] = (time.monotonic_ns(), event, first, second)
+
+    def snapshot(self) -> list:
+        """events kept, the oldest first
+        """
+        return sorted((event for event in list(self._events) if event is not None), key=itemgetter(0))
+
+    def install(self, path=DEFAULT_FILE, size=None):
+        """dump events to path on unhandled exception, SIGUSR1 and exit
+
+        Args:
+            path (str, optional): dump file. Defaults to DEFAULT_FILE.
+            size (int, optional): events kept, None to keep the current size. Defaults to None.
+        """
+        if size and size != self.size:
+            # events recorded before are lost
+            self._allocate(size)
+        self.path = path
+        if self._previous_excepthook is None:
+            self._previous_excepthook = sys.excepthook
+            self._previous_threading_excepthook = threading.excepthook
+            sys.excepthook = self._excepthook
+            threading.excepthook = self._threading_excepthook
+            atexit.register(self._exit)
+        try:
+            signal.signal(signal.SIGUSR1, self._signal)
+        except ValueError:
+            # not in main thread
+            logger.warning("SIGUSR1 can't dump flight recorder, not installed from main thread")
+
+    def dump(self, reason, background=False, failure=True):
+        """write the events kept to the dump file, previous failure dumps are kept in file.1, file.2
+
+        Args:
+            reason (str): written at the top of the dump
+            background (bool, optional): write from a new thread, events are copied before. Defaults to False.
+            failure (bool, optional): False at exit or on demand, written in file.last. Defaults to True.
+        """
+        if not self.path:
+            return
+        if failure:
+            self.failure_dumped = True
+        events = self.snapshot()
+        if background:
+            threading.Thread(target=self._write, args=(reason, events, failure), name='flight_recorder',
+                             daemon=True).start()
+        else:
+            self._write(reason, events, failure)
+
+    def _write(self, reason, events, failure=True):
+        # monotonic to wall time
+        offset = time.time() - time.monotonic_ns() / 1e9
+        path = self.path if failure else self.path + LAST_SUFFIX
+        with self._lock:
+            try:
+                for index in range(KEEP - 1, 0, -1) if failure else ():
+                    previous = path if index == 1 else f'{path}.{index - 1}'
+                    if os.path.exists(previous):
+                        os.replace(previous, f'{path}.{index}')
+                with open(path, 'w') as file:
+                    file.write(f'# {datetime.now().strftime("%Y/%m/%d %H:%M:%S")} {reason}, '
+                               f'{len(events)} events\n')
+                    for stamp, event, first, second in events:
+                        moment = datetime.fromtimestamp(offset + stamp / 1e9)
+                        file.write(f'{moment.strftime("%Y/%m/%d %H:%M:%S.%f")} {event} {first} {second}\n')
+                self.dumps += 1
+            except OSError as e:
+                logger.error(f"can't write flight recorder {path}: {e}")
+
+    def _exit(self):
+        # the failure dump has the last events already
+        if not self.failure_dumped:
+            self.dump('exit', failure=False)
+
+    def _signal(self, signum, frame):
+        self.dump('SIGUSR1', background=True, failure=False)
+
+    def _excepthook(self, kind, value, traceback):
+        self.dump(f'unhandled exception {kind.__name__}: {value}')
+        self._previous_excepthook(kind, value, traceback)
+
+    def _threading_excepthook(self, arguments):
+        self.dump(f'unhandled exception in {arguments.thread.name if arguments.thread else "thread"} '
+                  f'{arguments.exc_type.__name__}: {arguments.exc_value}')
+        self._previous_threading_excepthook(arguments)
+
+
+# recorder shared by all elements
+flight_recorder = FlightRecorder()
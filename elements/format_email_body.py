@@ -1,36 +1,290 @@
+import glob
+import gzip
+import heapq
+import json
+import os
 import re
+import logging
+from operator import itemgetter
 
 
-open_close_actions = re.compile(r'(^[^,]+).*advanced_elements.*(INFO).*(close|open) door$')
-warning_messages = re.compile(r'(^[^,]+).*advanced_elements.*(WARNING|ERROR) - (.*)')
+# open/close actions and warning messages in one pattern, only tried on lines which contain LOGGER_NAME
+door_events = re.compile(r'(^[^,]+).*advanced_elements.*(?:(INFO).*(close|open) door$|(WARNING|ERROR) - (.*))')
+LOGGER_NAME = 'advanced_elements'
+LOGGER_NAME_BYTES = LOGGER_NAME.encode()
+# date at the beginning of each record, the lines of a traceback have none
+log_date = re.compile(r'^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}')
+# compressed backups, see CompressedRotatingFileHandler
+COMPRESSED_SUFFIX = '.gz'
+# bytes at the beginning of a file, to recognize it
+HEAD_SIZE = 64
 
+parser_logger = logging.getLogger('format_email_body')
 
-def format_data(log_content, csv=False):
-    found_data = {}
+
+def parse_line(line):
+    """get event of a log line
+
+    Args:
+        line (str): line of log file
+
+    Returns:
+        tuple: (date, level, message), None if line is not a door event
+    """
+    if LOGGER_NAME not in line:
+        return None
+    found = door_events.match(line)
+    if not found:
+        return None
+    date, info, action, level, message = found.groups()
+    if info:
+        return date, info, action
+    return date, level, message
+
+
+# -------------------------------------------------
+# position in the log file already parsed, saved in a file.
+# inode and the first bytes (head) of the file find it
+# after a rotation, even compressed, and detect a new
+# file which got the same inode. The date of the last
+# event read finds the next ones in the backups, when
+# the log rotated more than once since
+# -------------------------------------------------
+class LogCheckpoint:
+    def __init__(self, path=None):
+        self.path = path
+        self.inode = None
+        self.offset = 0
+        self.head = b''
+        self.date = ''
+        self.load()
+
+    def load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r') as file:
+                data = json.loads(file.read())
+            self.inode = data['inode']
+            self.offset = data['offset']
+            self.head = data.get('head', '').encode('latin-1')
+            self.date = data.get('date', '')
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            self.inode = None
+            self.offset = 0
+            self.head = b''
+            self.date = ''
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'w') as file:
+                file.write(json.dumps({'inode': self.inode, 'offset': self.offset,
+                                       'head': self.head.decode('latin-1'), 'date': self.date}))
+        except OSError as e:
+            parser_logger.warning(f"can't save checkpoint {self.path}: {e}")
+
+    def is_file(self, path, inode=None) -> bool:
+        """check if path is the file of checkpoint
+
+        Args:
+            path (str): file, compressed or not
+            inode (int, optional): inode of path, None when it can't be compared. Defaults to None.
+        """
+        if self.inode is None or (inode is not None and inode != self.inode):
+            return False
+        try:
+            with open_log_file(path, 'rb') as file:
+                head = file.read(HEAD_SIZE)
+        except (OSError, EOFError):
+            return False
+        # head was read when file was maybe shorter
+        return head.startswith(self.head)
+
+
+def _read_lines(path, offset, checkpoint):
+    """yield complete lines of path from offset, and move checkpoint after each one
+    """
+    with open_log_file(path, 'rb') as file:
+        checkpoint.inode = os.fstat(file.fileno()).st_ino
+        checkpoint.head = file.read(HEAD_SIZE)
+        file.seek(offset)
+        checkpoint.offset = offset
+        for line in file:
+            if not line.endswith(b'\n'):
+                # line not yet fully written, read it next time
+                break
+            checkpoint.offset += len(line)
+            # filter before decoding, most lines are not door events
+            if LOGGER_NAME_BYTES in line:
+                line = line.decode(errors='replace')
+                found = log_date.match(line)
+                if found:
+                    checkpoint.date = found.group(0)
+                yield line
+
+
+def _history_lines(log_file, checkpoint):
+    """yield lines of the backups of log_file dated after the last event of checkpoint, and move its date
+    """
+    since = checkpoint.date
+    for line in iter_log_lines(log_file, live=False):
+        found = log_date.match(line)
+        if found is None or found.group(0) <= since:
+            continue
+        if LOGGER_NAME in line:
+            checkpoint.date = found.group(0)
+            yield line
+
+
+def iter_new_events(log_file, checkpoint):
+    """yield door events of lines not yet parsed, reading one line at a time.
+    If the log was rotated since checkpoint, end of the rotated file (log_file.1,
+    maybe compressed) is read first. If it rotated more than once, or for the first
+    report, the events of all backups (see iter_log_lines) newer than the last one
+    read are first
+
+    Args:
+        log_file (str): log file
+        checkpoint (LogCheckpoint): updated while reading, save it when done
+
+    Returns:
+        generator: (date, level, message) of each event
+    """
+    sources = []
+    history = None
+    try:
+        inode = os.stat(log_file).st_ino
+    except FileNotFoundError:
+        return
+    if checkpoint.is_file(log_file, inode):
+        offset = checkpoint.offset
+        if os.path.getsize(log_file) < offset:
+            # file truncated
+            offset = 0
+    else:
+        offset = 0
+        rotated = log_file + '.1'
+        try:
+            if checkpoint.is_file(rotated, os.stat(rotated).st_ino):
+                sources.append((rotated, checkpoint.offset))
+        except FileNotFoundError:
+            if os.path.exists(rotated + COMPRESSED_SUFFIX) and checkpoint.is_file(rotated + COMPRESSED_SUFFIX):
+                sources.append((rotated + COMPRESSED_SUFFIX, checkpoint.offset))
+        if not sources:
+            # file of checkpoint is gone: its next lines are in the backups
+            history = _history_lines(log_file, checkpoint)
+    sources.append((log_file, offset))
+
+    if history is not None:
+        for line in history:
+            event = parse_line(line)
+            if event:
+                yield event
+    for path, start in sources:
+        try:
+            for line in _read_lines(path, start, checkpoint):
+                event = parse_line(line)
+                if event:
+                    yield event
+        except FileNotFoundError:
+            continue
+
+
+def open_log_file(path, mode='r'):
+    """open a log file, or a compressed backup
+
+    Args:
+        path (str): file
+        mode (str, optional): 'r' for text, 'rb' for bytes. Defaults to 'r'.
+    """
+    if path.endswith(COMPRESSED_SUFFIX):
+        if mode == 'r':
+            return gzip.open(path, 'rt', errors='replace')
+        return gzip.open(path, mode)
+    if mode == 'r':
+        return open(path, mode, errors='replace')
+    return open(path, mode)
+
+
+def log_files(log_file) -> list:
+    """log file and its backups, compressed or not, the oldest first
+    """
+    backups = {}
+    suffix = re.compile(r'\.(\d+)(' + re.escape(COMPRESSED_SUFFIX) + ')?$')
+    for path in glob.glob(glob.escape(log_file) + '.*'):
+        found = suffix.match(path[len(log_file):])
+        if found:
+            index = int(found.group(1))
+            # during its compression, a backup exists twice: keep the plain one
+            if index not in backups or not found.group(2):
+                backups[index] = path
+    # log_file.5 is older than log_file.1
+    files = [backups[index] for index in sorted(backups, reverse=True)]
+    if os.path.exists(log_file):
+        files.append(log_file)
+    return files
+
+
+def _dated_lines(path):
+    """yield (date, line) of a file, lines without date get the date of the previous one
+    """
+    date = ''
+    try:
+        with open_log_file(path) as file:
+            for line in file:
+                found = log_date.match(line)
+                if found:
+                    date = found.group(0)
+                yield date, line
+    except (FileNotFoundError, EOFError, gzip.BadGzipFile) as e:
+        # backup removed or compressed during the read
+        parser_logger.debug(f"stop reading {path}: {e}")
+
+
+def iter_log_lines(log_file, live=True):
+    """yield lines of the log file and all its backups, in chronological order.
+    Files are read together one line at a time and merged on the date of the lines
+
+    Args:
+        log_file (str): log file
+        live (bool, optional): False to read only the backups. Defaults to True.
+
+    Returns:
+        generator: each line
+    """
+    files = log_files(log_file)
+    if not live and files and files[-1] == log_file:
+        files.pop()
+    # with the same date, heapq.merge keeps the order of files: the oldest first
+    for _, line in heapq.merge(*(_dated_lines(path) for path in files), key=itemgetter(0)):
+        yield line
+
+
+def format_events(events, csv=False):
+    """format door events
+
+    Args:
+        events: iterable of (date, level, message)
+        csv (bool, optional): csv instead of text table. Defaults to False.
+
+    Returns:
+        str: one line per event, sorted by date
+    """
+    found_data = []
     max_size_level = 0
     max_size_message = 0
 
-    for line in log_content:
-        found = open_close_actions.findall(line)
-        if found:
-            date = found[0][0]
-            level = found[0][1]
-            message = found[0][2]
-            if len(level) > max_size_level:
-                max_size_level = len(level)
-            if len(message) > max_size_message:
-                max_size_message = len(message)
-            found_data[date] = [level, message]
-        found = warning_messages.findall(line)
-        if found:
-            date = found[0][0]
-            level = found[0][1]
-            message = found[0][2]
-            if len(level) > max_size_level:
-                max_size_level = len(level)
-            if len(message) > max_size_message:
-                max_size_message = len(message)
-            found_data[date] = [level, message]
+    for date, level, message in events:
+        if len(level) > max_size_level:
+            max_size_level = len(level)
+        if len(message) > max_size_message:
+            max_size_message = len(message)
+        found_data.append((date, level, message))
+
+    # stable sort, events with the same date keep their order
+    found_data.sort(key=lambda event: event[0])
 
     if csv:
         formatted_data = __csv_format__(found_data)
@@ -40,6 +294,11 @@ def format_data(log_content, csv=False):
     return '\n'.join(formatted_data)
 
 
+def format_data(log_content, csv=False):
+    events = (event for event in map(parse_line, log_content) if event)
+    return format_events(events, csv)
+
+
 def __get_space(word, max_size):
     if len(word) == max_size:
         return ""
@@ -52,9 +311,7 @@ def __str_format__(found_data, max_level=4, max_message=5):
     formatted_data = []
 
     if len(found_data) > 0:
-        for date in sorted(found_data.keys()):
-            level = found_data[date][0]
-            message = found_data[date][1]
+        for date, level, message in found_data:
             formatted_message = '| ' + date + ' | ' + level
             formatted_message += __get_space(level, max_level) + ' | ' + message
             formatted_message += __get_space(message, max_message) + ' |'
@@ -67,9 +324,7 @@ def __csv_format__(found_data):
     formatted_data = []
 
     if len(found_data) > 0:
-        for date in sorted(found_data.keys()):
-            level = found_data[date][0]
-            message = found_data[date][1]
+        for date, level, message in found_data:
             formatted_data.append(date + ';' + level + ';' + message)
 
     return formatted_data
@@ -77,7 +332,5 @@ def __csv_format__(found_data):
 
 # just for test
 if __name__ == "__main__":
-    with open('/tmp/automatic_door.log', 'r') as file:
-        data = file.readlines()
-        result = format_data(data, False)
-        print(result)
+    import sys
+    print(format_data(iter_log_lines(sys.argv[1] if len(sys.argv) > 1 else '/tmp/automatic_door.log'), False))
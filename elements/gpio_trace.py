@@ -0,0 +1,142 @@
+import os
+import json
+import threading
+import logging
+from .clock import clock as default_clock
+from .event_bus import SENSOR_PRESS, SENSOR_RELEASE
+
+logger = logging.getLogger('gpio_trace')
+
+# file layout: JSON lines. The first one is the header: version, wall time of the beginning,
+# configuration of the door and state of the sensors. Then one record per line:
+# [seconds since the beginning (monotonic), kind, source, value]
+VERSION = 1
+
+# inputs: edges of buttons (source is the GPIO) and sensors (source is 'open' or 'close'), http actions
+BUTTON_PRESS = 'button_press'
+BUTTON_RELEASE = 'button_release'
+HTTP = 'http'
+INPUTS = (BUTTON_PRESS, BUTTON_RELEASE, SENSOR_PRESS, SENSOR_RELEASE, HTTP)
+# outputs: commands sent to the motor, source is 'motor'
+MOTOR_COMMAND = 'motor'
+COMMAND_FORWARD = 'forward'
+COMMAND_BACKWARD = 'backward'
+COMMAND_REVERSE = 'reverse'
+COMMAND_STOP = 'stop'
+
+# configuration needed to build the same elements again
+CONFIGURATION_KEYS = ('motor_button_gpio', 'motor_forward_gpio', 'motor_backward_gpio', 'door_closed_gpio',
+                      'door_opened_gpio', 'open_timeout', 'close_timeout', 'longitude', 'latitude', 'security_time')
+
+
+# -------------------------------------------------
+# Object which records every GPIO edge, http action and
+# motor command, to replay a field incident with
+# simulator.replay. Records go to a file (one line
+# written at once, events are seconds apart) or, to
+# replay, to memory. Nothing is recorded until open or
+# capture is called
+# -------------------------------------------------
+class GpioTrace:
+    def __init__(self):
+        self.path = None
+        self.records = None
+        self._file = None
+        self._clock = default_clock
+        self._start = 0
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self._file is not None or self.records is not None
+
+    def open(self, path, configuration, sensors):
+        """start a trace file, the trace of the previous start is kept in path.1
+
+        Args:
+            path (str): trace file
+            configuration (dict): configuration of the door, like chicken.json
+            sensors (dict): 'open' and 'close' sensors pressed or not, at the beginning
+        """
+        self.close()
+        header = {'version': VERSION, 'time': default_clock.time(), 'sensors': sensors,
+                  'configuration': {key: configuration[key] for key in CONFIGURATION_KEYS if key in configuration}}
+        try:
+            if os.path.exists(path):
+                os.replace(path, path + '.1')
+            trace_file = open(path, 'w', buffering=1)
+            trace_file.write(json.dumps(header) + '\n')
+        except OSError as e:
+            logger.error(f"can't open gpio trace {path}: {e}")
+            return
+        self._clock = default_clock
+        self._start = default_clock.monotonic()
+        self.path = path
+        self._file = trace_file
+
+    def capture(self, clock=None) -> list:
+        """record in memory instead of a file
+
+        Args:
+            clock (optional): clock of the records, like a VirtualClock. Defaults to the real clock.
+
+        Returns:
+            list: records, filled until close
+        """
+        self.close()
+        self._clock = clock if clock else default_clock
+        self._start = self._clock.monotonic()
+        self.records = []
+        return self.records
+
+    def record(self, kind, source, value=None):
+        """add a record
+
+        Args:
+            kind (str): BUTTON_PRESS, SENSOR_PRESS, HTTP, MOTOR_COMMAND...
+            source: GPIO of a button, 'open' or 'close' sensor, 'motor'...
+            value (optional): action of HTTP, command of MOTOR_COMMAND. Defaults to None.
+        """
+        if self._file is None and self.records is None:
+            return
+        entry = (round(self._clock.monotonic() - self._start, 6), kind, source, value)
+        with self._lock:
+            if self.records is not None:
+                self.records.append(entry)
+            elif self._file is not None:
+                try:
+                    self._file.write(json.dumps(entry) + '\n')
+                except OSError as e:
+                    logger.error(f"can't write gpio trace: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = None
+            self.path = None
+            self.records = None
+
+
+def load(path) -> tuple:
+    """read a trace file
+
+    Returns:
+        tuple: (header, list of records)
+    """
+    with open(path, 'r') as file:
+        header = json.loads(file.readline())
+        if header.get('version') != VERSION:
+            raise ValueError(f"{path}: unknown trace version {header.get('version')}")
+        records = []
+        for line in file:
+            try:
+                records.append(tuple(json.loads(line)))
+            except ValueError:
+                # last line not complete, after a power cut
+                break
+    return header, records
+
+
+# trace shared by all elements
+gpio_trace = GpioTrace()
@@ -1,8 +1,15 @@
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+import json
 import threading
 import time
 import logging
+from .door_status import door_status
+from .event_bus import event_bus, format_event
+from .jobs import jobs, ERROR
+from .batch import run_batch
+from .metrics import registry, histogram, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .gpio_trace import gpio_trace, HTTP
 
 
 UP = 'up'
@@ -10,8 +17,20 @@ DOWN = 'down'
 FORCE_UP = 'force_up'
 FORCE_DOWN = 'force_down'
 
+STATUS_PATH = '/status'
+EVENTS_PATH = '/events'
+JOBS_PATH = '/jobs/'
+BATCH_PATH = '/batch'
+METRICS_PATH = '/metrics'
+# comment sent on an idle event stream, to detect closed connections
+PING_PERIOD = 15
+# maximum time a client can wait for a status change or a command result, in seconds
+MAX_WAIT = 60
+
 http_logger = logging.getLogger('http_server')
 
+http_request_seconds = histogram('door_http_request_seconds', 'Time to answer http requests', ('action', ))
+
 
 def open_door():
     http_logger.warning("open door not initialized")
@@ -68,41 +87,307 @@ def update_function(name: str, function: str =None) -> bool:
         return False
 
 
+def execute_command(token: str, authorization: str, body: bytes) -> tuple:
+    """check authorization and launch action found in body. Used by all servers
+
+    Args:
+        token (str): authentication token
+        authorization (str): Authorization header of the request
+        body (bytes): body of the request, like action=up
+
+    Returns:
+        tuple: (http status, Job which follows the command or None if refused)
+    """
+    if not authorization or authorization != token:
+        return 401, None
+
+    data = parse_qs(body.decode(errors='replace'))
+
+    try:
+        action = data['action'][0]
+    except KeyError:
+        return 400, None
+
+    job = execute_action(action)
+    if job is None:
+        return 400, None
+    return 200, job
+
+
+def execute_action(action: str):
+    """launch an action
+
+    Args:
+        action (str): the name of action, UP, DOWN, FORCE_UP, FORCE_DOWN
+
+    Returns:
+        Job: which follows the command, None if action is unknown
+    """
+    gpio_trace.record(HTTP, 'http', action)
+    command = get_command(action)
+
+    if command is None:
+        return None
+
+    job = jobs.create(action)
+    try:
+        job.follow(command())
+    except Exception:
+        http_logger.exception(f"action {action} failed")
+        job.finish(False, ERROR)
+    return job
+
+
+def execute_batch(token: str, authorization: str, body: bytes):
+    """check authorization and run all steps of a JSON batch, see run_batch. Blocks until the end of the batch
+
+    Returns:
+        tuple: (http status, headers, body)
+    """
+    if not authorization or authorization != token:
+        return 401, None, b''
+    try:
+        report = run_batch(json.loads(body), execute_action, actions)
+    except (ValueError, TypeError) as e:
+        # json.JSONDecodeError is a ValueError
+        return 400, {'Content-Type': 'text/plain'}, str(e).encode()
+    return 200, {'Content-Type': 'application/json'}, json.dumps(report).encode()
+
+
+def command_answer(status: int, job=None, wait: float = 0):
+    """build answer of a command
+
+    Args:
+        status (int): status given by execute_command
+        job (Job, optional): job given by execute_command. Defaults to None.
+        wait (float, optional): time the client waited for the result. Defaults to 0.
+
+    Returns:
+        tuple: (http status, headers, body)
+    """
+    if job is None:
+        return status, None, b''
+    if wait and not job.finished():
+        # result not yet known, client can read it later
+        status = 202
+    return status, {'Content-Type': 'application/json', 'Location': JOBS_PATH + job.id}, job.to_json()
+
+
+def read_job(path: str):
+    """build answer of GET /jobs/<id>
+
+    Returns:
+        tuple: (http status, headers, body)
+    """
+    job = jobs.get(path[len(JOBS_PATH):])
+    if job is None:
+        return 404, None, b''
+    return 200, {'Content-Type': 'application/json', 'Cache-Control': 'no-cache'}, job.to_json()
+
+
+def get_wait(query: str) -> float:
+    """read wait parameter of a request
+
+    Args:
+        query (str): query of the url, like wait=30
+
+    Raises:
+        ValueError: if wait is not a number
+
+    Returns:
+        float: seconds to wait, between 0 and MAX_WAIT
+    """
+    try:
+        wait = float(parse_qs(query)['wait'][0])
+    except KeyError:
+        return 0
+    if wait != wait:
+        # NaN
+        raise ValueError('wait is not a number')
+    return min(max(wait, 0), MAX_WAIT)
+
+
+def read_metrics():
+    """build answer of GET /metrics, all metrics in Prometheus text format
+
+    Returns:
+        tuple: (http status, headers, body)
+    """
+    return 200, {'Content-Type': METRICS_CONTENT_TYPE, 'Cache-Control': 'no-cache'}, registry.expose()
+
+
+def request_action(method: str, path: str, body: bytes = b'') -> str:
+    """name of a request for metrics: the command of a POST, or the resource of a GET.
+    Unknown names are grouped, so there are not too many labels
+    """
+    if path == BATCH_PATH:
+        return 'batch'
+    if method == 'POST':
+        try:
+            action = parse_qs(body.decode(errors='replace'))['action'][0]
+        except KeyError:
+            return 'unknown'
+        return action if get_command(action) is not None else 'unknown'
+    if path.startswith(JOBS_PATH):
+        return 'jobs'
+    if path in (STATUS_PATH, EVENTS_PATH, METRICS_PATH):
+        return path[1:]
+    return 'unknown'
+
+
+def observe_request(method: str, path: str, body: bytes, start: float):
+    """record time of a request started at start (time.monotonic)
+    """
+    http_request_seconds.labels(request_action(method, urlparse(path).path, body)).observe(time.monotonic() - start)
+
+
+def events_headers() -> dict:
+    return {'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'}
+
+
+def format_dropped(subscription, dropped) -> bytes:
+    """comment to tell an event stream client that some events were dropped since last call
+    """
+    if subscription.dropped == dropped:
+        return b''
+    return f': {subscription.dropped - dropped} events dropped\n\n'.encode()
+
+
+def read_status(if_none_match: str = None):
+    """build answer of GET /status, from the cached door status
+
+    Args:
+        if_none_match (str, optional): If-None-Match header of the request. Defaults to None.
+
+    Returns:
+        tuple: (http status, headers, body)
+    """
+    etag, body = door_status.snapshot()
+    if if_none_match == etag:
+        return 304, {'ETag': etag}, b''
+    return 200, {'ETag': etag, 'Content-Type': 'application/json', 'Cache-Control': 'no-cache'}, body
+
+
 class CommandRequestHandler(BaseHTTPRequestHandler):
     def __init__(self, *args, token: str = None, **kwargs):
         self.token = token
         super().__init__(*args, **kwargs)
 
     def do_POST(self):
+        start = time.monotonic()
+        body = b''
+        try:
+            body = self._post()
+        finally:
+            observe_request('POST', self.path, body, start)
+
+    def _post(self) -> bytes:
         auth_header = self.headers.get('Authorization')
         if not auth_header or auth_header != self.token:
             self.send_response(401)
             self.end_headers()
-            return
+            return b''
+
+        url = urlparse(self.path)
+        try:
+            wait = get_wait(url.query)
+        except ValueError:
+            self.send_answer(400)
+            return b''
 
         content_length = int(self.headers.get('Content-Length', 0))
         post_data = self.rfile.read(content_length)
-        data = parse_qs(post_data.decode())
-
+        if url.path == BATCH_PATH:
+            self.send_answer(*execute_batch(self.token, auth_header, post_data))
+            return post_data
+        status, job = execute_command(self.token, auth_header, post_data)
+        # wait for the final result of the command, like door opened
+        if job and wait:
+            job.wait(wait)
+        self.send_answer(*command_answer(status, job, wait))
+        return post_data
+
+    def do_GET(self):
+        start = time.monotonic()
+        if urlparse(self.path).path == EVENTS_PATH:
+            # a stream lasts until the client leaves, its time is not recorded
+            self._get()
+            return
         try:
-            action = data['action'][0]
-        except KeyError:
-            self.send_response(400)
-            self.end_headers()
+            self._get()
+        finally:
+            observe_request('GET', self.path, b'', start)
+
+    def _get(self):
+        url = urlparse(self.path)
+        if url.path not in (STATUS_PATH, EVENTS_PATH, METRICS_PATH) and not url.path.startswith(JOBS_PATH):
+            self.send_answer(404)
             return
 
-        command = get_command(action)
+        auth_header = self.headers.get('Authorization')
+        if not auth_header or auth_header != self.token:
+            self.send_answer(401)
+            return
 
-        if command is not None:
-            thread = threading.Timer(0.5, command)
-            thread.start()
-            self.send_response(200)
-            self.end_headers()
-        else:
-            self.send_response(400)
-            self.end_headers()
+        if url.path == EVENTS_PATH:
+            self.send_events()
+            return
+
+        if url.path.startswith(JOBS_PATH):
+            self.send_answer(*read_job(url.path))
+            return
+
+        if url.path == METRICS_PATH:
+            self.send_answer(*read_metrics())
+            return
+
+        try:
+            wait = get_wait(url.query)
+        except ValueError:
+            self.send_answer(400)
             return
 
+        # long polling: client already knows current state, wait for the next one
+        if_none_match = self.headers.get('If-None-Match')
+        if wait and if_none_match == door_status.etag():
+            door_status.wait_change(if_none_match, wait)
+        self.send_answer(*read_status(if_none_match))
+
+    def send_events(self):
+        """Server-Sent Events stream, until client closes connection
+        """
+        self.send_response(200)
+        for name, value in events_headers().items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.close_connection = True
+        subscription = event_bus.subscribe()
+        dropped = 0
+        try:
+            while True:
+                if subscription.wait(PING_PERIOD):
+                    data = format_dropped(subscription, dropped)
+                    dropped = subscription.dropped
+                    data += b''.join(format_event(event) for event in subscription.get_all())
+                else:
+                    data = b': ping\n\n'
+                self.wfile.write(data)
+                self.wfile.flush()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            subscription.close()
+
+    def send_answer(self, status, headers=None, body=b''):
+        self.send_response(status)
+        if headers:
+            for name, value in headers.items():
+                self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
 
 class ApiHttpServer:
     def __init__(self, port: str, token: str, up = None, down = None, force_up = None, force_down = None):
@@ -128,7 +413,8 @@ class ApiHttpServer:
 
     def start(self):
         handler = lambda *args, **kwargs: CommandRequestHandler(*args, token=self.token, **kwargs)
-        self.server = HTTPServer(('localhost', self.port), handler)
+        # one thread per request, a long polling client must not block the others
+        self.server = ThreadingHTTPServer(('localhost', self.port), handler)
         self.is_running = True
         self.thread = threading.Thread(target=self._run_server)
         # stop thread when main program is stopped
@@ -137,12 +423,13 @@ class ApiHttpServer:
         self.thread.start()
 
     def _run_server(self):
-        while self.is_running:
-            self.server.handle_request()
+        self.server.serve_forever()
 
     def stop(self):
         self.is_running = False
         if self.server:
+            # wake up serve_forever, handle_request would wait for a last request
+            self.server.shutdown()
             self.server.server_close()
         if self.thread:
             self.thread.join()
@@ -0,0 +1,151 @@
+import itertools
+import json
+import threading
+import time
+import concurrent.futures
+from collections import OrderedDict
+
+# recent jobs kept, the least recently used is forgotten first
+DEFAULT_SIZE = 100
+
+# outcome of a job, when no motor run gives it (see MotorRun)
+REFUSED = 'refused'
+CANCELLED = 'cancelled'
+ERROR = 'error'
+DONE = 'done'
+
+
+# one command sent by http, followed until its final outcome
+#   the action function returns a Future of CommandResult (see MotorCommandQueue),
+#   or directly a result. When the command starts a motor run, the job ends with the run.
+#   The first outcome is kept: callbacks of the command, of the run and of the http server may race
+class Job:
+    def __init__(self, identifier, action):
+        self.id = identifier
+        self.action = action
+        self.created = time.time()
+        self.accepted = None
+        self.outcome = None
+        self.duration = None
+        # result is set when outcome is known
+        self.done = concurrent.futures.Future()
+        self._lock = threading.Lock()
+
+    def follow(self, result):
+        """follow the result of the action function
+        """
+        if isinstance(result, concurrent.futures.Future):
+            result.add_done_callback(self._command_done)
+        else:
+            self._command_result(result)
+
+    def _command_done(self, future):
+        if future.cancelled():
+            self.finish(False, CANCELLED)
+        elif future.exception() is not None:
+            self.finish(False, ERROR)
+        else:
+            self._command_result(future.result())
+
+    def _command_result(self, result):
+        if result is not None and not result:
+            self.finish(False, REFUSED)
+            return
+        run = getattr(result, 'run', None)
+        if run is None:
+            self.finish(True, DONE)
+            return
+        with self._lock:
+            if not self.done.done():
+                self.accepted = True
+        run.finished.add_done_callback(lambda future: self.finish(True, future.result(), run.duration))
+
+    def finish(self, accepted, outcome, duration=None) -> bool:
+        """set the outcome of the job, if it is not already known
+
+        Args:
+            accepted (bool): the command was accepted
+            outcome (str): REFUSED, CANCELLED, ERROR, DONE or the outcome of the motor run
+            duration (float, optional): of the motor run, in seconds. Defaults to None.
+
+        Returns:
+            bool: False if the job was already finished
+        """
+        with self._lock:
+            if self.done.done():
+                return False
+            self.accepted = accepted
+            self.outcome = outcome
+            self.duration = duration
+            self.done.set_result(outcome)
+        return True
+
+    def finished(self) -> bool:
+        return self.done.done()
+
+    def wait(self, timeout) -> bool:
+        """wait for the outcome
+
+        Args:
+            timeout (float): in seconds
+
+        Returns:
+            bool: True if job is finished
+        """
+        try:
+            self.done.result(timeout)
+            return True
+        except concurrent.futures.TimeoutError:
+            return False
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {'id': self.id,
+                    'action': self.action,
+                    'created': self.created,
+                    'state': 'done' if self.finished() else 'pending',
+                    'accepted': self.accepted,
+                    'outcome': self.outcome,
+                    'duration': self.duration}
+
+    def to_json(self) -> bytes:
+        return json.dumps(self.to_dict()).encode()
+
+
+# -------------------------------------------------
+# Object which keeps the last jobs, to be read later
+# with their identifier. Bounded like a LRU cache
+# -------------------------------------------------
+class JobRegistry:
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._sequence = itertools.count(1)
+
+    def create(self, action) -> Job:
+        with self._lock:
+            job = Job(str(next(self._sequence)), action)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.size:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, identifier):
+        """get a job
+
+        Returns:
+            Job: None if unknown or forgotten
+        """
+        with self._lock:
+            job = self._jobs.get(identifier)
+            if job is not None:
+                self._jobs.move_to_end(identifier)
+            return job
+
+    def __len__(self):
+        return len(self._jobs)
+
+
+# jobs of the http servers
+jobs = JobRegistry()
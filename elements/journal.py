@@ -0,0 +1,344 @@
+import os
+import mmap
+import struct
+import time
+import argparse
+import threading
+import logging
+from collections import namedtuple
+from datetime import datetime
+from .event_bus import MOTOR_START, MOTOR_STOP, MOTOR_REVERSE, SENSOR_PRESS, SENSOR_RELEASE, SCHEDULE
+
+logger = logging.getLogger('journal')
+
+# file layout: header then fixed size records, appended one by one
+# a record: monotonic time, wall time (UTC timestamp), type, source, direction, outcome, duration
+MAGIC = b'JRN1'
+HEADER = struct.Struct('<4sI')
+RECORD = struct.Struct('<ddBBBBf')
+DEFAULT_FILE = 'journal.bin'
+# a full journal is renamed to journal.bin.1, the previous one is removed
+DEFAULT_MAX_SIZE = 1024 * 1024
+BACKUP_SUFFIX = '.1'
+
+# types of record, the same as events of event_bus, and a command refused by the motor
+REFUSED = 'refused'
+KINDS = (None, MOTOR_START, MOTOR_STOP, MOTOR_REVERSE, REFUSED, SENSOR_PRESS, SENSOR_RELEASE, SCHEDULE)
+
+# sources of record
+MOTOR = 'motor'
+OPEN_SENSOR = 'open_sensor'
+CLOSE_SENSOR = 'close_sensor'
+AUTOMATIC = 'automatic'
+SOURCES = (None, MOTOR, OPEN_SENSOR, CLOSE_SENSOR, AUTOMATIC)
+
+DIRECTIONS = (None, 'open', 'close')
+
+# outcomes, the reasons of MotorRun and force when a command skips sensors
+OUTCOMES = (None, 'open_sensor_reached', 'close_sensor_reached', 'timeout', 'stopped', 'reversed', 'interrupted',
+            'forced')
+
+_KIND_CODES = {name: code for code, name in enumerate(KINDS)}
+_SOURCE_CODES = {name: code for code, name in enumerate(SOURCES)}
+_DIRECTION_CODES = {name: code for code, name in enumerate(DIRECTIONS)}
+_OUTCOME_CODES = {name: code for code, name in enumerate(OUTCOMES)}
+
+# duration is NaN when it has no meaning
+Entry = namedtuple('Entry', 'monotonic time kind source direction outcome duration')
+
+
+def _decode(values) -> Entry:
+    monotonic, wall, kind, source, direction, outcome, duration = values
+    return Entry(monotonic, wall, KINDS[kind] if kind < len(KINDS) else kind,
+                 SOURCES[source] if source < len(SOURCES) else source,
+                 DIRECTIONS[direction] if direction < len(DIRECTIONS) else direction,
+                 OUTCOMES[outcome] if outcome < len(OUTCOMES) else outcome,
+                 None if duration != duration else duration)
+
+
+# -------------------------------------------------
+# Object which appends door events to a binary file.
+# Each record has the same size and is written with one
+# unbuffered system call, so it can be called from the
+# sensor callbacks. Nothing is written until open is called.
+# Like the log, the file rotates when it reaches max_size:
+# it is renamed to path.1 and a new journal is started
+# -------------------------------------------------
+class Journal:
+    def __init__(self):
+        self.path = None
+        self.max_size = DEFAULT_MAX_SIZE
+        self._fd = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def open(self, path=DEFAULT_FILE, max_size=DEFAULT_MAX_SIZE):
+        """open (or create) the journal file, records are appended at its end
+
+        Args:
+            path (str, optional): journal file. Defaults to DEFAULT_FILE.
+            max_size (int, optional): size in bytes which rotates the file, 0 for no limit.
+                                      Defaults to DEFAULT_MAX_SIZE.
+        """
+        self.close()
+        try:
+            fd, size = self._open_file(path)
+        except OSError as e:
+            logger.error(f"can't open journal {path}: {e}")
+            return
+        with self._lock:
+            self._fd = fd
+            self._size = size
+            self.path = path
+            self.max_size = max_size
+
+    @staticmethod
+    def _open_file(path) -> tuple:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            if size == 0:
+                os.write(fd, HEADER.pack(MAGIC, RECORD.size))
+                size = HEADER.size
+            else:
+                # a record cut by a power loss would shift all next ones
+                extra = (size - HEADER.size) % RECORD.size
+                if extra:
+                    logger.warning(f"journal {path}: remove {extra} bytes of an incomplete record")
+                    os.truncate(path, size - extra)
+                    size -= extra
+        except OSError:
+            os.close(fd)
+            raise
+        return fd, size
+
+    def _rotate(self):
+        # called with lock
+        os.close(self._fd)
+        self._fd = None
+        try:
+            os.replace(self.path, self.path + BACKUP_SUFFIX)
+        except OSError as e:
+            # not tried again at each write, the file grows until the next open
+            logger.error(f"can't rotate journal {self.path}, rotation disabled until next open: {e}")
+            self.max_size = 0
+        try:
+            self._fd, self._size = self._open_file(self.path)
+        except OSError as e:
+            logger.error(f"can't open journal {self.path}: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def write(self, kind, source, direction=None, outcome=None, duration=None):
+        """append one record, does nothing when journal is not open
+
+        Args:
+            kind (str): type, like MOTOR_START
+            source (str): element which writes, like MOTOR
+            direction (str, optional): 'open' or 'close'. Defaults to None.
+            outcome (str, optional): reason of a stop, like 'timeout'. Defaults to None.
+            duration (float, optional): in seconds. Defaults to None.
+        """
+        if self._fd is None:
+            return
+        record = RECORD.pack(time.monotonic(), time.time(), _KIND_CODES[kind], _SOURCE_CODES[source],
+                             _DIRECTION_CODES.get(direction, 0), _OUTCOME_CODES.get(outcome, 0),
+                             float('nan') if duration is None else duration)
+        with self._lock:
+            if self._fd is None:
+                return
+            try:
+                os.write(self._fd, record)
+                self._size += RECORD.size
+                if self.max_size and self._size >= self.max_size:
+                    self._rotate()
+            except OSError as e:
+                logger.error(f"can't write journal: {e}")
+
+
+# -------------------------------------------------
+# Object which reads a journal file with mmap,
+# records are decoded only when they are read
+# -------------------------------------------------
+class JournalReader:
+    def __init__(self, path=DEFAULT_FILE):
+        self.path = path
+        self._file = open(path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self.inode = stat.st_ino
+        size = stat.st_size
+        self._map = None
+        self._count = 0
+        if size >= HEADER.size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, record_size = HEADER.unpack_from(self._map)
+            if magic != MAGIC or record_size != RECORD.size:
+                self.close()
+                raise ValueError(f'{path} is not a journal file')
+            self._count = (size - HEADER.size) // RECORD.size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index) -> Entry:
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('journal index out of range')
+        return _decode(RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size))
+
+    def __iter__(self):
+        return self.entries()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def entries(self, first=0):
+        """read records from index first
+
+        Returns:
+            generator: Entry of each record
+        """
+        if not self._count or first >= self._count:
+            return
+        # views must be released before the map can be closed
+        with memoryview(self._map) as whole:
+            with whole[HEADER.size + first * RECORD.size:HEADER.size + self._count * RECORD.size] as view:
+                for values in RECORD.iter_unpack(view):
+                    yield _decode(values)
+
+    def filter(self, kind=None, source=None, since=None, until=None, first=0):
+        """read records which match all given criteria
+
+        Args:
+            kind (str, optional): type of record. Defaults to None.
+            source (str, optional): source of record. Defaults to None.
+            since (float, optional): minimum wall time (UTC timestamp). Defaults to None.
+            until (float, optional): maximum wall time (UTC timestamp). Defaults to None.
+            first (int, optional): index of the first record read. Defaults to 0.
+
+        Returns:
+            generator: Entry of each matching record
+        """
+        for entry in self.entries(first):
+            if kind is not None and entry.kind != kind:
+                continue
+            if source is not None and entry.source != source:
+                continue
+            if since is not None and entry.time < since:
+                continue
+            if until is not None and entry.time > until:
+                continue
+            yield entry
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+def report_events(entries):
+    """convert records to events of email report, like the ones found in log file
+
+    Args:
+        entries: iterable of Entry
+
+    Returns:
+        generator: (date, level, message) of each motor start and timeout
+    """
+    for entry in entries:
+        if entry.kind == MOTOR_START:
+            level, message = 'INFO', entry.direction
+        elif entry.kind == MOTOR_REVERSE:
+            level, message = 'INFO', f'reverse to {entry.direction}'
+        elif entry.kind == MOTOR_STOP and entry.outcome == 'timeout':
+            level, message = 'WARNING', 'max time reached'
+        else:
+            continue
+        yield time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.time)), level, message
+
+
+def read_new_entries(path, checkpoint) -> list:
+    """read records written since checkpoint, then move checkpoint to the end.
+    offset of checkpoint is a number of records, a new file (other inode) is read from its start.
+    If the journal rotated since checkpoint, the end of path.1 is read first
+
+    Args:
+        path (str): journal file
+        checkpoint (LogCheckpoint): updated, save it when done
+
+    Returns:
+        list: Entry of each new record
+    """
+    entries = []
+    try:
+        with JournalReader(path + BACKUP_SUFFIX) as reader:
+            if checkpoint.inode == reader.inode and checkpoint.offset <= len(reader):
+                entries.extend(reader.entries(checkpoint.offset))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning(f"can't read journal {path + BACKUP_SUFFIX}: {e}")
+    try:
+        with JournalReader(path) as reader:
+            inode = reader.inode
+            first = checkpoint.offset
+            if checkpoint.inode != inode or first > len(reader):
+                first = 0
+            entries.extend(reader.entries(first))
+            checkpoint.inode = inode
+            checkpoint.offset = len(reader)
+    except (OSError, ValueError) as e:
+        logger.warning(f"can't read journal {path}: {e}")
+    return entries
+
+
+def _parse_date(value) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _format_entry(entry, csv) -> str:
+    date = datetime.fromtimestamp(entry.time).isoformat(sep=' ', timespec='milliseconds')
+    duration = '' if entry.duration is None else f'{entry.duration:.3f}'
+    values = (date, entry.kind, entry.source, entry.direction or '', entry.outcome or '', duration)
+    if csv:
+        return ';'.join(values)
+    return '{:23} {:14} {:12} {:5} {:20} {}'.format(*values)
+
+
+# journal shared by all elements, opened at startup
+journal = Journal()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='dump door events journal')
+    parser.add_argument('file', nargs='?', default=DEFAULT_FILE, help=f'journal file, default is {DEFAULT_FILE}')
+    parser.add_argument('-k', '--kind', choices=KINDS[1:], help='only this type of record')
+    parser.add_argument('-s', '--source', choices=SOURCES[1:], help='only this source')
+    parser.add_argument('--since', type=_parse_date, help='only records after this local date, like 2024-05-01')
+    parser.add_argument('--until', type=_parse_date, help='only records before this local date')
+    parser.add_argument('--csv', action='store_true', help='csv output')
+    parameters = parser.parse_args()
+
+    # records of the rotated journal are older
+    for journal_file in (parameters.file + BACKUP_SUFFIX, parameters.file):
+        if journal_file != parameters.file and not os.path.exists(journal_file):
+            continue
+        try:
+            with JournalReader(journal_file) as reader:
+                for found in reader.filter(parameters.kind, parameters.source, parameters.since, parameters.until):
+                    print(_format_entry(found, parameters.csv))
+        except FileNotFoundError:
+            print(f"can't find journal file {journal_file}, try option -h !")
+            exit(1)
+        except ValueError as e:
+            print(e)
+            exit(1)
@@ -1,5 +1,127 @@
+import atexit
+import gzip
+import os
+import queue
+import threading
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler
+from .format_email_body import LogCheckpoint, iter_new_events, COMPRESSED_SUFFIX
+
+# records written before a flush of the file, if more records are waiting
+MAX_BATCH = 100
+# maximum time a record stays in the file buffer, in seconds
+FLUSH_DELAY = 1.0
+
+
+# -------------------------------------------------
+# RotatingFileHandler which gzips its backups in a
+# background thread: the file is renamed at rollover,
+# then compressed to name.gz and removed.
+# A rollover waits for the previous compression, so
+# backups are never renamed while being compressed
+# -------------------------------------------------
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    def __init__(self, filename, maxBytes=0, backupCount=0):
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount)
+        self.namer = self._namer
+        self.rotator = self._rotator
+        self.compression = None
+        # backup not compressed at last stop
+        plain = self.baseFilename + '.1'
+        if os.path.exists(plain):
+            self._compress_in_background(plain, plain + COMPRESSED_SUFFIX)
+
+    @staticmethod
+    def _namer(name):
+        return name + COMPRESSED_SUFFIX
+
+    def _rotator(self, source, dest):
+        plain = dest[:-len(COMPRESSED_SUFFIX)]
+        os.rename(source, plain)
+        self._compress_in_background(plain, dest)
+
+    def _compress_in_background(self, source, dest):
+        self.compression = threading.Thread(target=self._compress, args=(source, dest),
+                                            name='log_compression', daemon=True)
+        self.compression.start()
+
+    @staticmethod
+    def _compress(source, dest):
+        # shutil imports bz2 and lzma, not needed at boot
+        import shutil
+        try:
+            temporary = dest + '.tmp'
+            with open(source, 'rb') as plain, gzip.open(temporary, 'wb') as compressed:
+                shutil.copyfileobj(plain, compressed)
+            os.replace(temporary, dest)
+            os.remove(source)
+        except OSError as e:
+            logging.getLogger('logger').error(f"can't compress {source}: {e}")
+
+    def wait_compression(self, timeout=None):
+        if self.compression:
+            self.compression.join(timeout)
+
+    def doRollover(self):
+        self.wait_compression()
+        super().doRollover()
+
+
+# -------------------------------------------------
+# Thread which writes log records sent by a QueueHandler
+# to the rotating file. Records waiting are written
+# together and the file is flushed once per batch,
+# at once after a WARNING or more.
+# A threading.Event in the queue is set when all
+# records before it are in the file, None stops the thread
+# -------------------------------------------------
+class LogWriter(threading.Thread):
+    def __init__(self, handler, records):
+        super().__init__(name='log_writer', daemon=True)
+        self.handler = handler
+        self.records = records
+
+    def run(self) -> None:
+        waiting = 0
+        while True:
+            try:
+                record = self.records.get(timeout=FLUSH_DELAY if waiting else None)
+            except queue.Empty:
+                self._flush()
+                waiting = 0
+                continue
+
+            if record is None:
+                self._flush()
+                return
+            if isinstance(record, threading.Event):
+                self._flush()
+                waiting = 0
+                record.set()
+                continue
+
+            self._write(record)
+            waiting += 1
+            if record.levelno >= logging.WARNING or waiting >= MAX_BATCH:
+                self._flush()
+                waiting = 0
+
+    def _write(self, record):
+        handler = self.handler
+        with handler.lock:
+            try:
+                if isinstance(handler, RotatingFileHandler) and handler.shouldRollover(record):
+                    handler.doRollover()
+                handler.stream.write(handler.format(record) + handler.terminator)
+            except Exception:
+                handler.handleError(record)
+
+    def _flush(self):
+        with self.handler.lock:
+            try:
+                self.handler.stream.flush()
+            except (OSError, ValueError, AttributeError):
+                pass
 
 
 # -------------------------------------------------
@@ -7,12 +129,24 @@ from logging.handlers import RotatingFileHandler
 # rotate file mechanism
 # default size : 100 ko
 # default file : 5
+# with log_async (default), records are written
+# by a LogWriter thread, so logging never waits for
+# the file system
+# with log_compress (default), backups are gzipped
+# without rotate, records are appended to the file,
+# for a process which runs beside door management
+# (only one process rotates the file)
 # -------------------------------------------------
 class Logger:
-    def __init__(self, configuration=None, max_size=100000, count=5):
+    def __init__(self, configuration=None, max_size=100000, count=5, rotate=True):
         self.logger = logging.getLogger()
         self.handler = None
         self.configuration = configuration
+        self.rotate = rotate
+        self.checkpoint_file = None
+        self.records = None
+        self.writer = None
+        self.queue_handler = None
         self.configure_log_format(max_size, count)
 
     def debug(self, message):
@@ -45,20 +179,69 @@ class Logger:
         if not self.handler:
             formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
             try:
-                self.handler = RotatingFileHandler(self.configuration['log_file'], maxBytes=max_size, backupCount=count)
+                try:
+                    compress = self.configuration['log_compress']
+                except KeyError:
+                    compress = True
+                if self.rotate:
+                    handler_class = CompressedRotatingFileHandler if compress else RotatingFileHandler
+                    self.handler = handler_class(self.configuration['log_file'], maxBytes=max_size,
+                                                 backupCount=count)
+                else:
+                    self.handler = logging.FileHandler(self.configuration['log_file'])
                 self.handler.setFormatter(formatter)
-                self.logger.addHandler(self.handler)
             except (KeyError, TypeError):
                 # no log if no log_file configuration
-                pass
+                return
+
+            try:
+                asynchronous = self.configuration['log_async']
+            except KeyError:
+                asynchronous = True
+            if asynchronous:
+                self.records = queue.SimpleQueue()
+                self.writer = LogWriter(self.handler, self.records)
+                self.writer.start()
+                self.queue_handler = QueueHandler(self.records)
+                self.logger.addHandler(self.queue_handler)
+                # records still in queue are written at exit
+                atexit.register(self.stop)
+            else:
+                self.logger.addHandler(self.handler)
+
+            try:
+                self.checkpoint_file = self.configuration['log_checkpoint']
+            except KeyError:
+                self.checkpoint_file = self.configuration['log_file'] + '.checkpoint'
+
+    # get door events logged since last call, probably to send email
+    # log is read line by line from the last checkpoint, never rolled over,
+    # with the backups written since (see iter_new_events)
+    def get_new_events(self):
+        if not self.handler:
+            return None
+
+        self.flush()
+        checkpoint = LogCheckpoint(self.checkpoint_file)
+        events = list(iter_new_events(self.configuration['log_file'], checkpoint))
+        checkpoint.save()
+        return events
 
-    # get current log, probably to send email
-    # and rollover the file
-    def get_current_log(self):
-        if self.handler:
-            with open(self.configuration['log_file'], 'r') as file:
-                data = file.readlines()
-            self.handler.doRollover()
-            return data
+    # wait until all records logged before are in the file
+    def flush(self, timeout=5):
+        if self.writer and self.writer.is_alive():
+            written = threading.Event()
+            self.records.put(written)
+            written.wait(timeout)
+        elif self.handler:
+            self.handler.flush()
 
-        return None
+    # write waiting records and stop the writer thread, next records are written directly
+    def stop(self, timeout=5):
+        if self.writer and self.writer.is_alive():
+            self.logger.removeHandler(self.queue_handler)
+            self.records.put(None)
+            self.writer.join(timeout)
+            self.logger.addHandler(self.handler)
+        if isinstance(self.handler, CompressedRotatingFileHandler):
+            self.handler.wait_compression(timeout)
@@ -0,0 +1,325 @@
+import os
+import time
+import fcntl
+import smtplib
+import threading
+import itertools
+import logging
+from email import message_from_bytes, policy
+from .metrics import counter, histogram
+
+spool_logger = logging.getLogger('mail_spool')
+
+email_send_seconds = histogram('door_email_send_seconds', 'Time to send one email, with connection if needed',
+                               buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+emails_sent = counter('door_emails_sent_total', 'Emails sent')
+email_failures = counter('door_email_failures_total', 'Emails not sent', ('reason', ))
+FAILURES_RETRY = email_failures.labels('retry')
+FAILURES_REFUSED = email_failures.labels('refused')
+
+DEFAULT_DIRECTORY = 'mail_spool'
+SUFFIX = '.eml'
+FAILED_SUFFIX = '.failed'
+LOCK_FILE = '.lock'
+# time between two tries when SMTP server can't be reached, doubled after each failure
+RETRY_MIN = 10
+RETRY_MAX = 900
+# an unused connection is closed after this time
+IDLE_TIMEOUT = 60
+# timeout of each SMTP operation
+SMTP_TIMEOUT = 30
+# routes of the kernel, a default route means the network is up
+ROUTE_FILE = '/proc/net/route'
+# while the network is down, it is checked at this period, emails are sent as soon as it's back
+PROBE_PERIOD = 5
+
+
+def network_up(route_file=ROUTE_FILE):
+    """check if there is a default route, a cheap probe without network traffic
+
+    Returns:
+        bool: True if a default route is up, None if unknown (no route file)
+    """
+    try:
+        with open(route_file, 'r') as routes:
+            # first line is the header
+            next(routes, None)
+            for line in routes:
+                fields = line.split()
+                # destination 0.0.0.0 and flag RTF_UP
+                if len(fields) > 3 and fields[1] == '00000000' and int(fields[3], 16) & 1:
+                    return True
+        return False
+    except (OSError, ValueError):
+        return None
+
+
+# -------------------------------------------------
+# Object which keeps outgoing emails in a directory
+# until they are sent by its own thread.
+# put never waits for the network, nor for the disk while
+# the thread runs: the thread writes the file (fsync on
+# an SD card can be long, put is called from the
+# scheduler thread by alerts). The sender keeps one
+# authenticated connection for all waiting messages,
+# and tries again later (10 s, 20 s ... 15 min) when
+# the network or the server is down. When the network
+# was down, messages are sent as soon as it's back,
+# without waiting for the next try. A file lock
+# prevents two processes sending the same spool
+# -------------------------------------------------
+class MailSpool:
+    def __init__(self, directory=DEFAULT_DIRECTORY, host='smtp.gmail.com', port=587, user=None, password=None,
+                 starttls=True, route_file=ROUTE_FILE):
+        self.directory = directory
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.route_file = route_file
+        self.probe_period = PROBE_PERIOD
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self._condition = threading.Condition()
+        self._wake_up = False
+        self._running = False
+        # (path, content) of messages put, not yet written
+        self._waiting = []
+        self._thread = None
+        self._sequence = itertools.count()
+        self._connection = None
+        self._last_use = 0
+        self._next_try = 0
+        self._delay = RETRY_MIN
+        # network was down at the last failure
+        self._network_down = False
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, message) -> str:
+        """save a message in spool, it will be sent by the spool thread.
+        While the thread runs, it writes the file, else it is written now
+
+        Args:
+            message: email.message.Message, with From, To and Subject
+
+        Returns:
+            str: file of the message
+        """
+        name = f'{time.time():017.6f}-{os.getpid()}-{next(self._sequence)}{SUFFIX}'
+        path = os.path.join(self.directory, name)
+        content = message.as_bytes()
+        with self._condition:
+            if self._running:
+                self._waiting.append((path, content))
+                self._wake_up = True
+                self._condition.notify_all()
+                return path
+        self._write(path, content)
+        return path
+
+    def _write(self, path, content):
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+        spool_logger.debug(f"message spooled: {os.path.basename(path)}")
+
+    def _write_waiting(self):
+        with self._condition:
+            waiting = self._waiting
+            self._waiting = []
+        for path, content in waiting:
+            try:
+                self._write(path, content)
+            except OSError as e:
+                spool_logger.error(f"can't save email in spool: {e}")
+
+    def pending(self) -> list:
+        """messages waiting, the oldest first
+        """
+        with self._condition:
+            paths = [path for path, _ in self._waiting]
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(SUFFIX)]
+        except FileNotFoundError:
+            names = []
+        paths.extend(os.path.join(self.directory, name) for name in names)
+        return sorted(set(paths))
+
+    def flush(self):
+        """try to send waiting messages now, like when network is back
+        """
+        with self._condition:
+            self._next_try = 0
+            self._delay = RETRY_MIN
+            self._network_down = False
+        self._notify()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._condition:
+            self._running = True
+            # messages left by a previous run, or by another process
+            self._wake_up = True
+        self._thread = threading.Thread(target=self._run, name='mail_spool', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """stop the spool thread, messages not sent stay in spool for the next start
+
+        Args:
+            timeout (float, optional): time to send waiting messages before stop. Defaults to None (don't wait).
+        """
+        if timeout:
+            self.wait_empty(timeout)
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(SMTP_TIMEOUT)
+        # messages put while it stopped, kept for the next start
+        self._write_waiting()
+
+    def wait_empty(self, timeout) -> bool:
+        """wait until all messages are sent
+
+        Returns:
+            bool: True if spool is empty
+        """
+        deadline = time.monotonic() + timeout
+        self.flush()
+        while self.pending():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def _notify(self):
+        with self._condition:
+            self._wake_up = True
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                if self._next_try > now:
+                    timeout = self._next_try - now
+                    if self._network_down:
+                        timeout = min(timeout, self.probe_period)
+                elif self._connection:
+                    timeout = max(0, self._last_use + IDLE_TIMEOUT - now)
+                else:
+                    timeout = None
+                if self._running and not self._wake_up:
+                    self._condition.wait(timeout)
+                self._wake_up = False
+                if not self._running:
+                    break
+                retry_later = time.monotonic() < self._next_try
+                if retry_later and self._network_down and network_up(self.route_file):
+                    spool_logger.info("network is back, send emails")
+                    self._next_try = 0
+                    self._delay = RETRY_MIN
+                    self._network_down = False
+                    retry_later = False
+
+            self._write_waiting()
+            if not retry_later:
+                self._send_pending()
+            if self._connection and time.monotonic() - self._last_use >= IDLE_TIMEOUT:
+                self._close()
+        self._write_waiting()
+        self._close()
+
+    def _send_pending(self):
+        files = self.pending()
+        if not files:
+            return
+        with open(os.path.join(self.directory, LOCK_FILE), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # another process sends this spool
+                self._retry_later()
+                return
+            # files may have been sent by the other process
+            for path in self.pending():
+                if not self._running:
+                    return
+                try:
+                    self._send_file(path)
+                except (OSError, smtplib.SMTPException) as e:
+                    FAILURES_RETRY.inc()
+                    spool_logger.warning(f"can't send email, try again later: {e}")
+                    self._close()
+                    self._retry_later()
+                    return
+        with self._condition:
+            self._delay = RETRY_MIN
+
+    def _send_file(self, path):
+        try:
+            with open(path, 'rb') as file:
+                message = message_from_bytes(file.read(), policy=policy.SMTP)
+        except FileNotFoundError:
+            return
+        start = time.monotonic()
+        try:
+            self._connect().send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # reused connection closed by the server, one more time with a new one
+            self._close()
+            self._connect().send_message(message)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+            code = getattr(e, 'smtp_code', 0)
+            if isinstance(e, smtplib.SMTPRecipientsRefused) or code >= 500:
+                # the server will never accept it, keep it aside
+                spool_logger.error(f"email refused by server, kept in {path + FAILED_SUFFIX}: {e}")
+                os.replace(path, path + FAILED_SUFFIX)
+                self.failed += 1
+                FAILURES_REFUSED.inc()
+                return
+            raise
+        self._last_use = time.monotonic()
+        email_send_seconds.observe(self._last_use - start)
+        emails_sent.inc()
+        os.remove(path)
+        self.sent += 1
+        spool_logger.debug(f"email sent: {os.path.basename(path)}")
+
+    def _connect(self):
+        if self._connection is None:
+            connection = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+            try:
+                if self.starttls:
+                    connection.starttls()
+                if self.user and self.password:
+                    connection.login(self.user, self.password)
+            except (OSError, smtplib.SMTPException):
+                connection.close()
+                raise
+            self._connection = connection
+            self._last_use = time.monotonic()
+        return self._connection
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                self._connection.quit()
+            except (OSError, smtplib.SMTPException):
+                self._connection.close()
+            self._connection = None
+
+    def _retry_later(self):
+        with self._condition:
+            self.retries += 1
+            self._network_down = network_up(self.route_file) is False
+            self._next_try = time.monotonic() + self._delay
+            spool_logger.info(f"next email try in {self._delay} seconds")
+            self._delay = min(self._delay * 2, RETRY_MAX)
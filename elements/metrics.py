@@ -0,0 +1,244 @@
+import math
+import threading
+from array import array
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# default buckets of histograms, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_value(value) -> str:
+    if value is None or value != value:
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(pairs) + '}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# -------------------------------------------------
+# Base of metrics: a metric has children, one for each
+# set of label values. A child is created once, then
+# kept by the caller (see labels), so recording a value
+# only updates numbers under a short lock
+# -------------------------------------------------
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.label_names:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """child of these label values, keep it to record values without lookup
+        """
+        if len(values) != len(self.label_names):
+            raise ValueError(f'{self.name} needs labels {self.label_names}')
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def expose(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, child in list(self._children.items()):
+            lines.extend(child.expose(self.name, self.label_names, values))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def expose(self, name, names, values):
+        return [f'{name}{_format_labels(names, values)} {_format_value(self.value)}']
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """value is read by function, called at each exposition
+        """
+        self.function = function
+
+    def get(self):
+        if self.function:
+            try:
+                return self.function()
+            except Exception:
+                return None
+        return self.value
+
+    def expose(self, name, names, values):
+        return [f'{name}{_format_labels(names, values)} {_format_value(self.get())}']
+
+
+class _HistogramChild:
+    def __init__(self, bounds):
+        self._lock = threading.Lock()
+        self.bounds = bounds
+        # one count per bucket, and the last one for +Inf. Not cumulative
+        self.counts = array('Q', [0]) * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def expose(self, name, names, values):
+        with self._lock:
+            counts = self.counts.tolist()
+            total_sum = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf, ), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f'{name}_bucket{_format_labels(names, values, le)} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(names, values)} {_format_value(total_sum)}')
+        lines.append(f'{name}_count{_format_labels(names, values)} {cumulative}')
+        return lines
+
+
+# only increases, like a number of stops
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+
+# current value, like a temperature
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._children[()].set(value)
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+    def dec(self, amount=1):
+        self._children[()].dec(amount)
+
+    def set_function(self, function):
+        self._children[()].set_function(function)
+
+
+# distribution of values, like durations, counted in fixed buckets
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(float(bound) for bound in buckets))
+        super().__init__(name, documentation, labels)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+
+# -------------------------------------------------
+# Object which keeps all metrics of the daemon, and
+# formats them for GET /metrics (Prometheus text format)
+# -------------------------------------------------
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        """add a metric, or get the one with the same name
+
+        Returns:
+            Metric: the registered metric
+        """
+        with self._lock:
+            known = self._metrics.get(metric.name)
+            if known is not None:
+                if type(known) is not type(metric) or known.label_names != metric.label_names:
+                    raise ValueError(f'metric {metric.name} already registered with another type or labels')
+                return known
+            self._metrics[metric.name] = metric
+            return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def expose(self) -> bytes:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return ('\n'.join(lines) + '\n').encode()
+
+
+# metrics of all elements
+registry = MetricsRegistry()
+
+
+def counter(name, documentation, labels=()) -> Counter:
+    return registry.register(Counter(name, documentation, labels))
+
+
+def gauge(name, documentation, labels=()) -> Gauge:
+    return registry.register(Gauge(name, documentation, labels))
+
+
+def histogram(name, documentation, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labels, buckets))
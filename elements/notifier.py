@@ -0,0 +1,109 @@
+import threading
+import logging
+from datetime import datetime
+from .clock import clock as default_clock
+
+notifier_logger = logging.getLogger('notifier')
+
+# time between two emails of the same subject, in seconds
+DEFAULT_WINDOW = 3600
+# alerts listed in a digest, next ones are only counted
+MAX_DIGEST_LINES = 50
+# subject beginning of the alerts sent at once, whatever the limits
+CRITICAL_PREFIXES = ('ERROR', 'CRITICAL')
+
+
+# -------------------------------------------------
+# Object between the alerts and EmailSender:
+# the first alert of a subject is sent at once, the next
+# ones during window are merged in one digest sent at
+# the end of window. A critical alert (subject starting
+# with ERROR) is always sent at once
+# -------------------------------------------------
+class AlertNotifier:
+    def __init__(self, email, window=DEFAULT_WINDOW, clock=None):
+        """alert notifier
+
+        Args:
+            email (EmailSender): used to send
+            window (float, optional): minimum time between two emails of a subject, in seconds.
+                Defaults to DEFAULT_WINDOW.
+            clock (Clock, optional): clock of window and digests, like a VirtualClock. Defaults to the real clock.
+        """
+        self.email = email
+        self.clock = clock if clock else default_clock
+        self.window = window
+        self.sent = 0
+        self.merged = 0
+        self.suppressed = 0
+        self.digests = 0
+        self._lock = threading.Lock()
+        self._last_sent = {}
+        self._digest = []
+        self._timer = None
+
+    def notify(self, message, subject) -> bool:
+        """send an alert, or keep it for the next digest
+
+        Args:
+            message (str): body
+            subject (str): subject, like 'WARNING temperature'
+
+        Returns:
+            bool: True if sent at once
+        """
+        now = self.clock.monotonic()
+        with self._lock:
+            last = self._last_sent.get(subject)
+            critical = subject.startswith(CRITICAL_PREFIXES)
+            if critical or last is None or now - last >= self.window:
+                self._last_sent[subject] = now
+                self.sent += 1
+            else:
+                if len(self._digest) < MAX_DIGEST_LINES:
+                    self.merged += 1
+                    date = datetime.fromtimestamp(self.clock.time()).strftime("%Y/%m/%d %H:%M:%S")
+                    self._digest.append((date, subject, message))
+                else:
+                    self.suppressed += 1
+                if self._timer is None:
+                    self._timer = self.clock.call_later(last + self.window - now, self.send_digest)
+                return False
+        self.email.send_message(message, subject)
+        return True
+
+    def send_digest(self):
+        """send alerts kept since the last digest, in one email
+        """
+        with self._lock:
+            self._timer = None
+            digest = self._digest
+            self._digest = []
+            merged = self.merged
+            suppressed = self.suppressed
+            if digest:
+                self.digests += 1
+                now = self.clock.monotonic()
+                for _, subject, _ in digest:
+                    self._last_sent[subject] = now
+        if not digest:
+            return
+        lines = [f'{date} {subject}: {message}' for date, subject, message in digest]
+        lines.append('')
+        lines.append(f'{len(digest)} alerts in this digest, {merged} merged and {suppressed} suppressed since start')
+        notifier_logger.info(f"send digest of {len(digest)} alerts")
+        self.email.send_message('\n'.join(lines), f'digest of {len(digest)} alerts')
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'sent': self.sent, 'merged': self.merged, 'suppressed': self.suppressed, 'digests': self.digests,
+                    'waiting': len(self._digest)}
+
+    def stop(self):
+        """send the waiting digest now
+        """
+        with self._lock:
+            timer = self._timer
+        if timer:
+            timer.cancel()
+        self.send_digest()
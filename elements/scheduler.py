@@ -0,0 +1,177 @@
+import heapq
+import itertools
+import threading
+import time
+import logging
+from .metrics import gauge
+from .flight_recorder import flight_recorder
+
+logger = logging.getLogger('scheduler')
+
+# rebuild the heap when cancelled timers are more than half of it
+COMPACT_MINIMUM = 64
+
+
+# handle returned by call_later/call_at, used to cancel the call
+class TimerHandle:
+    __slots__ = ('when', 'function', 'args', 'kwargs', '_scheduler', '_cancelled')
+
+    def __init__(self, scheduler, when, function, args, kwargs):
+        self._scheduler = scheduler
+        self.when = when
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self._cancelled = False
+
+    def cancel(self):
+        self._scheduler._cancel(self)
+
+    def cancelled(self):
+        return self._cancelled
+
+
+# -------------------------------------------------
+# Object which run delayed calls in one thread,
+# instead of one threading.Timer thread per call.
+# Calls are kept in a heap sorted by time.monotonic().
+# A call must be short: it delays all the others.
+# Blocking work (like sending an email) must start its own thread
+# -------------------------------------------------
+class Scheduler:
+    def __init__(self, name='scheduler'):
+        self.name = name
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._active = 0
+        self._cancelled = 0
+        self.running = False
+        # delay between expected time and real time of the last call, in seconds
+        self.lag = 0.0
+
+    def call_at(self, when, function, *args, **kwargs) -> TimerHandle:
+        """call function at time when
+
+        Args:
+            when (float): time.monotonic() value
+            function: function to call, with args and kwargs
+
+        Returns:
+            TimerHandle: to cancel the call
+        """
+        handle = TimerHandle(self, when, function, args, kwargs)
+        with self._condition:
+            heapq.heappush(self._queue, (when, next(self._sequence), handle))
+            self._active += 1
+            if not self.running:
+                self._start()
+            # wake up worker only if this call is the next one
+            if self._queue[0][2] is handle:
+                self._condition.notify()
+        return handle
+
+    def call_later(self, delay, function, *args, **kwargs) -> TimerHandle:
+        """call function after delay
+
+        Args:
+            delay (float): in seconds
+            function: function to call, with args and kwargs
+
+        Returns:
+            TimerHandle: to cancel the call
+        """
+        return self.call_at(time.monotonic() + delay, function, *args, **kwargs)
+
+    def pending(self) -> int:
+        """number of calls not yet done and not cancelled
+        """
+        return self._active
+
+    def stop(self):
+        """stop worker thread, pending calls are dropped
+        """
+        with self._condition:
+            self.running = False
+            for _, _, handle in self._queue:
+                handle.function = handle.args = handle.kwargs = None
+            self._queue.clear()
+            self._active = 0
+            self._cancelled = 0
+            self._condition.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name=self.name)
+        # stop thread when main program is stopped
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _cancel(self, handle):
+        with self._condition:
+            if handle._cancelled:
+                return
+            handle._cancelled = True
+            # handle already called if function is None
+            if handle.function is None:
+                return
+            self._active -= 1
+            self._cancelled += 1
+            if self._cancelled > COMPACT_MINIMUM and self._cancelled * 2 > len(self._queue):
+                self._queue = [entry for entry in self._queue if not entry[2]._cancelled]
+                heapq.heapify(self._queue)
+                self._cancelled = 0
+
+    def _next(self):
+        with self._condition:
+            while self.running:
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+                when, _, handle = self._queue[0]
+                if handle._cancelled:
+                    heapq.heappop(self._queue)
+                    self._cancelled -= 1
+                    continue
+                delay = when - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._queue)
+                self._active -= 1
+                self.lag = -delay
+                function, args, kwargs = handle.function, handle.args, handle.kwargs
+                # release references, and mark handle as done
+                handle.function = handle.args = handle.kwargs = None
+                return function, args, kwargs
+        return None
+
+    def _run(self):
+        while True:
+            call = self._next()
+            if call is None:
+                return
+            function, args, kwargs = call
+            try:
+                function(*args, **kwargs)
+            except Exception as e:
+                logger.exception(f"error in scheduled call {function}")
+                flight_recorder.dump(f'error in scheduled call {function}: {e}', background=True)
+
+
+# scheduler shared by all elements
+scheduler = Scheduler()
+gauge('door_scheduler_lag_seconds', 'Delay of the last scheduled call').set_function(lambda: scheduler.lag)
+gauge('door_scheduler_pending_timers', 'Timers waiting in the scheduler').set_function(scheduler.pending)
+
+
+def call_later(delay, function, *args, **kwargs) -> TimerHandle:
+    return scheduler.call_later(delay, function, *args, **kwargs)
+
+
+def call_at(when, function, *args, **kwargs) -> TimerHandle:
+    return scheduler.call_at(when, function, *args, **kwargs)
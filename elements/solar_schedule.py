@@ -0,0 +1,200 @@
+# --------------------------------------------------
+# compute open/close instants of many coops at once
+# It uses the NOAA solar position algorithm on NumPy arrays
+# (one row per site, one column per day) instead of one
+# ephem.Observer per site and per day.
+# Used to plan a fleet, the door itself uses AutomaticControl
+#
+# python -m elements.solar_schedule [-s 2026-01-01] [-d 365] chicken.json ...
+# --------------------------------------------------
+import argparse
+import json
+import logging
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+logger = logging.getLogger('solar_schedule')
+
+# altitude of the center of the sun at rise/set: sun radius and refraction
+# with ephem default pressure and temperature (1010 mbar, 15°c)
+SUN_ALTITUDE = -0.888
+# default security time, like AutomaticControl
+DEFAULT_SECURITY_TIME = 1800
+# maximum difference allowed with ephem, in seconds
+DEFAULT_TOLERANCE = 30
+# number of sites computed at once, to bound memory
+CHUNK_SIZE = 1024
+# refinement of the event instant with the sun position at this instant
+ITERATIONS = 2
+# sun position is interpolated between samples of this step, in days
+STEP = 1.0 / 24.0
+
+J2000 = 2451545.0
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
+
+
+def _sun_position(julian_day):
+    """declination (radians) and equation of time (minutes) for julian days
+    """
+    jc = (julian_day - J2000) / 36525.0
+    mean_long = np.radians(np.mod(280.46646 + jc * (36000.76983 + jc * 0.0003032), 360.0))
+    mean_anomaly = np.radians(357.52911 + jc * (35999.05029 - 0.0001537 * jc))
+    eccentricity = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    center = (np.sin(mean_anomaly) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+              + np.sin(2 * mean_anomaly) * (0.019993 - 0.000101 * jc)
+              + np.sin(3 * mean_anomaly) * 0.000289)
+    omega = np.radians(125.04 - 1934.136 * jc)
+    apparent_long = np.radians(np.degrees(mean_long) + center - 0.00569 - 0.00478 * np.sin(omega))
+    mean_obliquity = 23.0 + (26.0 + (21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))) / 60.0) / 60.0
+    obliquity = np.radians(mean_obliquity + 0.00256 * np.cos(omega))
+
+    declination = np.arcsin(np.sin(obliquity) * np.sin(apparent_long))
+    y = np.tan(obliquity / 2.0) ** 2
+    equation_of_time = 4.0 * np.degrees(y * np.sin(2 * mean_long)
+                                        - 2 * eccentricity * np.sin(mean_anomaly)
+                                        + 4 * eccentricity * y * np.sin(mean_anomaly) * np.cos(2 * mean_long)
+                                        - 0.5 * y * y * np.sin(4 * mean_long)
+                                        - 1.25 * eccentricity * eccentricity * np.sin(2 * mean_anomaly))
+    return declination, equation_of_time
+
+
+def _sun_table(first_julian_day, last_julian_day):
+    """sun position sampled each STEP between two julian days, to interpolate it for all sites
+    """
+    grid = np.arange(first_julian_day - 1.0, last_julian_day + 2.0, STEP)
+    declination, equation_of_time = _sun_position(grid)
+    return grid, declination, equation_of_time
+
+
+def _event(day_julian, latitude, longitude, sign, table):
+    """instant of sun rise (sign=-1) or sun set (sign=1) as julian day, NaN if sun never crosses horizon
+    """
+    grid, table_declination, table_equation = table
+    # start at solar noon, then refine with the sun position at the previous estimate
+    event = day_julian + 0.5 - longitude / 360.0
+    sin_latitude = np.sin(latitude)
+    cos_latitude = np.cos(latitude)
+    sin_altitude = np.sin(np.radians(SUN_ALTITUDE))
+    for _ in range(ITERATIONS + 1):
+        declination = np.interp(event, grid, table_declination)
+        equation_of_time = np.interp(event, grid, table_equation)
+        cos_hour_angle = (sin_altitude - sin_latitude * np.sin(declination)) / (cos_latitude * np.cos(declination))
+        # outside [-1, 1]: polar day or night
+        cos_hour_angle[np.abs(cos_hour_angle) > 1.0] = np.nan
+        hour_angle = np.degrees(np.arccos(cos_hour_angle))
+        event = day_julian + (720.0 - 4.0 * longitude - equation_of_time + sign * 4.0 * hour_angle) / 1440.0
+    return event
+
+
+def compute_schedule(sites, start, days):
+    """compute sun rise and sun set + security time of each site, for each day
+
+    Args:
+        sites: sequence of (latitude, longitude, security_time), in degrees (number or string) and seconds
+        start (date): first UTC day
+        days (int): number of days
+
+    Returns:
+        tuple: (dates, open, close) with dates a datetime64[D] array of size days,
+               open and close UTC timestamps arrays of shape (len(sites), days), NaN when there is no event
+    """
+    sites = np.asarray([(float(latitude), float(longitude), float(security)) for latitude, longitude, security in sites],
+                       dtype=np.float64).reshape(-1, 3)
+    dates = np.datetime64(start, 'D') + np.arange(days)
+    day_julian = (dates - np.datetime64('1970-01-01', 'D')).astype(np.float64) + UNIX_EPOCH_JULIAN_DAY
+
+    table = _sun_table(day_julian[0], day_julian[-1])
+    open_time = np.empty((len(sites), days))
+    close_time = np.empty((len(sites), days))
+    for first in range(0, len(sites), CHUNK_SIZE):
+        chunk = sites[first:first + CHUNK_SIZE]
+        latitude = np.radians(chunk[:, 0:1])
+        longitude = chunk[:, 1:2]
+        rising = _event(day_julian, latitude, longitude, -1, table)
+        setting = _event(day_julian, latitude, longitude, 1, table)
+        open_time[first:first + CHUNK_SIZE] = (rising - UNIX_EPOCH_JULIAN_DAY) * 86400.0
+        close_time[first:first + CHUNK_SIZE] = (setting - UNIX_EPOCH_JULIAN_DAY) * 86400.0 + chunk[:, 2:3]
+
+    return dates, open_time, close_time
+
+
+def cross_check(sites, start, days, tolerance=DEFAULT_TOLERANCE, samples=200, seed=0):
+    """compare random samples of compute_schedule with ephem
+
+    Args:
+        sites: like compute_schedule
+        start (date): like compute_schedule
+        days (int): like compute_schedule
+        tolerance (float, optional): maximum difference in seconds. Defaults to DEFAULT_TOLERANCE.
+        samples (int, optional): number of (site, day) compared. Defaults to 200.
+        seed (int, optional): random seed, to be reproducible. Defaults to 0.
+
+    Returns:
+        tuple: (True if all samples are inside tolerance, maximum difference in seconds)
+    """
+    import ephem
+
+    dates, open_time, close_time = compute_schedule(sites, start, days)
+    sites = list(sites)
+    generator = np.random.default_rng(seed)
+    epoch = ephem.Date('1970/1/1')
+    maximum = 0.0
+    for _ in range(samples):
+        index = int(generator.integers(len(sites)))
+        day = int(generator.integers(days))
+        latitude, longitude, security = sites[index]
+        if np.isnan(open_time[index, day]) or np.isnan(close_time[index, day]):
+            continue
+        observer = ephem.Observer()
+        observer.lat, observer.lon = str(latitude), str(longitude)
+        # look for events around the computed ones
+        observer.date = epoch + (open_time[index, day] - 6 * 3600) / 86400.0
+        rising = (observer.next_rising(ephem.Sun()) - epoch) * 86400.0
+        observer.date = epoch + (close_time[index, day] - float(security) - 6 * 3600) / 86400.0
+        setting = (observer.next_setting(ephem.Sun()) - epoch) * 86400.0 + float(security)
+        maximum = max(maximum, abs(rising - open_time[index, day]), abs(setting - close_time[index, day]))
+    logger.info(f"maximum difference with ephem: {maximum:.1f} seconds")
+    return maximum <= tolerance, maximum
+
+
+def load_sites(files):
+    """read position and security time from configuration files
+
+    Args:
+        files: list of configuration files, like chicken.json
+
+    Returns:
+        list: (latitude, longitude, security_time) of each file
+    """
+    sites = []
+    for file in files:
+        with open(file, 'r') as f:
+            configuration = json.loads(f.read())
+        try:
+            security_time = configuration['security_time']
+        except KeyError:
+            security_time = DEFAULT_SECURITY_TIME
+        sites.append((configuration['latitude'], configuration['longitude'], security_time))
+    return sites
+
+
+def _format(timestamp):
+    if np.isnan(timestamp):
+        return ''
+    return datetime.fromtimestamp(round(float(timestamp)), timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='+', help=u'configuration files of each coop')
+    parser.add_argument('-s', '--start', help=u'first UTC day, YYYY-MM-DD, default is today', required=False)
+    parser.add_argument('-d', '--days', type=int, default=365, help=u'number of days, default is 365')
+    parameters = parser.parse_args()
+
+    first_day = date.fromisoformat(parameters.start) if parameters.start else datetime.now(timezone.utc).date()
+    all_dates, all_open, all_close = compute_schedule(load_sites(parameters.files), first_day, parameters.days)
+    print('file;day;open UTC;close UTC')
+    for site, name in enumerate(parameters.files):
+        for column, day in enumerate(all_dates):
+            print(f'{name};{day};{_format(all_open[site, column])};{_format(all_close[site, column])}')
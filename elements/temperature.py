@@ -0,0 +1,144 @@
+import os
+import math
+import logging
+from array import array
+from .clock import clock as default_clock
+from .metrics import gauge
+
+logger = logging.getLogger('temperature')
+
+cpu_temperature = gauge('door_cpu_temperature_celsius', 'Last CPU temperature')
+
+RASPBERRY_TEMP = "/sys/class/thermal/thermal_zone0/temp"
+# samples kept, 5 minutes at 1 Hz
+DEFAULT_SIZE = 300
+DEFAULT_PERIOD = 1.0
+# weight of a new sample in the exponential moving average
+DEFAULT_ALPHA = 0.1
+
+
+# -------------------------------------------------
+# Object which reads CPU temperature regularly into a
+# ring buffer. The file stays open and is read with
+# pread, so a sample is one system call and no parsing
+# of a path. A test can give a fake file: it must be
+# rewritten in place (not replaced) to be seen
+# -------------------------------------------------
+class TemperatureSampler:
+    def __init__(self, path=RASPBERRY_TEMP, period=DEFAULT_PERIOD, size=DEFAULT_SIZE, alpha=DEFAULT_ALPHA,
+                 callback=None, clock=None):
+        """temperature sampler
+
+        Args:
+            path (str, optional): file which contains temperature in millidegrees. Defaults to RASPBERRY_TEMP.
+            period (float, optional): time between two samples, in seconds. Defaults to DEFAULT_PERIOD.
+            size (int, optional): samples kept for min/max/mean. Defaults to DEFAULT_SIZE.
+            alpha (float, optional): weight of a new sample in ema. Defaults to DEFAULT_ALPHA.
+            callback (optional): called with each temperature, from the scheduler thread. It must be short.
+            clock (Clock, optional): clock of the samples, like a VirtualClock. Defaults to the real clock.
+        """
+        self.path = path
+        self.period = period
+        self.alpha = alpha
+        self.callback = callback
+        self.clock = clock if clock else default_clock
+        self.samples = array('d', [math.nan]) * size
+        self.index = 0
+        self.count = 0
+        self.ema = None
+        self.errors = 0
+        self.failing = False
+        self.timer = None
+        self.fd = None
+        try:
+            self.fd = os.open(path, os.O_RDONLY)
+        except OSError as e:
+            logger.error(f"can't open {path}: {e}")
+
+    @property
+    def available(self) -> bool:
+        return self.fd is not None
+
+    def read(self):
+        """read temperature now
+
+        Returns:
+            float: temperature in °C, None if it can't be read
+        """
+        if self.fd is None:
+            return None
+        try:
+            return int(os.pread(self.fd, 16, 0)) / 1000.0
+        except (OSError, ValueError) as e:
+            self.errors += 1
+            logger.debug(f"can't read temperature: {e}")
+            return None
+
+    def sample(self):
+        """read temperature and keep it
+        """
+        temperature = self.read()
+        if temperature is None:
+            return None
+        self.samples[self.index] = temperature
+        self.index = (self.index + 1) % len(self.samples)
+        if self.count < len(self.samples):
+            self.count += 1
+        cpu_temperature.set(temperature)
+        if self.ema is None:
+            self.ema = temperature
+        else:
+            self.ema += self.alpha * (temperature - self.ema)
+        if self.callback:
+            self.callback(temperature)
+        return temperature
+
+    def start(self):
+        if self.fd is None:
+            return
+        self._next()
+
+    def _next(self):
+        # next sample is planned first: a failed sample, or callback, never stops sampling
+        self.timer = self.clock.call_later(self.period, self._next)
+        try:
+            self.sample()
+            self.failing = False
+        except Exception:
+            self.errors += 1
+            # once per failure, not each second
+            if not self.failing:
+                logger.exception("temperature sample failed")
+            self.failing = True
+
+    def stop(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    @property
+    def current(self):
+        if not self.count:
+            return None
+        return self.samples[self.index - 1]
+
+    def _kept(self):
+        if self.count < len(self.samples):
+            return self.samples[:self.count]
+        return self.samples
+
+    def stats(self) -> dict:
+        """statistics of the kept samples, None values when there is no sample
+        """
+        if not self.count:
+            return {'current': None, 'min': None, 'max': None, 'mean': None, 'ema': None, 'count': 0}
+        kept = self._kept()
+        return {'current': self.current,
+                'min': min(kept),
+                'max': max(kept),
+                'mean': math.fsum(kept) / self.count,
+                'ema': self.ema,
+                'count': self.count}
@@ -0,0 +1,193 @@
+import math
+import time
+import threading
+from array import array
+from .metrics import histogram
+
+# reactions kept for percentiles
+DEFAULT_WINDOW = 1000
+
+reaction_seconds = histogram('door_reaction_seconds', 'Time from a GPIO edge to the motor command', ('path', ),
+                             (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25))
+
+
+def percentile(values, fraction):
+    """nearest rank percentile of sorted values
+    """
+    if not values:
+        return None
+    rank = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[rank]
+
+
+# one reaction of a path: the stamps of its stages, in ns
+class Reaction:
+    __slots__ = ('stamps', )
+
+    def __init__(self, stages):
+        self.stamps = array('q', [0]) * stages
+        self.stamps[0] = time.monotonic_ns()
+
+
+# -------------------------------------------------
+# Object which measures one reaction path, like sensor
+# edge to motor stop. begin stamps the first stage,
+# mark the next ones and end the last one, all with
+# time.monotonic_ns. A reaction belongs to the thread
+# which began it: mark and end only see the reaction of
+# their thread, so a command from another source (http,
+# timer) never ends it. To follow a command to another
+# thread, detach it and attach it there.
+# The last reactions are kept in ring buffers
+# -------------------------------------------------
+class TracePath:
+    def __init__(self, name, stages, size=DEFAULT_WINDOW):
+        """trace path
+
+        Args:
+            name (str): name of the path
+            stages (tuple): names of the stages, the first one is stamped by begin, the last one by end
+            size (int, optional): reactions kept. Defaults to DEFAULT_WINDOW.
+        """
+        self.name = name
+        self.stages = tuple(stages)
+        self._local = threading.local()
+        # duration of each stage since the previous one, and total, in ns
+        self._durations = [array('q', [0]) * size for _ in self.stages]
+        self._index = 0
+        self.count = 0
+        self._histogram = reaction_seconds.labels(name)
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        """a reaction is followed by the current thread
+        """
+        return self.current() is not None
+
+    def current(self):
+        return getattr(self._local, 'reaction', None)
+
+    def begin(self) -> Reaction:
+        """start a reaction in the current thread, an unfinished one is replaced
+        """
+        reaction = Reaction(len(self.stages))
+        self._local.reaction = reaction
+        return reaction
+
+    def attach(self, reaction):
+        """follow a reaction in the current thread, like the thread which runs its command
+
+        Args:
+            reaction (Reaction): given by detach, None to follow nothing
+        """
+        self._local.reaction = reaction
+
+    def detach(self):
+        """stop following the reaction of the current thread, to give it to another thread
+
+        Returns:
+            Reaction: None if no reaction
+        """
+        reaction = self.current()
+        self._local.reaction = None
+        return reaction
+
+    def mark(self, stage):
+        """stamp a stage of the reaction of the current thread
+
+        Args:
+            stage (int): index of the stage in stages
+        """
+        reaction = self.current()
+        if reaction is not None:
+            reaction.stamps[stage] = time.monotonic_ns()
+
+    def cancel(self):
+        self._local.reaction = None
+
+    def end(self):
+        reaction = self.current()
+        if reaction is None:
+            return
+        now = time.monotonic_ns()
+        self._local.reaction = None
+        stamps = reaction.stamps
+        stamps[-1] = now
+        with self._lock:
+            index = self._index
+            previous = stamps[0]
+            for stage in range(1, len(stamps)):
+                # a stage not stamped gets 0, the next one measures from the previous stamp
+                if stamps[stage]:
+                    self._durations[stage][index] = stamps[stage] - previous
+                    previous = stamps[stage]
+                else:
+                    self._durations[stage][index] = 0
+            self._durations[0][index] = now - stamps[0]
+            self._index = (index + 1) % len(self._durations[0])
+            if self.count < len(self._durations[0]):
+                self.count += 1
+        self._histogram.observe((now - stamps[0]) / 1e9)
+
+    def report(self) -> dict:
+        """percentiles of the kept reactions, in milliseconds
+
+        Returns:
+            dict: count, p50, p90, p99, max of total, and p50, p99 of each stage
+        """
+        with self._lock:
+            count = self.count
+            durations = [sorted(stage[:count]) for stage in self._durations]
+        total = durations[0]
+        result = {'count': count,
+                  'p50': _ms(percentile(total, 0.5)),
+                  'p90': _ms(percentile(total, 0.9)),
+                  'p99': _ms(percentile(total, 0.99)),
+                  'max': _ms(total[-1] if total else None),
+                  'stages': {}}
+        for stage in range(1, len(self.stages)):
+            result['stages'][self.stages[stage]] = {'p50': _ms(percentile(durations[stage], 0.5)),
+                                                    'p99': _ms(percentile(durations[stage], 0.99))}
+        return result
+
+
+def _ms(value):
+    return None if value is None else value / 1e6
+
+
+def format_report(report) -> str:
+    lines = []
+    for name, path in report.items():
+        if not path['count']:
+            lines.append(f'{name}: no reaction')
+            continue
+        lines.append(f"{name}: {path['count']} reactions, p50 {path['p50']:.3f} ms, p90 {path['p90']:.3f} ms, "
+                     f"p99 {path['p99']:.3f} ms, max {path['max']:.3f} ms")
+        for stage, values in path['stages'].items():
+            lines.append(f"    {stage:12} p50 {values['p50']:.3f} ms, p99 {values['p99']:.3f} ms")
+    return '\n'.join(lines)
+
+
+# sensor pressed to motor stopped
+SENSOR_TO_STOP = 'sensor_to_stop'
+SENSOR_EDGE = 0
+SENSOR_LOCKED = 1
+SENSOR_MOTOR_STOP = 2
+# button released to motor started
+BUTTON_TO_START = 'button_to_start'
+BUTTON_RELEASED = 0
+BUTTON_SCHEDULED = 1
+BUTTON_QUEUED = 2
+BUTTON_EXECUTED = 3
+BUTTON_MOTOR_START = 4
+
+sensor_trace = TracePath(SENSOR_TO_STOP, ('edge', 'locked', 'motor_stop'))
+button_trace = TracePath(BUTTON_TO_START, ('released', 'scheduled', 'queued', 'executed', 'motor_start'))
+PATHS = (sensor_trace, button_trace)
+
+
+def report() -> dict:
+    """report of all paths, by name
+    """
+    return {path.name: path.report() for path in PATHS}
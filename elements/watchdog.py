@@ -1,70 +1,87 @@
-import threading
 import logging
 import systemd.daemon
 from .email_sender import EmailSender
+from .notifier import AlertNotifier
+from .temperature import TemperatureSampler, RASPBERRY_TEMP
+from .clock import clock as default_clock
+from .door_status import door_status
+from .event_bus import event_bus, TEMPERATURE_ALERT
 
 logger = logging.getLogger('watch_dog')
 
 
-RASPBERRY_TEMP = "/sys/class/thermal/thermal_zone0/temp"
 WARNING_TEMPERATURE = 52
 ALERT_TEMPERATURE = 70
 CRITICAL_TEMPERATURE = 80
+# change of temperature published at once in door status, smaller ones at the next watchdog period,
+# so long-polling clients are not woken up each second
+STATUS_TEMPERATURE_STEP = 0.5
 
 
-def get_cpu_temperature_sysfile(logger):
+def get_cpu_temperature_sysfile(logger, path=RASPBERRY_TEMP):
     try:
-        with open(RASPBERRY_TEMP, "r") as f:
+        with open(path, "r") as f:
             temp_str = f.read().strip()
             temp_milli_celsius = int(temp_str)
             return temp_milli_celsius / 1000.0
     except FileNotFoundError:
-        logger.error(f"file not found: {RASPBERRY_TEMP}")
+        logger.error(f"file not found: {path}")
         return None
     except Exception as e:
         logger.error(f"can't read temperature: {e}")
         return None
 
 
+# levels of temperature, with hysteresis: a level is reached at its threshold
+# and left only under threshold - hysteresis, so a temperature around a threshold
+# gives one message. A message is returned each time a higher level is reached
 class TemperatureMonitor:
-    def __init__(self, critical: float, alert: float, warning: float, delta: float=2):
+    def __init__(self, critical: float, alert: float, warning: float, hysteresis: float=2):
         self.threshold_critical = critical
         self.threshold_alert = alert
         self.threshold_warning = warning
-        self.delta = delta
-        self.last_temperature = 0
-        
+        self.hysteresis = hysteresis
+        # 0: normal, then warning, alert and critical
+        self.thresholds = (None, warning, alert, critical)
+        self.level = 0
+
     def check_temperature(self, current_temp):
-        if current_temp >= self.threshold_critical:
-            if current_temp >= (self.last_temperature + self.delta):
-                self.last_temperature = current_temp
-                result = {"message": f"Température critique atteinte: {current_temp}°C", "subject": "ERROR temperature"}
-                return result
-            return None
-        elif current_temp >= self.threshold_alert:
-            if current_temp >= (self.last_temperature + self.delta) or self.last_temperature >= self.threshold_critical:
-                self.last_temperature = current_temp
-                result = {"message": f"Température élevée: {current_temp}°C", "subject": "ALERT temperature"}
-                return result
-            return None
-        elif current_temp >= self.threshold_warning:
-            if current_temp >= (self.last_temperature + self.delta) or self.last_temperature >= self.threshold_alert:
-                self.last_temperature = current_temp
-                result = {"message": f"Température chaude: {current_temp}°C", "subject": "WARNING temperature"}
-                return result
+        if current_temp is None:
             return None
-        # TODO if temp = 51.99, then warning appears only after 53.99 and not 52
-        self.last_temperature = current_temp
+        reached = 0
+        for level in range(len(self.thresholds) - 1, 0, -1):
+            if current_temp >= self.thresholds[level]:
+                reached = level
+                break
+        if reached > self.level:
+            self.level = reached
+            if reached == 3:
+                return {"message": f"Température critique atteinte: {current_temp}°C", "subject": "ERROR temperature"}
+            if reached == 2:
+                return {"message": f"Température élevée: {current_temp}°C", "subject": "ALERT temperature"}
+            return {"message": f"Température chaude: {current_temp}°C", "subject": "WARNING temperature"}
+        while self.level > 0 and current_temp < self.thresholds[self.level] - self.hysteresis:
+            self.level -= 1
         return None
 
 
 class WatchDog:
-    def __init__(self, delay=600, email: EmailSender = None):
+    def __init__(self, delay=600, email: EmailSender = None, notifier: AlertNotifier = None,
+                 sampler: TemperatureSampler = None, clock=None):
         self.running = True
+        self.clock = clock if clock else default_clock
         self.delay = delay
         self.email = email
+        # temperature alerts are limited and merged before email
+        self.notifier = notifier if notifier else AlertNotifier(email, clock=self.clock)
+        self.timer = None
+        self.published_temperature = None
         self.monitor = TemperatureMonitor(CRITICAL_TEMPERATURE, ALERT_TEMPERATURE, WARNING_TEMPERATURE)
+        # each sample is checked, so a short peak is seen
+        self.sampler = sampler if sampler else TemperatureSampler(RASPBERRY_TEMP, clock=self.clock)
+        self.sampler.callback = self.__check_sample
         logger.debug(f"start watchdog, delay: {self.delay} seconds")
+        self.sampler.start()
         self.send()
 
     def send(self):
@@ -78,18 +95,40 @@ class WatchDog:
 
         if self.running:
             # send signal each <delay> seconds
-            timer = threading.Timer(self.delay, self.send)
-            logger.debug(f"next watchdog in {self.delay} seconds")
-            timer.start()
+            self.timer = self.clock.call_later(self.delay, self.send)
+            logger.debug(f"next watchdog in {self.delay} seconds, {self.clock.pending()} timers pending")
 
     def stop(self):
         self.running = False
+        if self.timer:
+            self.timer.cancel()
+        self.sampler.stop()
+        self.notifier.stop()
 
     def __check_temperature(self):
-        """check temperature and send email according to its level
+        """publish temperature, and check it when sampler can't read it
+        """
+        if self.sampler.available:
+            stats = self.sampler.stats()
+            temperature = stats['current']
+            logger.debug(f"temperature: {stats}")
+        else:
+            temperature = get_cpu_temperature_sysfile(logger, self.sampler.path)
+            self.__check_sample(temperature)
+            logger.debug(f"temperature: {temperature}")
+        self.__publish_temperature(temperature, True)
+
+    def __check_sample(self, temperature):
+        """publish a temperature change, send email when temperature reaches a higher level
         """
-        temperature = get_cpu_temperature_sysfile(logger)
         message = self.monitor.check_temperature(temperature)
+        self.__publish_temperature(temperature, message is not None)
         if message:
-            self.email.send_message(f"{message['message']}", f"{message['subject']}")
-        logger.debug(f"temperature: {temperature}")
+            event_bus.publish(TEMPERATURE_ALERT, temperature=temperature, level=message['subject'])
+            self.notifier.notify(f"{message['message']}", f"{message['subject']}")
+
+    def __publish_temperature(self, temperature, force=False):
+        last = self.published_temperature
+        if force or temperature is None or last is None or abs(temperature - last) >= STATUS_TEMPERATURE_STEP:
+            self.published_temperature = temperature
+            door_status.update(cpu_temperature=temperature)
@@ -46,9 +46,12 @@ if __name__ == "__main__":
         print("can't find configuration file, or bad content, try option -h !")
         exit(1)
 
-    logger = Logger(configuration)
+    # door management starts at the same time and rotates the log file, not this process
+    logger = Logger(configuration, rotate=False)
     temp = get_cpu_temperature_sysfile(logger)
 
     email = EmailSender(configuration, logger)
 
     email.send_message(f"temperature: {temp} °c", "start door management")
+    # if network is not ready, the message stays in spool for door management
+    email.stop(30)
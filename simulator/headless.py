@@ -0,0 +1,253 @@
+import os
+import signal
+import threading
+import time
+
+# set DOOR_SIMULATOR=headless to use this simulator instead of the tkinter one (sgpiozero)
+SIMULATOR_ENV = 'DOOR_SIMULATOR'
+HEADLESS = 'headless'
+# time for the door to go from closed to opened, in seconds, can be set by DOOR_TRAVEL_TIME
+TRAVEL_TIME_ENV = 'DOOR_TRAVEL_TIME'
+DEFAULT_TRAVEL_TIME = 5.0
+# position of the door, from closed to opened
+CLOSED = 0.0
+OPENED = 1.0
+
+
+def is_selected() -> bool:
+    return os.environ.get(SIMULATOR_ENV, '').lower() == HEADLESS
+
+
+# button simulation, without user interface
+# press and release inject edges, callbacks are called in the caller thread, like a GPIO edge
+class Button:
+    def __init__(self, gpio):
+        self.gpio = gpio
+        self.when_pressed = None
+        self.when_released = None
+        self.is_pressed = False
+
+    def press(self):
+        if self.is_pressed:
+            return
+        self.is_pressed = True
+        if self.when_pressed:
+            self.when_pressed()
+
+    def release(self):
+        if not self.is_pressed:
+            return
+        self.is_pressed = False
+        if self.when_released:
+            self.when_released()
+
+
+# sensor simulation, a sensor with "close" in its name is the close sensor, otherwise the open one
+# the sensor is pressed by the door model when the door reaches it
+class CheckButton(Button):
+    def __init__(self, gpio, name=None):
+        super().__init__(gpio)
+        self.name = name
+        door.add_sensor(self)
+
+
+# motor simulation, it moves the door model
+class Motor:
+    def __init__(self, forward, backward):
+        self.gpio_forward = forward
+        self.gpio_backward = backward
+        self.is_active = False
+        self.direction = False
+        door.motor = self
+
+    # open door
+    def forward(self):
+        self.direction = True
+        self.is_active = True
+        door.move(OPENED)
+
+    # close door
+    def backward(self):
+        self.direction = False
+        self.is_active = True
+        door.move(CLOSED)
+
+    def reverse(self):
+        if self.is_active:
+            self.direction = not self.direction
+            door.move(OPENED if self.direction else CLOSED)
+
+    def stop(self):
+        self.direction = 0
+        self.is_active = False
+        door.halt()
+
+
+class LED:
+    def __init__(self, gpio):
+        self.gpio = gpio
+        self.is_lit = False
+
+    def on(self):
+        self.is_lit = True
+
+    def off(self):
+        self.is_lit = False
+
+    def toggle(self):
+        if self.is_lit:
+            self.off()
+        else:
+            self.on()
+
+
+# -------------------------------------------------
+# Object which simulates the door between its two
+# sensors. The motor moves it at constant speed, it
+# takes travel_time from closed to opened. The sensor
+# left by the door is released when the motor starts,
+# the one reached is pressed from a timer thread, like
+# a GPIO edge. A door stopped halfway keeps its position.
+# Without travel_time, the door doesn't move: sensors
+# change only by press and release, like in a replay.
+# With a clock (like elements.clock.VirtualClock), the
+# door moves in the time of this clock instead
+# -------------------------------------------------
+class DoorModel:
+    def __init__(self, travel_time=DEFAULT_TRAVEL_TIME, position=CLOSED):
+        """door model
+
+        Args:
+            travel_time (float, optional): time from closed to opened, in seconds, None to not move the door.
+                Defaults to DEFAULT_TRAVEL_TIME.
+            position (float, optional): initial position, from CLOSED to OPENED. Defaults to CLOSED.
+        """
+        self.travel_time = travel_time
+        self.position = position
+        self.motor = None
+        self.open_sensor = None
+        self.close_sensor = None
+        # target of the current move, None when door doesn't move
+        self.target = None
+        self.travels = 0
+        # object with monotonic() and call_later(delay, function, *args), None for real time
+        self.clock = None
+        self._start = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def reset(self, position=CLOSED, travel_time=None, clock=None):
+        """stop the door and forget its elements, to build new ones
+
+        Args:
+            position (float, optional): new position. Defaults to CLOSED.
+            travel_time (float, optional): new travel time, None to keep the current one. Defaults to None.
+            clock (optional): clock of the door, None for real time. Defaults to None.
+        """
+        self.halt()
+        with self._lock:
+            self.position = position
+            if travel_time is not None:
+                self.travel_time = travel_time
+            self.clock = clock
+            self.motor = None
+            self.open_sensor = None
+            self.close_sensor = None
+            self.travels = 0
+
+    def add_sensor(self, sensor):
+        # a sensor reached at startup is pressed, without edge
+        if sensor.name and "close" in sensor.name:
+            self.close_sensor = sensor
+            sensor.is_pressed = self.position <= CLOSED
+        else:
+            self.open_sensor = sensor
+            sensor.is_pressed = self.position >= OPENED
+
+    def _update_position(self):
+        if self.target is None or self.travel_time is None:
+            return
+        moved = (self._monotonic() - self._start) / self.travel_time if self.travel_time > 0 else OPENED
+        if self.target > self.position:
+            self.position = min(self.target, self.position + moved)
+        else:
+            self.position = max(self.target, self.position - moved)
+        self._start = self._monotonic()
+
+    def _monotonic(self):
+        return self.clock.monotonic() if self.clock else time.monotonic()
+
+    def move(self, target):
+        """start the door to a position
+
+        Args:
+            target (float): CLOSED or OPENED
+        """
+        if self.travel_time is None:
+            return
+        with self._lock:
+            self._update_position()
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            left = self.close_sensor if target > self.position else self.open_sensor
+            if self.position == target:
+                # already there, the sensor stays pressed
+                self.target = None
+                return
+            self.target = target
+            self._start = self._monotonic()
+            delay = abs(target - self.position) * self.travel_time
+            if self.clock:
+                self._timer = self.clock.call_later(delay, self._reached, target)
+            else:
+                self._timer = threading.Timer(delay, self._reached, (target, ))
+                self._timer.daemon = True
+                self._timer.start()
+        if left:
+            left.release()
+
+    def halt(self):
+        with self._lock:
+            self._update_position()
+            self.target = None
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+
+    def _reached(self, target):
+        with self._lock:
+            if self.target != target:
+                # stopped or reversed meanwhile
+                return
+            self.position = target
+            self.target = None
+            self._timer = None
+            self.travels += 1
+        sensor = self.open_sensor if target == OPENED else self.close_sensor
+        if sensor:
+            sensor.press()
+
+    def wait_still(self, timeout=None) -> bool:
+        """wait until the door doesn't move
+
+        Returns:
+            bool: True if the door doesn't move
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.target is not None:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+
+# the door of all simulated elements
+door = DoorModel(float(os.environ.get(TRAVEL_TIME_ENV, DEFAULT_TRAVEL_TIME)))
+
+
+# same interface than sgpiozero.GpioUi, without window
+class GpioUi:
+    def show_ui(self):
+        # wait for Ctrl+C, like gpiozero pause
+        signal.pause()
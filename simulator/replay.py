@@ -0,0 +1,215 @@
+# --------------------------------------------------
+# replay GPIO traces recorded by a door (gpio_trace_file)
+# through the real AdvancedButton (or MasterButton),
+# AdvancedMotor and AutomaticControl, on the headless
+# simulator and a VirtualClock, then compare the motor
+# commands with the recorded ones. Sensor edges come
+# from the trace, the door model doesn't move.
+# speed 0 replays as fast as possible, 1 in real time
+#
+# python -m simulator.replay [-s 0] [-t 0.5] [--master] trace ...
+# --------------------------------------------------
+import argparse
+import difflib
+import os
+import sys
+import time
+from concurrent.futures import Future
+
+# the headless simulator, when gpiozero is not installed. Set before elements are imported
+os.environ.setdefault('DOOR_SIMULATOR', 'headless')
+
+from simulator.headless import door, CLOSED, OPENED, DEFAULT_TRAVEL_TIME
+from elements.clock import VirtualClock
+from elements.advanced_elements import AdvancedButton, MasterButton, AdvancedMotor, MotorCommandQueue, CommandResult
+from elements.advanced_elements import OPEN, CLOSE, FORCE_OPEN, FORCE_CLOSE, STOP
+from elements.automatic_door import AutomaticControl
+from elements.gpio_trace import gpio_trace, load, BUTTON_PRESS, BUTTON_RELEASE, SENSOR_PRESS, SENSOR_RELEASE, HTTP
+from elements.gpio_trace import MOTOR_COMMAND
+from elements.http_server import UP, DOWN, FORCE_UP, FORCE_DOWN
+
+# maximum difference between the recorded and replayed time of a command, in seconds
+DEFAULT_TOLERANCE = 0.5
+# GPIO of the motor when the trace has none
+FORWARD_GPIO = 17
+BACKWARD_GPIO = 18
+# commands of http actions, like door_management
+HTTP_COMMANDS = {UP: OPEN, DOWN: CLOSE, FORCE_UP: FORCE_OPEN, FORCE_DOWN: FORCE_CLOSE}
+
+# one ephemeris table by location, shared by all replays
+_ephemeris = {}
+
+
+# same commands as MotorCommandQueue, executed at once in the caller thread, so a replay
+# doesn't depend on thread scheduling
+class DirectCommands(MotorCommandQueue):
+    def submit(self, command) -> Future:
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self.motor.lock:
+            accepted = bool(self._execute(command))
+            run = self.motor.run if accepted and command != STOP else None
+        future.set_result(CommandResult(command, accepted, run))
+        return future
+
+
+def _inject(elements, kind, source, value):
+    motor, commands, buttons = elements
+    if kind in (BUTTON_PRESS, BUTTON_RELEASE):
+        button = buttons.get(source)
+        if button:
+            if kind == BUTTON_PRESS:
+                button.button.press()
+            else:
+                button.button.release()
+    elif kind in (SENSOR_PRESS, SENSOR_RELEASE):
+        sensor = motor.open_sensor if source == 'open' else motor.close_sensor
+        if sensor:
+            if kind == SENSOR_PRESS:
+                sensor.press()
+            else:
+                sensor.release()
+    elif kind == HTTP:
+        # unknown actions are refused by the http server
+        if value in HTTP_COMMANDS:
+            commands.submit(HTTP_COMMANDS[value])
+
+
+def _run(clock, end, speed):
+    if not speed:
+        clock.run_until(end)
+        return
+    while True:
+        next_time = clock.next_call()
+        if next_time is None or next_time > end:
+            break
+        time.sleep(max(0.0, next_time - clock.monotonic()) / speed)
+        clock.run_until(next_time)
+
+
+def replay(header, records, speed=0, button_class=AdvancedButton) -> list:
+    """replay the inputs of a trace
+
+    Args:
+        header (dict): header of the trace, see gpio_trace.load
+        records (list): records of the trace
+        speed (float, optional): 0 as fast as possible, 1 real time, 10 ten times faster. Defaults to 0.
+        button_class (optional): AdvancedButton or MasterButton. Defaults to AdvancedButton.
+
+    Returns:
+        list: records of the replay, inputs and motor commands
+    """
+    configuration = header['configuration']
+    sensors = header.get('sensors', {})
+    clock = VirtualClock(header['time'])
+    if sensors.get('open'):
+        position = OPENED
+    elif sensors.get('close'):
+        position = CLOSED
+    else:
+        position = (CLOSED + OPENED) / 2
+    door.reset(position=position, clock=clock)
+    # sensors only change with the edges of the trace
+    door.travel_time = None
+    replayed = gpio_trace.capture(clock)
+    control = None
+    try:
+        motor = AdvancedMotor(configuration.get('motor_forward_gpio', FORWARD_GPIO),
+                              configuration.get('motor_backward_gpio', BACKWARD_GPIO),
+                              open_timeout=configuration.get('open_timeout', 20),
+                              close_timeout=configuration.get('close_timeout', 20), clock=clock)
+        if 'door_closed_gpio' in configuration:
+            motor.set_close_sensor(configuration['door_closed_gpio'])
+        if 'door_opened_gpio' in configuration:
+            motor.set_open_sensor(configuration['door_opened_gpio'])
+        commands = DirectCommands(motor)
+        buttons = {}
+        if configuration.get('motor_button_gpio'):
+            gpio = configuration['motor_button_gpio']
+            buttons[gpio] = button_class(gpio, commands.toggle_door, commands.stop, clock=clock)
+
+        if 'latitude' in configuration and 'longitude' in configuration:
+            control = AutomaticControl(dict(configuration, ephemeris_file=None), commands, clock=clock)
+            key = (configuration['latitude'], configuration['longitude'])
+            control.ephemeris = _ephemeris.setdefault(key, control.ephemeris)
+            control.automatic_control()
+
+        end = 0.0
+        for moment, kind, source, value in records:
+            end = max(end, moment)
+            if kind != MOTOR_COMMAND:
+                clock.call_at(moment, _inject, (motor, commands, buttons), kind, source, value)
+        # let the last run reach its safety timeout
+        _run(clock, end + max(motor.open_timeout, motor.close_timeout) + 1, speed)
+    finally:
+        gpio_trace.close()
+        if control and control.timer:
+            control.timer.cancel()
+        door.reset(travel_time=DEFAULT_TRAVEL_TIME)
+    return replayed
+
+
+def motor_commands(records) -> list:
+    """(time, command) of each motor command of records
+    """
+    return [(moment, value) for moment, kind, _, value in records if kind == MOTOR_COMMAND]
+
+
+def diff(recorded, replayed, tolerance=DEFAULT_TOLERANCE) -> list:
+    """compare motor commands of a trace and of its replay
+
+    Returns:
+        list: (difference, command, recorded time, replayed time), difference is 'missing' (time of
+              replay is None), 'extra' (recorded time is None) or 'moved' (more than tolerance)
+    """
+    expected = motor_commands(recorded)
+    actual = motor_commands(replayed)
+    matcher = difflib.SequenceMatcher(None, [command for _, command in expected],
+                                      [command for _, command in actual], autojunk=False)
+    differences = []
+    for tag, first, last, replay_first, replay_last in matcher.get_opcodes():
+        if tag == 'equal':
+            for (recorded_time, command), (replayed_time, _) in zip(expected[first:last],
+                                                                    actual[replay_first:replay_last]):
+                if abs(replayed_time - recorded_time) > tolerance:
+                    differences.append(('moved', command, recorded_time, replayed_time))
+            continue
+        for recorded_time, command in expected[first:last]:
+            differences.append(('missing', command, recorded_time, None))
+        for replayed_time, command in actual[replay_first:replay_last]:
+            differences.append(('extra', command, None, replayed_time))
+    return differences
+
+
+def format_difference(difference) -> str:
+    kind, command, recorded_time, replayed_time = difference
+    recorded = '-' if recorded_time is None else f'{recorded_time:.3f} s'
+    replayed = '-' if replayed_time is None else f'{replayed_time:.3f} s'
+    return f'    {kind:8} {command:9} recorded {recorded:>12}  replayed {replayed:>12}'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('traces', nargs='+', help=u'trace files')
+    parser.add_argument('-s', '--speed', type=float, default=0,
+                        help=u'0 as fast as possible (default), 1 real time, 10 ten times faster')
+    parser.add_argument('-t', '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=u'maximum time difference of a command, in seconds')
+    parser.add_argument('--master', action='store_true', help=u'replay button as a MasterButton')
+    parameters = parser.parse_args()
+
+    start = time.monotonic()
+    different = 0
+    for path in parameters.traces:
+        trace_header, trace_records = load(path)
+        replay_records = replay(trace_header, trace_records, parameters.speed,
+                                MasterButton if parameters.master else AdvancedButton)
+        differences = diff(trace_records, replay_records, parameters.tolerance)
+        print(f'{path}: {len(motor_commands(trace_records))} commands, '
+              f'{"same" if not differences else str(len(differences)) + " differences"}')
+        for found in differences:
+            print(format_difference(found))
+        if differences:
+            different += 1
+    print(f'{len(parameters.traces)} traces in {time.monotonic() - start:.2f} s, {different} different')
+    sys.exit(1 if different else 0)
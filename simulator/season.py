@@ -0,0 +1,145 @@
+# --------------------------------------------------
+# replay the door control during days or a whole year
+# in a few seconds: the real AutomaticControl and
+# AdvancedMotor run on a VirtualClock, with the real
+# ephemeris and the headless simulator (its door model
+# presses the sensors). Each event goes to a timeline
+#
+# python -m simulator.season [-s 2026-01-01] [-d 365] [-o timeline.csv] [chicken.json]
+# --------------------------------------------------
+import argparse
+import json
+import os
+from collections import Counter
+from datetime import date, datetime, timezone
+
+# the headless simulator, when gpiozero is not installed. Set before elements are imported
+os.environ.setdefault('DOOR_SIMULATOR', 'headless')
+
+from simulator.headless import door, DEFAULT_TRAVEL_TIME
+from elements.clock import VirtualClock
+from elements.advanced_elements import AdvancedMotor, TIMEOUT
+from elements.automatic_door import AutomaticControl
+from elements.event_bus import event_bus, MOTOR_STOP, SENSOR_PRESS
+
+# GPIO numbers of the simulated elements, like chicken.json
+FORWARD_GPIO = 9
+BACKWARD_GPIO = 25
+CLOSE_SENSOR_GPIO = 7
+OPEN_SENSOR_GPIO = 5
+# the ephemeris table is computed for the whole replay, plus a margin
+MARGIN_DAYS = 4
+# default position, like door_management
+DEFAULT_CONFIGURATION = {'longitude': "2.294270", 'latitude': "48.858823"}
+
+
+def _format_time(timestamp) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _seconds_of_day(timestamp) -> int:
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    return moment.hour * 3600 + moment.minute * 60 + moment.second
+
+
+def _format_seconds(seconds) -> str:
+    return f'{seconds // 3600:02}:{seconds // 60 % 60:02}:{seconds % 60:02}'
+
+
+def replay(configuration, start, days, travel_time=DEFAULT_TRAVEL_TIME):
+    """replay the automatic control
+
+    Args:
+        configuration (dict): like chicken.json, at least latitude and longitude
+        start (date): first UTC day, the replay starts at midnight
+        days (int): number of days
+        travel_time (float, optional): time of the door between sensors, in seconds. Defaults to DEFAULT_TRAVEL_TIME.
+
+    Returns:
+        list: timeline, (UTC timestamp, kind, data) of each event
+    """
+    beginning = datetime(start.year, start.month, start.day, tzinfo=timezone.utc).timestamp()
+    clock = VirtualClock(beginning)
+    door.reset(travel_time=travel_time, clock=clock)
+
+    motor = AdvancedMotor(FORWARD_GPIO, BACKWARD_GPIO, open_timeout=configuration.get('open_timeout', 20),
+                          close_timeout=configuration.get('close_timeout', 20), clock=clock)
+    motor.set_close_sensor(CLOSE_SENSOR_GPIO)
+    motor.set_open_sensor(OPEN_SENSOR_GPIO)
+    # the table stays in memory, and covers all days in one computation
+    control = AutomaticControl(dict(configuration, ephemeris_file=None), motor, clock=clock)
+    control.ephemeris.days = days + MARGIN_DAYS
+
+    timeline = []
+
+    # events are published in the replay thread, they get the virtual time
+    def record():
+        for _, kind, _, data in subscription.get_all():
+            timeline.append((clock.time(), kind, data))
+
+    subscription = event_bus.subscribe(notify=record)
+    try:
+        control.automatic_control()
+        clock.run_until(days * 86400.0)
+    finally:
+        subscription.close()
+        if control.timer:
+            control.timer.cancel()
+        door.reset()
+    return timeline
+
+
+def summarize(timeline, start, days) -> dict:
+    """check the timeline: each day must have one open and one close
+
+    Returns:
+        dict: number of events by kind, timeouts, days without open or close,
+              earliest and latest UTC time of open and close sensors
+    """
+    kinds = Counter(kind for _, kind, _ in timeline)
+    timeouts = [_format_time(moment) for moment, kind, data in timeline
+                if kind == MOTOR_STOP and data.get('reason') == TIMEOUT]
+    reached = {'open': {}, 'close': {}}
+    for moment, kind, data in timeline:
+        if kind == SENSOR_PRESS:
+            day = datetime.fromtimestamp(moment, timezone.utc).date()
+            reached[data['sensor']].setdefault(day, _seconds_of_day(moment))
+    all_days = [date.fromordinal(start.toordinal() + index) for index in range(days)]
+    summary = {'events': dict(kinds), 'timeouts': timeouts}
+    for sensor, by_day in reached.items():
+        summary[f'days_without_{sensor}'] = [str(day) for day in all_days if day not in by_day]
+        values = list(by_day.values())
+        summary[f'earliest_{sensor}'] = _format_seconds(min(values)) if values else None
+        summary[f'latest_{sensor}'] = _format_seconds(max(values)) if values else None
+    return summary
+
+
+def write_timeline(timeline, file):
+    file.write('time UTC;event;data\n')
+    for moment, kind, data in timeline:
+        details = ' '.join(f'{key}={value}' for key, value in data.items())
+        file.write(f'{_format_time(moment)};{kind};{details}\n')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('configuration', nargs='?', help=u'configuration file, like chicken.json')
+    parser.add_argument('-s', '--start', help=u'first UTC day, YYYY-MM-DD, default is today', required=False)
+    parser.add_argument('-d', '--days', type=int, default=365, help=u'number of days, default is 365')
+    parser.add_argument('-t', '--travel-time', type=float, default=DEFAULT_TRAVEL_TIME,
+                        help=u'time of the door between sensors, in seconds')
+    parser.add_argument('-o', '--output', help=u'timeline file, csv', required=False)
+    parameters = parser.parse_args()
+
+    if parameters.configuration:
+        with open(parameters.configuration, 'r') as f:
+            door_configuration = json.loads(f.read())
+    else:
+        door_configuration = DEFAULT_CONFIGURATION
+    first_day = date.fromisoformat(parameters.start) if parameters.start else datetime.now(timezone.utc).date()
+
+    events = replay(door_configuration, first_day, parameters.days, parameters.travel_time)
+    if parameters.output:
+        with open(parameters.output, 'w') as output:
+            write_timeline(events, output)
+    print(json.dumps(summarize(events, first_day, parameters.days), indent=2))
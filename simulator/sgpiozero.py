@@ -31,6 +31,7 @@ class CheckButton:
         self.gpio = gpio
         self.name = name
         self.when_pressed = None
+        self.when_released = None
         self.is_pressed = False
         ui = GpioUi()
         self.checkbutton_state = ui.add_checkbutton(self)
@@ -38,9 +39,11 @@ class CheckButton:
     # call by tkinter
     def button_updated(self, *args):
         self.is_pressed = self.checkbutton_state.get()
-        if self.when_pressed:
-            if self.is_pressed:
+        if self.is_pressed:
+            if self.when_pressed:
                 self.when_pressed()
+        elif self.when_released:
+            self.when_released()
         return False
 
 
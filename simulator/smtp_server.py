@@ -0,0 +1,126 @@
+import argparse
+import socketserver
+import threading
+from email import message_from_bytes, policy
+
+
+# handler of one SMTP session, without TLS
+# each accepted message is given to server.deliver
+class SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost simulated SMTP server')
+        sender = None
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command[:4].upper()
+            if self.server.refuse:
+                self.reply('421 service not available')
+                return
+            if verb in ('EHLO', 'HELO'):
+                self.server.sessions += 1
+                self.reply('250-localhost')
+                self.reply('250 AUTH PLAIN LOGIN')
+            elif verb == 'AUTH':
+                parts = command.split()
+                if len(parts) == 2 and parts[1].upper() == 'LOGIN':
+                    # user then password, both accepted
+                    self.reply('334 VXNlcm5hbWU6')
+                    self.rfile.readline()
+                    self.reply('334 UGFzc3dvcmQ6')
+                    self.rfile.readline()
+                self.server.logins += 1
+                self.reply('235 authentication successful')
+            elif verb == 'MAIL':
+                sender = command.split(':', 1)[1].strip()
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipient = command.split(':', 1)[1].strip()
+                if recipient.strip('<>') in self.server.rejected:
+                    self.reply('550 mailbox unavailable')
+                    continue
+                recipients.append(recipient)
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 end data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b'.\r\n', b'.\n'):
+                        break
+                    # remove dot stuffing
+                    data.append(line[1:] if line.startswith(b'..') else line)
+                self.server.deliver(sender, recipients, b''.join(data))
+                self.reply('250 OK: queued')
+            elif verb == 'RSET':
+                sender = None
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('502 command not implemented')
+
+
+# -------------------------------------------------
+# SMTP server which stands for the mail provider, to
+# test the emails on a computer: it accepts every login
+# and keeps the messages in memory (and prints them).
+# refuse simulates a server or a network down, rejected
+# recipients are refused for ever (a bad address)
+# -------------------------------------------------
+class SmtpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=8025, host='localhost', verbose=False):
+        super().__init__((host, port), SmtpHandler)
+        self.messages = []
+        self.sessions = 0
+        self.logins = 0
+        self.refuse = False
+        self.rejected = set()
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def deliver(self, sender, recipients, data):
+        message = message_from_bytes(data, policy=policy.default)
+        with self._lock:
+            self.messages.append((sender, recipients, message))
+        if self.verbose:
+            print(f"--- from {sender} to {', '.join(recipients)}: {message['Subject']}")
+            body = message.get_body(('plain', ))
+            if body:
+                print(body.get_content())
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='smtp_server', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='simulated SMTP server, without TLS')
+    parser.add_argument('-p', '--port', type=int, default=8025, help='port, default is 8025')
+    parameters = parser.parse_args()
+
+    server = SmtpServer(parameters.port, verbose=True)
+    print(f"listen on localhost:{parameters.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,32 @@
+# --------------------------------------------------
+# AsyncApiHttpServer: stop after a failed start, like a
+# port already in use, doesn't raise in the shutdown path
+#
+# python -m unittest tests.test_async_http_server
+# --------------------------------------------------
+import socket
+import unittest
+
+from elements.async_http_server import AsyncApiHttpServer
+
+
+class AsyncHttpServerTest(unittest.TestCase):
+    def test_stop_after_failed_start(self):
+        with socket.socket() as used:
+            used.bind(('localhost', 0))
+            used.listen()
+            server = AsyncApiHttpServer(used.getsockname()[1], 'token')
+            with self.assertLogs('http_server', 'ERROR'):
+                server.start()
+            self.assertFalse(server.is_running)
+            server.stop()
+        self.assertFalse(server.is_running)
+
+    def test_stop_without_start(self):
+        server = AsyncApiHttpServer(0, 'token')
+        server.stop()
+        self.assertFalse(server.is_running)
+
+
+if __name__ == '__main__':
+    unittest.main()
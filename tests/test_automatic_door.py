@@ -0,0 +1,67 @@
+# --------------------------------------------------
+# AutomaticControl and EphemerisCache: without sun rise
+# or sun set in the table (polar day or night), the door
+# is not moved and the schedule is checked again later
+#
+# python -m unittest tests.test_automatic_door
+# --------------------------------------------------
+import unittest
+from array import array
+
+from elements.automatic_door import AutomaticControl, NO_EVENT_DELAY
+from elements.clock import VirtualClock
+from elements.ephemeris_cache import EphemerisCache, PAST_MARGIN
+
+START = 1767225600.0
+# a sun set and a sun rise, then a long polar day
+RISINGS = (START + 6 * 3600, )
+SETTINGS = (START - 6 * 3600, )
+
+
+def polar_cache(now) -> EphemerisCache:
+    cache = EphemerisCache('78.2', '15.6', None)
+    # like a table just computed, it is not computed again
+    cache.loaded = True
+    cache.start = now - PAST_MARGIN
+    cache.risings = array('d', RISINGS)
+    cache.settings = array('d', SETTINGS)
+    return cache
+
+
+class _Motor:
+    open_timeout = 20
+    close_timeout = 20
+
+    def __init__(self):
+        self.commands = []
+
+    def open_door(self, force=False):
+        self.commands.append('open')
+        return True
+
+    def close_door(self, force=False):
+        self.commands.append('close')
+        return True
+
+
+class PolarTest(unittest.TestCase):
+    def test_no_event_after_now(self):
+        now = START + 86400
+        cache = polar_cache(now)
+        self.assertIsNone(cache.next_setting(now))
+        self.assertIsNone(cache.next_rising(now))
+
+    def test_door_is_not_moved(self):
+        clock = VirtualClock(START + 86400)
+        motor = _Motor()
+        control = AutomaticControl({'latitude': '78.2', 'longitude': '15.6', 'ephemeris_file': None}, motor,
+                                   clock=clock)
+        control.ephemeris = polar_cache(clock.time())
+        self.assertIsNone(control.automatic_control())
+        self.assertEqual(motor.commands, [])
+        self.assertEqual(clock.next_call(), clock.monotonic() + NO_EVENT_DELAY)
+        control.timer.cancel()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+# --------------------------------------------------
+# run_batch: a malformed batch is refused before its
+# first command
+#
+# python -m unittest tests.test_batch
+# --------------------------------------------------
+import unittest
+
+from elements.batch import run_batch, UNTIL_ACCEPTED
+
+ACTIONS = ('up', 'down')
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.executed = []
+
+    def execute(self, action):
+        self.executed.append(action)
+        return None
+
+    def check_refused(self, steps):
+        with self.assertRaises(ValueError):
+            run_batch({'steps': steps}, self.execute, ACTIONS)
+        self.assertEqual(self.executed, [])
+
+    def test_action_which_is_not_a_name(self):
+        for action in ([1], {}, None, 3):
+            self.check_refused([{'action': 'up', 'until': UNTIL_ACCEPTED}, {'action': action}])
+
+    def test_unknown_action(self):
+        self.check_refused([{'action': 'up', 'until': UNTIL_ACCEPTED}, {'action': 'fly'}])
+
+    def test_bool_is_not_a_time(self):
+        self.check_refused([{'action': 'up', 'wait': True}])
+        self.check_refused([{'action': 'up', 'timeout': False}])
+
+    def test_action_not_active(self):
+        report = run_batch({'steps': [{'action': 'down', 'wait': 0}]}, self.execute, ACTIONS)
+        self.assertEqual(self.executed, ['down'])
+        self.assertFalse(report['success'])
+        self.assertEqual(report['steps'][0]['error'], 'action not active')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+# --------------------------------------------------
+# Job: the first outcome is kept, whoever finishes it
+#
+# python -m unittest tests.test_jobs
+# --------------------------------------------------
+import concurrent.futures
+import threading
+import unittest
+
+from elements.jobs import Job, JobRegistry, DONE, ERROR, REFUSED
+
+
+class JobTest(unittest.TestCase):
+    def test_first_outcome_is_kept(self):
+        job = Job('1', 'up')
+        job.follow(False)
+        self.assertFalse(job.finish(False, ERROR))
+        self.assertEqual(job.to_dict()['outcome'], REFUSED)
+        self.assertEqual(job.done.result(0), REFUSED)
+
+    def test_concurrent_finish(self):
+        job = Job('1', 'up')
+        command = concurrent.futures.Future()
+        job.follow(command)
+        start = threading.Barrier(2)
+
+        def fail():
+            start.wait()
+            job.finish(False, ERROR)
+        thread = threading.Thread(target=fail)
+        thread.start()
+        start.wait()
+        command.set_result(True)
+        thread.join()
+        self.assertTrue(job.wait(1))
+        state = job.to_dict()
+        # outcome and accepted of the same finish
+        self.assertIn((state['accepted'], state['outcome']), ((True, DONE), (False, ERROR)))
+        self.assertEqual(job.done.result(0), state['outcome'])
+
+    def test_registry_forgets_oldest(self):
+        registry = JobRegistry(size=2)
+        first = registry.create('up')
+        registry.create('down')
+        registry.create('up')
+        self.assertIsNone(registry.get(first.id))
+        self.assertEqual(len(registry), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# --------------------------------------------------
+# Journal: size limit with rotation, and reports which
+# read the records written since the last one
+#
+# python -m unittest tests.test_journal
+# --------------------------------------------------
+import os
+import tempfile
+import unittest
+
+from elements.event_bus import MOTOR_START, MOTOR_STOP
+from elements.format_email_body import LogCheckpoint
+from elements.journal import Journal, JournalReader, read_new_entries, HEADER, RECORD, MOTOR, BACKUP_SUFFIX
+
+RECORDS = 10
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'journal.bin')
+        self.journal = Journal()
+        self.journal.open(self.path, HEADER.size + RECORDS * RECORD.size)
+        self.checkpoint = LogCheckpoint(os.path.join(self.directory.name, 'journal.bin.checkpoint'))
+
+    def tearDown(self):
+        self.journal.close()
+        self.directory.cleanup()
+
+    def write(self, count, kind=MOTOR_START):
+        for _ in range(count):
+            self.journal.write(kind, MOTOR, 'open')
+
+    def test_full_journal_rotates(self):
+        self.write(RECORDS + 3)
+        self.assertEqual(os.path.getsize(self.path + BACKUP_SUFFIX), HEADER.size + RECORDS * RECORD.size)
+        with JournalReader(self.path) as reader:
+            self.assertEqual(len(reader), 3)
+        self.write(2 * RECORDS)
+        # only one backup is kept
+        self.assertLessEqual(os.path.getsize(self.path), HEADER.size + RECORDS * RECORD.size)
+
+    def test_reopen_keeps_size(self):
+        self.write(RECORDS - 1)
+        self.journal.open(self.path, HEADER.size + RECORDS * RECORD.size)
+        self.write(1)
+        self.assertTrue(os.path.exists(self.path + BACKUP_SUFFIX))
+
+    def test_failed_rotation_is_not_retried(self):
+        # a directory in place of the backup
+        os.mkdir(self.path + BACKUP_SUFFIX)
+        with self.assertLogs('journal', 'ERROR') as logs:
+            self.write(RECORDS + 5)
+        self.assertEqual(len(logs.records), 1)
+        with JournalReader(self.path) as reader:
+            self.assertEqual(len(reader), RECORDS + 5)
+        # rotation is tried again after the next open
+        os.rmdir(self.path + BACKUP_SUFFIX)
+        self.journal.open(self.path, HEADER.size + RECORDS * RECORD.size)
+        self.write(1)
+        self.assertTrue(os.path.isfile(self.path + BACKUP_SUFFIX))
+
+    def test_report_reads_rotated_records(self):
+        self.write(RECORDS - 2)
+        self.assertEqual(len(read_new_entries(self.path, self.checkpoint)), RECORDS - 2)
+        self.write(2, MOTOR_STOP)
+        self.write(4)
+        entries = read_new_entries(self.path, self.checkpoint)
+        self.assertEqual([entry.kind for entry in entries], [MOTOR_STOP] * 2 + [MOTOR_START] * 4)
+        self.assertEqual(read_new_entries(self.path, self.checkpoint), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# --------------------------------------------------
+# door events of the log since the last report, when
+# the log rotated none, once or several times
+#
+# python -m unittest tests.test_log_report
+# --------------------------------------------------
+import gzip
+import os
+import tempfile
+import unittest
+
+from elements.format_email_body import LogCheckpoint, iter_new_events
+
+
+def record(second, message):
+    return f'2026-05-01 06:00:{second:02},000 - advanced_elements - INFO - {message}\n'
+
+
+class LogReportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.directory.name, 'door.log')
+        self.checkpoint = LogCheckpoint(os.path.join(self.directory.name, 'door.log.checkpoint'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, path, lines, compressed=False):
+        with (gzip.open(path, 'wt') if compressed else open(path, 'a')) as file:
+            file.write(''.join(lines))
+
+    def rotate(self):
+        # like CompressedRotatingFileHandler with 2 backups
+        if os.path.exists(self.log_file + '.1.gz'):
+            os.replace(self.log_file + '.1.gz', self.log_file + '.2.gz')
+        with open(self.log_file, 'rb') as plain, gzip.open(self.log_file + '.1.gz', 'wb') as compressed:
+            compressed.write(plain.read())
+        os.remove(self.log_file)
+
+    def report(self) -> list:
+        events = [message for _, _, message in iter_new_events(self.log_file, self.checkpoint)]
+        self.checkpoint.save()
+        self.checkpoint.load()
+        return events
+
+    def test_first_report_reads_backups(self):
+        self.write(self.log_file, [record(0, 'open door')])
+        self.rotate()
+        self.write(self.log_file, [record(1, 'close door')])
+        self.assertEqual(self.report(), ['open', 'close'])
+        self.assertEqual(self.report(), [])
+
+    def test_rotated_once(self):
+        self.write(self.log_file, [record(0, 'open door')])
+        self.assertEqual(self.report(), ['open'])
+        self.write(self.log_file, [record(1, 'close door')])
+        self.rotate()
+        self.write(self.log_file, [record(2, 'open door')])
+        self.assertEqual(self.report(), ['close', 'open'])
+
+    def test_rotated_twice(self):
+        self.write(self.log_file, [record(0, 'open door')])
+        self.assertEqual(self.report(), ['open'])
+        self.write(self.log_file, [record(1, 'close door')])
+        self.rotate()
+        self.write(self.log_file, [record(2, 'open door'), record(3, 'close door')])
+        self.rotate()
+        self.write(self.log_file, [record(4, 'open door')])
+        # the event already reported is in log_file.2.gz, with the next one
+        self.assertEqual(self.report(), ['close', 'open', 'close', 'open'])
+        self.assertEqual(self.report(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+# --------------------------------------------------
+# MailSpool against the simulated SMTP server: messages
+# left in spool, connection reused, server down then
+# back, network back, recipient refused, file written
+# by the spool thread
+#
+# python -m unittest tests.test_mail_spool
+# --------------------------------------------------
+import os
+import tempfile
+import threading
+import time
+import unittest
+from email.message import EmailMessage
+
+from elements.mail_spool import MailSpool, FAILED_SUFFIX
+from simulator.smtp_server import SmtpServer
+
+TIMEOUT = 5
+# routes file with and without a default route
+ROUTES_HEADER = 'Iface\tDestination\tGateway\tFlags\tRefCnt\tUse\tMetric\tMask\tMTU\tWindow\tIRTT\n'
+DEFAULT_ROUTE = 'wlan0\t00000000\t0100A8C0\t0003\t0\t0\t600\t00000000\t0\t0\t0\n'
+LOCAL_ROUTE = 'wlan0\t0000A8C0\t00000000\t0001\t0\t0\t600\t00FFFFFF\t0\t0\t0\n'
+
+
+def wait_until(predicate, timeout=TIMEOUT) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def make_message(subject, destination='red.fox@example.com') -> EmailMessage:
+    message = EmailMessage()
+    message['From'] = 'door@example.com'
+    message['To'] = destination
+    message['Subject'] = subject
+    message.set_content('door opened')
+    return message
+
+
+class MailSpoolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.routes = os.path.join(self.directory.name, 'route')
+        self.set_network(True)
+        self.server = SmtpServer(port=0)
+        self.server.start()
+        self.spool = self.make_spool()
+
+    def tearDown(self):
+        self.spool.stop()
+        self.server.stop()
+        self.directory.cleanup()
+
+    def make_spool(self) -> MailSpool:
+        return MailSpool(os.path.join(self.directory.name, 'spool'), 'localhost', self.server.server_address[1],
+                         'door@example.com', 'password', starttls=False, route_file=self.routes)
+
+    def set_network(self, up):
+        with open(self.routes, 'w') as routes:
+            routes.write(ROUTES_HEADER + (DEFAULT_ROUTE if up else LOCAL_ROUTE))
+
+    def subjects(self) -> list:
+        return [message['Subject'] for _, _, message in self.server.messages]
+
+    def test_messages_left_in_spool_are_sent_at_start(self):
+        # like email_start.py, which leaves its message for door management
+        self.make_spool().put(make_message('start door management'))
+        self.spool.start()
+        self.assertTrue(wait_until(lambda: not self.spool.pending()))
+        self.assertEqual(self.subjects(), ['start door management'])
+
+    def test_one_connection_for_waiting_messages(self):
+        for index in range(3):
+            self.spool.put(make_message(f'report {index}'))
+        self.spool.start()
+        self.assertTrue(wait_until(lambda: self.spool.sent == 3))
+        self.assertEqual(self.subjects(), ['report 0', 'report 1', 'report 2'])
+        self.assertEqual(self.server.sessions, 1)
+        self.assertEqual(self.server.logins, 1)
+
+    def test_server_down_then_back(self):
+        self.server.refuse = True
+        self.spool.start()
+        self.spool.put(make_message('alert'))
+        self.assertTrue(wait_until(lambda: self.spool.retries == 1))
+        self.assertEqual(len(self.spool.pending()), 1)
+
+        self.server.refuse = False
+        self.spool.flush()
+        self.assertTrue(wait_until(lambda: not self.spool.pending()))
+        self.assertEqual(self.subjects(), ['alert'])
+        # a new connection after the failure
+        self.assertEqual(self.server.sessions, 1)
+
+    def test_network_back_sends_before_next_try(self):
+        self.spool.probe_period = 0.1
+        self.set_network(False)
+        self.server.refuse = True
+        self.spool.start()
+        self.spool.put(make_message('alert'))
+        self.assertTrue(wait_until(lambda: self.spool.retries == 1))
+
+        self.server.refuse = False
+        self.set_network(True)
+        # next try is 10 s later, the probe sees the default route before
+        self.assertTrue(wait_until(lambda: not self.spool.pending(), timeout=2))
+        self.assertEqual(self.subjects(), ['alert'])
+
+    def test_refused_recipient_is_kept_aside(self):
+        self.server.rejected.add('bad@example.com')
+        self.spool.start()
+        path = self.spool.put(make_message('lost', 'bad@example.com'))
+        self.spool.put(make_message('report'))
+        self.assertTrue(wait_until(lambda: not self.spool.pending()))
+        self.assertEqual(self.spool.failed, 1)
+        self.assertTrue(os.path.exists(path + FAILED_SUFFIX))
+        self.assertEqual(self.subjects(), ['report'])
+
+    def test_spool_thread_writes_messages(self):
+        # put is called from the scheduler thread, fsync must not run there
+        writers = []
+        write = self.spool._write
+
+        def recorded_write(path, content):
+            writers.append(threading.current_thread().name)
+            write(path, content)
+        self.spool._write = recorded_write
+        self.spool.start()
+        self.spool.put(make_message('alert'))
+        self.assertTrue(wait_until(lambda: not self.spool.pending()))
+        self.assertEqual(writers, ['mail_spool'])
+        self.assertEqual(self.subjects(), ['alert'])
+
+    def test_message_stays_for_next_start(self):
+        self.server.refuse = True
+        self.spool.start()
+        self.spool.put(make_message('start door management'))
+        self.assertTrue(wait_until(lambda: self.spool.retries == 1))
+        self.spool.stop()
+
+        self.server.refuse = False
+        self.spool = self.make_spool()
+        self.spool.start()
+        self.assertTrue(wait_until(lambda: not self.spool.pending()))
+        self.assertEqual(self.subjects(), ['start door management'])
+
+
+if __name__ == '__main__':
+    unittest.main()
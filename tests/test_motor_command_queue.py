@@ -0,0 +1,66 @@
+# --------------------------------------------------
+# MotorCommandQueue with AdvancedMotor on the headless
+# simulator: a burst of the same command is one run
+#
+# python -m unittest tests.test_motor_command_queue
+# --------------------------------------------------
+import os
+import unittest
+
+# the headless simulator, when gpiozero is not installed. Set before elements are imported
+os.environ.setdefault('DOOR_SIMULATOR', 'headless')
+
+from simulator.headless import door, CLOSED, OPENED, DEFAULT_TRAVEL_TIME
+from elements.advanced_elements import AdvancedMotor, MotorCommandQueue
+
+FORWARD_GPIO = 9
+BACKWARD_GPIO = 25
+CLOSE_SENSOR_GPIO = 7
+OPEN_SENSOR_GPIO = 5
+TRAVEL_TIME = 0.5
+TIMEOUT = 5
+
+
+class MotorCommandQueueTest(unittest.TestCase):
+    def setUp(self):
+        door.reset(CLOSED, travel_time=TRAVEL_TIME)
+        self.motor = AdvancedMotor(FORWARD_GPIO, BACKWARD_GPIO, open_timeout=TIMEOUT, close_timeout=TIMEOUT)
+        self.motor.set_close_sensor(CLOSE_SENSOR_GPIO)
+        self.motor.set_open_sensor(OPEN_SENSOR_GPIO)
+        self.commands = MotorCommandQueue(self.motor)
+
+    def tearDown(self):
+        self.commands.stop_queue()
+        self.motor.stop()
+        door.reset(travel_time=DEFAULT_TRAVEL_TIME)
+
+    def test_open_twice_while_opening_is_one_run(self):
+        first = self.commands.open_door().result(TIMEOUT)
+        # the door is still moving when the second command comes
+        second = self.commands.open_door().result(TIMEOUT)
+        self.assertTrue(first)
+        self.assertTrue(second)
+        self.assertIs(second.run, first.run)
+        self.assertEqual(self.motor.count_action, 1)
+        self.assertTrue(door.wait_still(TIMEOUT))
+        self.assertEqual(door.position, OPENED)
+        self.assertEqual(door.travels, 1)
+
+    def test_close_while_opening_is_executed(self):
+        self.commands.open_door().result(TIMEOUT)
+        result = self.commands.close_door().result(TIMEOUT)
+        self.assertTrue(result)
+        self.assertEqual(self.motor.direction, 'close')
+        self.assertTrue(door.wait_still(TIMEOUT))
+        self.assertEqual(door.position, CLOSED)
+
+    def test_force_open_while_opening_is_one_run(self):
+        first = self.commands.open_door().result(TIMEOUT)
+        second = self.commands.open_door(True).result(TIMEOUT)
+        self.assertIs(second.run, first.run)
+        self.assertTrue(door.wait_still(TIMEOUT))
+        self.assertEqual(door.position, OPENED)
+
+
+if __name__ == '__main__':
+    unittest.main()
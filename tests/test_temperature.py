@@ -0,0 +1,84 @@
+# --------------------------------------------------
+# TemperatureSampler: sampling goes on when the callback
+# of a sample fails, and follows a virtual clock like
+# the alert notifier
+#
+# python -m unittest tests.test_temperature
+# --------------------------------------------------
+import os
+import tempfile
+import threading
+import unittest
+
+from elements.clock import VirtualClock
+from elements.notifier import AlertNotifier
+from elements.temperature import TemperatureSampler
+
+PERIOD = 0.02
+TIMEOUT = 5
+
+
+class TemperatureSamplerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'temp')
+        with open(self.path, 'w') as file:
+            file.write('45000\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_failed_callback_does_not_stop_sampling(self):
+        calls = []
+        sampled = threading.Event()
+
+        def callback(temperature):
+            calls.append(temperature)
+            if len(calls) >= 3:
+                sampled.set()
+            # like a spool which can't write its file
+            raise OSError('no space left on device')
+        sampler = TemperatureSampler(self.path, period=PERIOD, callback=callback)
+        with self.assertLogs('temperature', 'ERROR') as logs:
+            sampler.start()
+            self.assertTrue(sampled.wait(TIMEOUT))
+            sampler.stop()
+        self.assertEqual(calls[:3], [45.0] * 3)
+        self.assertGreaterEqual(sampler.errors, 3)
+        # logged once while it fails
+        self.assertEqual(len(logs.records), 1)
+
+    def test_virtual_clock(self):
+        clock = VirtualClock(0)
+        sampler = TemperatureSampler(self.path, period=1, clock=clock)
+        sampler.start()
+        self.assertEqual(sampler.count, 1)
+        clock.advance(299.5)
+        self.assertEqual(sampler.count, 300)
+        sampler.stop()
+
+
+class _Email:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, message, subject=None):
+        self.messages.append(subject)
+
+
+class AlertNotifierTest(unittest.TestCase):
+    def test_digest_on_virtual_clock(self):
+        clock = VirtualClock(0)
+        email = _Email()
+        notifier = AlertNotifier(email, window=3600, clock=clock)
+        self.assertTrue(notifier.notify('52°C', 'WARNING temperature'))
+        clock.advance(60)
+        self.assertFalse(notifier.notify('53°C', 'WARNING temperature'))
+        clock.advance(3500)
+        self.assertEqual(email.messages, ['WARNING temperature'])
+        clock.advance(100)
+        self.assertEqual(email.messages, ['WARNING temperature', 'digest of 1 alerts'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# --------------------------------------------------
+# TracePath: a reaction is followed by the thread which
+# began it, or the one it is attached to, like the
+# callback of a button gesture
+#
+# python -m unittest tests.test_tracing
+# --------------------------------------------------
+import os
+import threading
+import unittest
+
+# the headless simulator, when gpiozero is not installed. Set before elements are imported
+os.environ.setdefault('DOOR_SIMULATOR', 'headless')
+
+from elements.advanced_elements import MasterButton
+from elements.clock import VirtualClock
+from elements.tracing import TracePath, button_trace
+
+BUTTON_GPIO = 22
+
+
+def in_thread(function, *args):
+    thread = threading.Thread(target=function, args=args)
+    thread.start()
+    thread.join()
+
+
+class TracePathTest(unittest.TestCase):
+    def setUp(self):
+        self.path = TracePath('test_path', ('begin', 'step', 'end'), size=10)
+
+    def test_other_thread_does_not_end_the_reaction(self):
+        self.path.begin()
+        # like a close command of the http server while the button is followed
+        in_thread(self.path.end)
+        self.assertEqual(self.path.count, 0)
+        self.assertTrue(self.path.active)
+        self.path.end()
+        self.assertEqual(self.path.count, 1)
+        self.assertFalse(self.path.active)
+
+    def test_detached_reaction_is_ended_where_attached(self):
+        self.path.begin()
+        reaction = self.path.detach()
+        self.assertFalse(self.path.active)
+
+        def run():
+            self.path.attach(reaction)
+            self.path.mark(1)
+            self.path.end()
+        in_thread(run)
+        self.assertEqual(self.path.count, 1)
+        self.assertEqual(self.path.report()['count'], 1)
+
+    def test_cancelled_reaction_is_not_kept(self):
+        self.path.begin()
+        self.path.cancel()
+        self.path.end()
+        self.assertEqual(self.path.count, 0)
+
+
+class MasterButtonTraceTest(unittest.TestCase):
+    def test_multiple_press_is_traced(self):
+        clock = VirtualClock(0)
+        traced = []
+
+        def multiple():
+            traced.append(button_trace.active)
+            # like the motor start of its command
+            button_trace.end()
+        button = MasterButton(BUTTON_GPIO, None, None, multiple_callback=multiple, clock=clock)
+        count = button_trace.count
+        for _ in range(3):
+            button.button.press()
+            clock.advance(0.1)
+            button.button.release()
+            self.assertFalse(button_trace.active)
+        clock.advance(0.01)
+        self.assertEqual(traced, [True])
+        self.assertEqual(button_trace.count, count + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()